@@ -74,12 +74,38 @@ function initiatePostData() {
   }
 }
 
+// Extension token minted from the LinkedRite profile page
+function getExtensionToken() {
+  return new Promise((resolve) => {
+    chrome.storage.local.get("linkedriteToken", (items) => {
+      let token = items.linkedriteToken;
+      if (!token) {
+        token = prompt("Paste your LinkedRite extension token (Profile > Chrome Extension Tokens)");
+        if (token) {
+          chrome.storage.local.set({ linkedriteToken: token.trim() });
+        }
+      }
+      resolve(token ? token.trim() : "");
+    });
+  });
+}
+
+// Seconds the server may spend on a rewrite before answering 504
+const REWRITE_DEADLINE_SECONDS = 30;
+
 // Function to send POST request to the server for rewriting the content
-function fetchPostData(textContent, emojiToggle, htagToggle) {
+async function fetchPostData(textContent, emojiToggle, htagToggle) {
+  const token = await getExtensionToken();
+  // Give up locally a little after the server-side deadline
+  const controller = new AbortController();
+  setTimeout(() => controller.abort(), (REWRITE_DEADLINE_SECONDS + 5) * 1000);
   fetch("http://127.0.0.1/rewrite/", {
     method: "POST",
+    signal: controller.signal,
     headers: {
       "Content-Type": "application/json",
+      Authorization: `Bearer ${token}`,
+      "X-Request-Deadline": String(REWRITE_DEADLINE_SECONDS),
     },
     body: JSON.stringify({
       postInput: textContent,
@@ -111,6 +137,16 @@ function fetchPostData(textContent, emojiToggle, htagToggle) {
 
 // Function to handle response from the server
 function handleResponse(response) {
+  if (response.status === 401) {
+    // Token missing, expired or revoked, ask for a new one next time
+    chrome.storage.local.remove("linkedriteToken");
+    showToast("Please add a valid LinkedRite extension token");
+    return { rewriteAI: "" };
+  }
+  if (response.status === 504) {
+    showToast("The rewrite took too long, please try again");
+    return { rewriteAI: "" };
+  }
   if (!response.ok) {
     showToast("Bad Request");
     return { rewriteAI: "" };
@@ -122,7 +158,7 @@ function handleResponse(response) {
 function handleError(error) {
   // Update button style and show error toast
   document.getElementById("postButton").style.backgroundColor = "#ff4d4d";
-  showToast("An Error Occurred");
+  showToast(error.name === "AbortError" ? "The rewrite took too long, please try again" : "An Error Occurred");
 
   // Re-enable the button and hide loading animation
   document.getElementById("postButton").disabled = false;
@@ -200,20 +236,40 @@ function disconnectObservers() {
   }
 }
 
-// Function to check for the latest release from GitHub
+// Release metadata is served by our server from a cached copy. The browser's HTTP
+// cache honours its max-age and revalidates with the ETag, so most page loads
+// make no request at all and the rest get a 304.
+const RELEASE_URL = "http://127.0.0.1/api/extension/release/";
+
+// Compare dotted version strings such as 2.0.1.1 numerically
+function isOlderVersion(version, other) {
+  const a = version.split(".").map(Number);
+  const b = other.split(".").map(Number);
+  for (let i = 0; i < Math.max(a.length, b.length); i++) {
+    if ((a[i] || 0) !== (b[i] || 0)) {
+      return (a[i] || 0) < (b[i] || 0);
+    }
+  }
+  return false;
+}
+
+// Function to check for the latest release
 function checkForUpdates() {
-  fetch("https://api.github.com/repos/zpratikpathak/LinkedinAI/releases/latest")
-    .then((response) => response.json())
+  fetch(RELEASE_URL)
+    .then((response) => (response.ok ? response.json() : null))
     .then((data) => {
-      const latestVersion = data.tag_name.replace("release-", "");
-      const currentVersion = "<current version>"; // replace with the current version of your extension
-      if (latestVersion !== currentVersion) {
-        const downloadUrl = data.assets[0].browser_download_url;
-        showToast(`New version available. Download here: ${downloadUrl}`);
+      if (!data || !data.version) {
+        return;
+      }
+      const currentVersion = chrome.runtime.getManifest().version;
+      if (data.minimumVersion && isOlderVersion(currentVersion, data.minimumVersion)) {
+        showToast(`This version is no longer supported. Please update: ${data.downloadUrl}`);
+      } else if (isOlderVersion(currentVersion, data.version)) {
+        showToast(`New version available. Download here: ${data.downloadUrl}`);
       }
     })
     .catch((error) => console.error("Error:", error));
 }
 
 // Call the function to check for updates
-// checkForUpdates();
+checkForUpdates();
@@ -13,7 +13,9 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 from dotenv import load_dotenv
 import os
+import json
 import dj_database_url
+from corsheaders.defaults import default_headers
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -52,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "rewrite.middleware.HealthCheckMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "accounts.middleware.FixDuplicateOriginMiddleware",
     "django.middleware.security.SecurityMiddleware",
@@ -60,6 +63,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "rewrite.middleware.RequestProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "accounts.middleware.AdminAccountSyncMiddleware",
@@ -80,6 +84,7 @@ TEMPLATES = [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
+                "rewrite.context_processors.assets",
             ],
         },
     },
@@ -94,6 +99,22 @@ WSGI_APPLICATION = "Linkedrite.wsgi.application"
 # Check if DATABASE_URL is provided
 DATABASE_URL = os.getenv('DATABASE_URL')
 
+# Opt-in SQLite profile for single-node deployments with several gunicorn workers:
+# WAL lets readers run alongside the writer, and writers queue on the busy timeout
+SQLITE_PRODUCTION = os.getenv('SQLITE_PRODUCTION', 'False') == 'True'
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 5))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))
+# Page cache in KiB per connection
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', 64 * 1024))
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}',
+    f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}',
+    f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE}',
+    'PRAGMA temp_store=MEMORY',
+]
+
 if DATABASE_URL:
     # Use dj-database-url to parse DATABASE_URL
     DATABASES = {
@@ -129,9 +150,20 @@ else:
             }
         }
 
+if SQLITE_PRODUCTION and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('OPTIONS', {}).update({
+        # Run on every new connection
+        'init_command': '; '.join(SQLITE_PRAGMAS),
+        # Take the write lock when a transaction starts, so concurrent writers
+        # wait on busy_timeout instead of failing to upgrade a read lock
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': SQLITE_BUSY_TIMEOUT,
+    })
+
 
 # Redis and Cache Configuration
 REDIS_URL = os.getenv('REDIS_URL')
+REDIS_CONNECTION_STRING = None
 if REDIS_URL:
     # Use REDIS_URL if provided
     CACHES = {
@@ -183,6 +215,29 @@ else:
             }
         }
 
+# Two-tier cache (rewrite/tiered_cache.py): keys under these prefixes are also kept
+# in a short-lived per-process LRU, invalidated through Redis pub/sub on every write
+CACHE_LOCAL_TIER = os.getenv('CACHE_LOCAL_TIER', 'False') == 'True'
+if CACHE_LOCAL_TIER and CACHES['default']['BACKEND'] == 'django.core.cache.backends.redis.RedisCache':
+    CACHES['default']['BACKEND'] = 'rewrite.tiered_cache.TieredRedisCache'
+    CACHES['default']['OPTIONS'] = {
+        'LOCAL_MAX_ENTRIES': int(os.getenv('CACHE_LOCAL_MAX_ENTRIES', 1000)),
+        'LOCAL_TTL': float(os.getenv('CACHE_LOCAL_TTL', 5)),
+        'LOCAL_KEY_PREFIXES': os.getenv(
+            'CACHE_LOCAL_KEY_PREFIXES', 'subscriptions:plan:,page:,circuit:,extension:'
+        ).split(','),
+    }
+
+# LocMemCache is per process, so a value one worker or management command writes
+# (plan overrides, quota counts, release metadata) never reaches the other workers.
+# Without a shared cache those values are only kept for UNSHARED_CACHE_TTL seconds.
+CACHE_IS_SHARED = CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+UNSHARED_CACHE_TTL = int(os.getenv('UNSHARED_CACHE_TTL', 60))
+
+
+# Throttle counters are shared through Redis when available, the database otherwise
+THROTTLE_REDIS_URL = os.getenv('THROTTLE_REDIS_URL', REDIS_URL or REDIS_CONNECTION_STRING)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -221,6 +276,32 @@ USE_TZ = True
 STATIC_URL = "static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# Output of `npm run build`: purged, minified Tailwind CSS and vendored JS
+STATIC_BUILD_DIR = BASE_DIR / "static" / "build"
+STATICFILES_DIRS = [STATIC_BUILD_DIR] if STATIC_BUILD_DIR.is_dir() else []
+
+# Serve the compiled assets instead of the Tailwind/Alpine/AOS CDNs once they are built
+COMPILED_ASSETS = os.getenv(
+    "COMPILED_ASSETS", str((STATIC_BUILD_DIR / "css" / "app.css").is_file())
+).lower() in ("true", "1", "yes")
+
+# Content-hashed file names plus precompressed gzip/brotli variants, served by
+# WhiteNoise with far-future immutable caching. Requires `collectstatic`.
+STATIC_MANIFEST = os.getenv("STATIC_MANIFEST", "False").lower() in ("true", "1", "yes")
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "whitenoise.storage.CompressedManifestStaticFilesStorage"
+            if STATIC_MANIFEST
+            else "django.contrib.staticfiles.storage.StaticFilesStorage"
+        ),
+    },
+}
+WHITENOISE_KEEP_ONLY_HASHED_FILES = STATIC_MANIFEST
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -231,19 +312,144 @@ CORS_ALLOWED_ORIGINS = [
     "chrome-extension://jfhednjcngkglplnempndpjodlimlihl",
     "https://www.linkedin.com",
 ]
+# The extension sends its rewrite deadline in a custom header
+CORS_ALLOW_HEADERS = (*default_headers, "x-request-deadline")
 
 REST_FRAMEWORK = {
     "DEFAULT_THROTTLE_CLASSES": [
-        "rest_framework.throttling.AnonRateThrottle",
-        "rest_framework.throttling.UserRateThrottle",
+        "rewrite.throttling.SlidingWindowAnonRateThrottle",
+        "rewrite.throttling.SlidingWindowUserRateThrottle",
     ],
     "DEFAULT_THROTTLE_RATES": {"anon": "10/day", "user": "50/day"},
     "DEFAULT_RENDERER_CLASSES": ("rest_framework.renderers.JSONRenderer",),
     "DEFAULT_AUTHENTICATION_CLASSES": [
+        "accounts.authentication.ExtensionTokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ],
 }
 
+# Signed API tokens for the Chrome extension
+EXTENSION_TOKEN_TTL_DAYS = int(os.getenv("EXTENSION_TOKEN_TTL_DAYS", 30))
+EXTENSION_TOKEN_DENYLIST_TTL = int(os.getenv("EXTENSION_TOKEN_DENYLIST_TTL", 60))
+
+# Premium subscriptions past their end_date are downgraded by
+# `manage.py expire_subscriptions`, this many rows per batch
+SUBSCRIPTION_EXPIRY_BATCH_SIZE = int(os.getenv("SUBSCRIPTION_EXPIRY_BATCH_SIZE", 500))
+SUBSCRIPTION_EXPIRY_INTERVAL = int(os.getenv("SUBSCRIPTION_EXPIRY_INTERVAL", 300))
+
+# Provider circuit breaker: stop calling the provider for a while after repeated failures
+PROVIDER_CIRCUIT_FAILURES = int(os.getenv("PROVIDER_CIRCUIT_FAILURES", 5))
+PROVIDER_CIRCUIT_WINDOW = int(os.getenv("PROVIDER_CIRCUIT_WINDOW", 60))
+PROVIDER_CIRCUIT_RESET_TIMEOUT = int(os.getenv("PROVIDER_CIRCUIT_RESET_TIMEOUT", 30))
+
+# Rewrite deadline in seconds, used as the provider request timeout. Clients may ask
+# for less with an X-Request-Deadline header, up to REWRITE_MAX_DEADLINE_SECONDS.
+# Keep both well below GUNICORN_TIMEOUT
+REWRITE_DEADLINE_SECONDS = float(os.getenv("REWRITE_DEADLINE_SECONDS", 30))
+REWRITE_MAX_DEADLINE_SECONDS = float(os.getenv("REWRITE_MAX_DEADLINE_SECONDS", 60))
+
+# Plan-aware admission control: provider calls allowed at once per worker process,
+# then bounded per-plan queues drained by weight. Free requests are shed first
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "True") == "True"
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", 4))
+ADMISSION_WEIGHTS = {
+    "premium": int(os.getenv("ADMISSION_PREMIUM_WEIGHT", 3)),
+    "free": int(os.getenv("ADMISSION_FREE_WEIGHT", 1)),
+}
+ADMISSION_QUEUE_SIZE = {
+    "premium": int(os.getenv("ADMISSION_PREMIUM_QUEUE_SIZE", 16)),
+    "free": int(os.getenv("ADMISSION_FREE_QUEUE_SIZE", 4)),
+}
+ADMISSION_MAX_WAIT = {
+    "premium": float(os.getenv("ADMISSION_PREMIUM_MAX_WAIT", 30)),
+    "free": float(os.getenv("ADMISSION_FREE_MAX_WAIT", 5)),
+}
+
+# Seconds /readyz reuses its last database/cache check result
+HEALTH_CHECK_CACHE_SECONDS = float(os.getenv("HEALTH_CHECK_CACHE_SECONDS", 5))
+
+# Provider pricing for the cost ledger, USD per million tokens as
+# [input, cached input, output], e.g. PROVIDER_PRICING={"gpt-4o": [2.5, 1.25, 10]}
+PROVIDER_PRICING = json.loads(os.getenv("PROVIDER_PRICING", "{}"))
+PROVIDER_DEFAULT_PRICING = [
+    float(price) for price in os.getenv("PROVIDER_DEFAULT_PRICING", "0.50,0.05,3.00").split(",")
+]
+
+# Incremental rewriting: long posts are rewritten paragraph by paragraph with a
+# per-paragraph result cache; shorter posts always use the whole-post prompt
+INCREMENTAL_REWRITE = os.getenv("INCREMENTAL_REWRITE", "False") == "True"
+INCREMENTAL_MIN_PARAGRAPHS = int(os.getenv("INCREMENTAL_MIN_PARAGRAPHS", 3))
+INCREMENTAL_MIN_CHARS = int(os.getenv("INCREMENTAL_MIN_CHARS", 600))
+INCREMENTAL_MAX_WORKERS = int(os.getenv("INCREMENTAL_MAX_WORKERS", 4))
+INCREMENTAL_PARAGRAPH_MAX_TOKENS = int(os.getenv("INCREMENTAL_PARAGRAPH_MAX_TOKENS", 400))
+PARAGRAPH_CACHE_TTL = int(os.getenv("PARAGRAPH_CACHE_TTL", 60 * 60 * 24))
+
+# Input guardrails and output budgets from the local token estimate (rewrite/tokens.py)
+REWRITE_MAX_INPUT_TOKENS = int(os.getenv("REWRITE_MAX_INPUT_TOKENS", 1500))
+REWRITE_TOKEN_ESTIMATE_MARGIN = float(os.getenv("REWRITE_TOKEN_ESTIMATE_MARGIN", 1.1))
+REWRITE_OUTPUT_TOKEN_RATIO = float(os.getenv("REWRITE_OUTPUT_TOKEN_RATIO", 1.3))
+REWRITE_OUTPUT_TOKEN_OVERHEAD = int(os.getenv("REWRITE_OUTPUT_TOKEN_OVERHEAD", 80))
+REWRITE_MIN_OUTPUT_TOKENS = int(os.getenv("REWRITE_MIN_OUTPUT_TOKENS", 300))
+REWRITE_MAX_OUTPUT_TOKENS = int(os.getenv("REWRITE_MAX_OUTPUT_TOKENS", 2000))
+# Thinking Gemini models spend thoughts out of max_output_tokens, so Google requests
+# reserve GOOGLE_THINKING_TOKENS on top of the output budget and cap thinking at
+# GOOGLE_THINKING_LEVEL (minimal, low, medium, high; empty for non-thinking models)
+GOOGLE_THINKING_LEVEL = os.getenv("GOOGLE_THINKING_LEVEL", "low")
+GOOGLE_THINKING_TOKENS = int(os.getenv("GOOGLE_THINKING_TOKENS", 1024))
+
+# Local hashtags and emojis (rewrite/decorations.py): the provider is asked for
+# plain text and decorations are matched from the bundled topic index instead
+LOCAL_DECORATIONS = os.getenv("LOCAL_DECORATIONS", "False") == "True"
+LOCAL_DECORATION_MAX_HASHTAGS = int(os.getenv("LOCAL_DECORATION_MAX_HASHTAGS", 3))
+LOCAL_DECORATION_MAX_EMOJIS = int(os.getenv("LOCAL_DECORATION_MAX_EMOJIS", 3))
+LOCAL_DECORATION_MIN_SCORE = float(os.getenv("LOCAL_DECORATION_MIN_SCORE", 0.08))
+
+# Multi-candidate rewrites: alternatives per request from one provider call, and
+# whether a set costs one quota unit ("request") or one per alternative ("candidate")
+REWRITE_MAX_CANDIDATES = int(os.getenv("REWRITE_MAX_CANDIDATES", 3))
+REWRITE_CANDIDATE_QUOTA = os.getenv("REWRITE_CANDIDATE_QUOTA", "request")
+CANDIDATE_CACHE_TTL = int(os.getenv("CANDIDATE_CACHE_TTL", 60 * 30))
+
+# Rows written on the request path (history, ledger) are queued and bulk inserted
+# by a background thread in each worker. Queued rows are written when a worker
+# exits normally, but a worker killed by SIGKILL (gunicorn's timeout) loses up to
+# BUFFERED_WRITES_FLUSH_INTERVAL seconds of them. Set BUFFERED_WRITES_ASYNC=False
+# and BUFFERED_WRITES_BATCH_SIZE=1 to write every row inline in the request instead
+BUFFERED_WRITES_ASYNC = os.getenv("BUFFERED_WRITES_ASYNC", "True") == "True"
+BUFFERED_WRITES_BATCH_SIZE = int(os.getenv("BUFFERED_WRITES_BATCH_SIZE", 100))
+BUFFERED_WRITES_FLUSH_INTERVAL = float(os.getenv("BUFFERED_WRITES_FLUSH_INTERVAL", 2))
+
+# Rewrite history
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 20))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", 100))
+
+# Full-page cache for anonymous landing and pricing pages. The version defaults to a
+# digest of the static manifest and templates, so every deploy starts a fresh cache.
+PAGE_CACHE_ENABLED = os.getenv("PAGE_CACHE_ENABLED", "True") == "True"
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", 60 * 60))
+PAGE_CACHE_VERSION = os.getenv("PAGE_CACHE_VERSION", "")
+
+# Extension release metadata (rewrite/releases.py): server-side cache lifetime,
+# browser max-age, and the GitHub repository `refresh_extension_release` syncs from
+EXTENSION_RELEASE_CACHE_TTL = int(os.getenv("EXTENSION_RELEASE_CACHE_TTL", 60 * 60 * 24))
+EXTENSION_RELEASE_MAX_AGE = int(os.getenv("EXTENSION_RELEASE_MAX_AGE", 60 * 60))
+EXTENSION_RELEASE_REPOSITORY = os.getenv("EXTENSION_RELEASE_REPOSITORY", "zpratikpathak/LinkedinAI")
+EXTENSION_RELEASE_TAG_PREFIX = os.getenv("EXTENSION_RELEASE_TAG_PREFIX", "release-")
+EXTENSION_RELEASE_REFRESH_INTERVAL = int(os.getenv("EXTENSION_RELEASE_REFRESH_INTERVAL", 60 * 60))
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "")
+
+# On-demand profiling (rewrite/profiling.py): staff send the header or query flag to
+# profile one request; a sample rate above 0 also profiles that fraction of traffic
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+PROFILE_QUERY_PARAM = os.getenv("PROFILE_QUERY_PARAM", "_profile")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_MAX_ROWS = int(os.getenv("PROFILE_MAX_ROWS", 500))
+PROFILE_MAX_QUERIES = int(os.getenv("PROFILE_MAX_QUERIES", 500))
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", 60))
+
+# Rows fetched per database round trip by streaming exports
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))
+
 # Crispy Forms Settings
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
@@ -257,6 +463,22 @@ EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "LinkedRite <noreply@linkedrite.com>")
 
+# Email outbox (delivered by `manage.py send_outbox`)
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_BACKOFF_SECONDS = int(os.getenv("OUTBOX_BACKOFF_SECONDS", 30))
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", 300))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 5))
+
+# Stripe webhooks: events are stored on receipt and applied by
+# `manage.py process_stripe_events`
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET", "")
+STRIPE_WEBHOOK_TOLERANCE = int(os.getenv("STRIPE_WEBHOOK_TOLERANCE", 300))
+STRIPE_EVENT_BATCH_SIZE = int(os.getenv("STRIPE_EVENT_BATCH_SIZE", 200))
+STRIPE_EVENT_MAX_ATTEMPTS = int(os.getenv("STRIPE_EVENT_MAX_ATTEMPTS", 5))
+STRIPE_EVENT_BACKOFF_SECONDS = int(os.getenv("STRIPE_EVENT_BACKOFF_SECONDS", 30))
+STRIPE_EVENT_POLL_INTERVAL = float(os.getenv("STRIPE_EVENT_POLL_INTERVAL", 2))
+
 # Authentication Settings
 LOGIN_URL = "/accounts/login/"
 LOGIN_REDIRECT_URL = "/dashboard/"
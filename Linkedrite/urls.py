@@ -25,6 +25,7 @@ from django.conf.urls.static import static
 urlpatterns = [
     path("admin/", admin.site.urls), 
     path("accounts/", include("accounts.urls")),
+    path("subscriptions/", include("subscriptions.urls")),
     path("", include("rewrite.urls")),
 ]
 
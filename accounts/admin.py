@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, EmailVerificationToken, PasswordResetToken
+from .models import CustomUser, EmailVerificationToken, PasswordResetToken, OutboxEmail, ExtensionToken
 
 
 @admin.register(CustomUser)
@@ -34,4 +34,31 @@ class PasswordResetTokenAdmin(admin.ModelAdmin):
     list_filter = ('is_used', 'created_at', 'expires_at')
     search_fields = ('user__email', 'token')
     readonly_fields = ('token', 'created_at')
-    ordering = ('-created_at',)
\ No newline at end of file
+    ordering = ('-created_at',)
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status', 'template_name', 'created_at')
+    search_fields = ('to_email', 'subject', 'dedupe_key')
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    ordering = ('-created_at',)
+
+
+@admin.register(ExtensionToken)
+class ExtensionTokenAdmin(admin.ModelAdmin):
+    list_display = ('user', 'name', 'created_at', 'expires_at', 'revoked_at')
+    list_filter = ('revoked_at', 'created_at')
+    search_fields = ('user__email', 'name', 'jti')
+    readonly_fields = ('jti', 'created_at')
+    ordering = ('-created_at',)
+    
+    actions = ['revoke_tokens']
+    
+    def revoke_tokens(self, request, queryset):
+        tokens = list(queryset.filter(revoked_at__isnull=True))
+        for token in tokens:
+            token.revoke()
+        self.message_user(request, f'{len(tokens)} token(s) revoked.')
+    revoke_tokens.short_description = 'Revoke selected tokens'
@@ -0,0 +1,128 @@
+"""
+Stateless signed tokens for the Chrome extension.
+
+A token is an HMAC-signed payload carrying the user id, plan and expiry, so
+authenticating an extension call needs no session row, no CSRF check and no
+user lookup. Revocation is checked against a small cached denylist and a cached
+per-user cutoff: tokens issued before the user's last password change or
+deactivation, or belonging to a deleted user, are rejected. A plan published to
+the cache since the token was minted overrides the plan claim; without a shared
+cache the plan is read from the subscription instead, at most every
+UNSHARED_CACHE_TTL seconds per process.
+"""
+import time
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+from subscriptions.models import Subscription, get_cached_plan, shared_state_timeout
+from .models import CustomUser, ExtensionToken
+
+TOKEN_SALT = 'accounts.extension-token'
+DENYLIST_CACHE_KEY = 'accounts:extension-token-denylist'
+VALID_AFTER_CACHE_KEY = 'accounts:extension-tokens-valid-after:{}'
+
+
+def mint_extension_token(user, name='Chrome extension'):
+    """Create an ExtensionToken row and return (token_row, signed_token)"""
+    subscription = getattr(user, 'subscription', None)
+    token = ExtensionToken.objects.create(user=user, name=name)
+    payload = {
+        'uid': user.pk,
+        'email': user.email,
+        'tz': user.timezone,
+        'plan': subscription.current_plan() if subscription else None,
+        'iat': token.created_at.timestamp(),
+        'exp': int(token.expires_at.timestamp()),
+        'jti': token.jti.hex,
+    }
+    return token, signing.dumps(payload, salt=TOKEN_SALT, compress=True)
+
+
+def get_revoked_token_ids():
+    """Ids of revoked, unexpired tokens, refreshed from the database on cache miss"""
+    revoked = cache.get(DENYLIST_CACHE_KEY)
+    if revoked is None:
+        revoked = {
+            jti.hex for jti in ExtensionToken.objects.filter(
+                revoked_at__isnull=False,
+                expires_at__gt=timezone.now()
+            ).values_list('jti', flat=True)
+        }
+        cache.set(DENYLIST_CACHE_KEY, revoked, settings.EXTENSION_TOKEN_DENYLIST_TTL)
+    return revoked
+
+
+def invalidate_revoked_token_cache():
+    cache.delete(DENYLIST_CACHE_KEY)
+
+
+def get_tokens_valid_after(user_id):
+    """Unix time before which the user's tokens are rejected; infinite for inactive or deleted users"""
+    valid_after = cache.get(VALID_AFTER_CACHE_KEY.format(user_id))
+    if valid_after is None:
+        user = CustomUser.objects.filter(pk=user_id).values('is_active', 'extension_tokens_valid_after').first()
+        if user is None or not user['is_active']:
+            valid_after = float('inf')
+        elif user['extension_tokens_valid_after']:
+            valid_after = user['extension_tokens_valid_after'].timestamp()
+        else:
+            valid_after = 0
+        # Invalidations only reach this process's copy when the cache is per process
+        cache.set(
+            VALID_AFTER_CACHE_KEY.format(user_id),
+            valid_after,
+            shared_state_timeout(settings.EXTENSION_TOKEN_TTL_DAYS * 24 * 60 * 60),
+        )
+    return valid_after
+
+
+def invalidate_user_token_state(user_id):
+    """Drop the cached cutoff so the next token check reads the user row again"""
+    cache.delete(VALID_AFTER_CACHE_KEY.format(user_id))
+
+
+class ExtensionTokenAuthentication(BaseAuthentication):
+    """Authenticates `Authorization: Bearer <token>` headers, reading the database only on cache misses"""
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise AuthenticationFailed('Invalid token header.')
+
+        try:
+            payload = signing.loads(auth[1].decode(), salt=TOKEN_SALT)
+        except (signing.BadSignature, UnicodeError):
+            raise AuthenticationFailed('Invalid extension token.')
+
+        if payload['exp'] < time.time():
+            raise AuthenticationFailed('Extension token has expired.')
+        if payload['jti'] in get_revoked_token_ids():
+            raise AuthenticationFailed('Extension token has been revoked.')
+        # Tokens minted before 'iat' was added are dated from their expiry
+        issued_at = payload.get('iat', payload['exp'] - settings.EXTENSION_TOKEN_TTL_DAYS * 24 * 60 * 60)
+        if issued_at < get_tokens_valid_after(payload['uid']):
+            raise AuthenticationFailed('Extension token is no longer valid.')
+
+        # Build the user from the token claims; tokens are only minted for verified users
+        user = CustomUser(
+            pk=payload['uid'],
+            email=payload['email'],
+            username=payload['email'],
+            timezone=payload['tz'],
+            email_verified=True,
+            is_active=True,
+        )
+        # Upgrades, downgrades and expiry sweeps publish the current plan
+        plan = get_cached_plan(payload['uid'], payload['plan'])
+        if plan:
+            user.subscription = Subscription(plan=plan, is_active=True)
+        return user, payload
+
+    def authenticate_header(self, request):
+        return self.keyword
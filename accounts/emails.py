@@ -0,0 +1,57 @@
+"""
+Helpers that queue transactional emails in the outbox instead of sending them inline.
+"""
+from .models import OutboxEmail
+
+VERIFICATION_SUBJECT = 'Verify your LinkedRite account'
+VERIFICATION_TEMPLATE = 'accounts/email/verify_email.html'
+
+
+def _link_context(request, token):
+    return {
+        'token': str(token.token),
+        'domain': request.get_host(),
+        'protocol': 'https' if request.is_secure() else 'http',
+    }
+
+
+def verification_dedupe_key(user):
+    return f'verify-email:{user.pk}'
+
+
+def password_reset_dedupe_key(user):
+    return f'password-reset:{user.pk}'
+
+
+def queue_verification_email(request, user, token):
+    """Queue the email verification message for delivery by `send_outbox`"""
+    return OutboxEmail.enqueue(
+        user=user,
+        subject=VERIFICATION_SUBJECT,
+        template_name=VERIFICATION_TEMPLATE,
+        context=_link_context(request, token),
+        dedupe_key=verification_dedupe_key(user),
+    )
+
+
+def verification_email(user, token, domain, protocol='https'):
+    """Unsaved verification message, for bulk inserts outside a request"""
+    return OutboxEmail(
+        user=user,
+        to_email=user.email,
+        subject=VERIFICATION_SUBJECT,
+        template_name=VERIFICATION_TEMPLATE,
+        context={'token': str(token.token), 'domain': domain, 'protocol': protocol},
+        dedupe_key=verification_dedupe_key(user),
+    )
+
+
+def queue_password_reset_email(request, user, token):
+    """Queue the password reset message for delivery by `send_outbox`"""
+    return OutboxEmail.enqueue(
+        user=user,
+        subject='Reset your LinkedRite password',
+        template_name='accounts/email/password_reset.html',
+        context=_link_context(request, token),
+        dedupe_key=password_reset_dedupe_key(user),
+    )
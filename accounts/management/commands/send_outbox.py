@@ -0,0 +1,119 @@
+"""
+Django management command that delivers queued outbox emails.
+
+Messages are claimed in batches, rendered, and sent over a single SMTP connection
+per batch. Failed deliveries are retried with exponential backoff.
+"""
+
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import OutboxEmail, OutboxEmailStatus
+
+
+class Command(BaseCommand):
+    help = 'Sends queued outbox emails, reusing one SMTP connection per batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.OUTBOX_BATCH_SIZE,
+            help='Maximum number of messages sent per SMTP connection',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the outbox instead of exiting when it is drained',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.OUTBOX_POLL_INTERVAL,
+            help='Seconds to sleep between polls when running with --loop',
+        )
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+
+        while True:
+            batch = self.claim_batch(options['batch_size'])
+            if batch:
+                sent, failed = self.send_batch(batch)
+                total_sent += sent
+                total_failed += failed
+                continue
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Outbox drained: {total_sent} sent, {total_failed} failed')
+        )
+
+    def claim_batch(self, batch_size):
+        """Lease a batch of due messages so concurrent workers don't send them twice"""
+        now = timezone.now()
+        with transaction.atomic():
+            batch = list(
+                OutboxEmail.objects.select_for_update(skip_locked=True)
+                .select_related('user')
+                .filter(status=OutboxEmailStatus.PENDING, next_attempt_at__lte=now)
+                .order_by('next_attempt_at', 'id')[:batch_size]
+            )
+            if batch:
+                OutboxEmail.objects.filter(pk__in=[m.pk for m in batch]).update(
+                    next_attempt_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+                )
+        return batch
+
+    def send_batch(self, batch):
+        sent = failed = 0
+        connection = get_connection()
+
+        try:
+            connection.open()
+        except Exception as e:
+            # Could not reach the mail server, retry the whole batch later
+            for message in batch:
+                self.fail(message, e)
+            return 0, len(batch)
+
+        try:
+            for message in batch:
+                try:
+                    plain_message, html_message = message.render()
+                    email = EmailMultiAlternatives(
+                        message.subject,
+                        plain_message,
+                        settings.DEFAULT_FROM_EMAIL,
+                        [message.to_email],
+                        connection=connection,
+                    )
+                    email.attach_alternative(html_message, 'text/html')
+                    email.send(fail_silently=False)
+                except Exception as e:
+                    self.fail(message, e)
+                    failed += 1
+                else:
+                    message.mark_sent()
+                    sent += 1
+        finally:
+            connection.close()
+
+        return sent, failed
+
+    def fail(self, message, error):
+        message.mark_failed(
+            error,
+            max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+            backoff_seconds=settings.OUTBOX_BACKOFF_SECONDS,
+        )
+        self.stdout.write(
+            self.style.WARNING(f'Failed to send {message.subject!r} to {message.to_email}: {error}')
+        )
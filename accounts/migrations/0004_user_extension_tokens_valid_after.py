@@ -0,0 +1,18 @@
+# Generated by Django 6.1.2 on 2026-10-19 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_extensiontoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='extension_tokens_valid_after',
+            field=models.DateTimeField(blank=True, help_text='Extension tokens issued before this time are rejected (set on password change or deactivation)', null=True),
+        ),
+    ]
@@ -1,6 +1,9 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import AbstractUser
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.html import strip_tags
 import pytz
 import uuid
 from datetime import datetime, timedelta
@@ -16,6 +19,11 @@ class CustomUser(AbstractUser):
         help_text="User's timezone for daily limit resets"
     )
     email_verified = models.BooleanField(default=False)
+    extension_tokens_valid_after = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Extension tokens issued before this time are rejected (set on password change or deactivation)"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -79,4 +87,132 @@ class PasswordResetToken(models.Model):
         return not self.is_used and timezone.now() < self.expires_at
     
     def __str__(self):
-        return f"Reset token for {self.user.email}"
\ No newline at end of file
+        return f"Reset token for {self.user.email}"
+
+class OutboxEmailStatus(models.TextChoices):
+    PENDING = 'PENDING', 'Pending'
+    SENT = 'SENT', 'Sent'
+    FAILED = 'FAILED', 'Failed'
+
+
+class OutboxEmail(models.Model):
+    """Queued transactional email, rendered and delivered by `manage.py send_outbox`"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='outbox_emails')
+    to_email = models.EmailField()
+    subject = models.CharField(max_length=255)
+    template_name = models.CharField(max_length=255)
+    context = models.JSONField(default=dict, blank=True)
+    dedupe_key = models.CharField(
+        max_length=255,
+        blank=True,
+        help_text="Only one pending message may exist per key; repeated enqueues are dropped"
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=OutboxEmailStatus.choices,
+        default=OutboxEmailStatus.PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at', 'id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status='PENDING') & ~models.Q(dedupe_key=''),
+                name='outbox_unique_pending_dedupe_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.status})"
+
+    @classmethod
+    def enqueue(cls, user, subject, template_name, context, dedupe_key=''):
+        """Queue an email for delivery, returning (message, created)"""
+        if dedupe_key:
+            existing = cls.objects.filter(
+                dedupe_key=dedupe_key,
+                status=OutboxEmailStatus.PENDING
+            ).first()
+            if existing:
+                return existing, False
+        try:
+            with transaction.atomic():
+                message = cls.objects.create(
+                    user=user,
+                    to_email=user.email,
+                    subject=subject,
+                    template_name=template_name,
+                    context=context,
+                    dedupe_key=dedupe_key,
+                )
+        except IntegrityError:
+            # A concurrent request queued the same message first
+            return cls.objects.get(dedupe_key=dedupe_key, status=OutboxEmailStatus.PENDING), False
+        return message, True
+
+    @classmethod
+    def has_pending(cls, dedupe_key):
+        return cls.objects.filter(dedupe_key=dedupe_key, status=OutboxEmailStatus.PENDING).exists()
+
+    def render(self):
+        """Render (plain_message, html_message) from the stored template and context"""
+        html_message = render_to_string(self.template_name, {'user': self.user, **self.context})
+        return strip_tags(html_message), html_message
+
+    def mark_sent(self):
+        self.status = OutboxEmailStatus.SENT
+        self.sent_at = timezone.now()
+        self.attempts += 1
+        self.last_error = ''
+        self.save(update_fields=['status', 'sent_at', 'attempts', 'last_error'])
+
+    def mark_failed(self, error, max_attempts, backoff_seconds):
+        """Record a failed delivery and schedule a retry with exponential backoff"""
+        self.attempts += 1
+        self.last_error = str(error)
+        if self.attempts >= max_attempts:
+            self.status = OutboxEmailStatus.FAILED
+        else:
+            delay = backoff_seconds * (2 ** (self.attempts - 1))
+            self.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        self.save(update_fields=['status', 'attempts', 'last_error', 'next_attempt_at'])
+
+
+class ExtensionToken(models.Model):
+    """Revocable signed API token minted by the user for the Chrome extension"""
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='extension_tokens')
+    jti = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    name = models.CharField(max_length=100, default='Chrome extension')
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def save(self, *args, **kwargs):
+        if not self.expires_at:
+            self.expires_at = timezone.now() + timedelta(days=settings.EXTENSION_TOKEN_TTL_DAYS)
+        super().save(*args, **kwargs)
+
+    def is_valid(self):
+        return self.revoked_at is None and timezone.now() < self.expires_at
+
+    def revoke(self):
+        from .authentication import invalidate_revoked_token_cache
+
+        self.revoked_at = timezone.now()
+        self.save(update_fields=['revoked_at'])
+        invalidate_revoked_token_cache()
+
+    def __str__(self):
+        return f"{self.name} for {self.user.email}"
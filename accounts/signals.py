@@ -0,0 +1,48 @@
+"""
+Invalidate a user's extension tokens when their credentials or account change.
+
+Extension tokens are checked without loading the user, so a password change,
+deactivation or deletion has to reach the cached per-user state that
+ExtensionTokenAuthentication compares each token's issue time with.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .authentication import invalidate_user_token_state
+from .models import CustomUser
+
+TOKEN_FIELDS = {'password', 'is_active'}
+
+
+@receiver(pre_save, sender=CustomUser)
+def detect_credential_change(sender, instance, update_fields=None, **kwargs):
+    instance._invalidates_extension_tokens = False
+    if instance._state.adding or (update_fields is not None and not TOKEN_FIELDS & set(update_fields)):
+        return
+    previous = sender.objects.filter(pk=instance.pk).values('password', 'is_active').first()
+    if previous and (
+        previous['password'] != instance.password
+        or (previous['is_active'] and not instance.is_active)
+    ):
+        instance._invalidates_extension_tokens = True
+
+
+@receiver(post_save, sender=CustomUser)
+def invalidate_tokens_on_credential_change(sender, instance, created, update_fields=None, **kwargs):
+    if getattr(instance, '_invalidates_extension_tokens', False):
+        instance._invalidates_extension_tokens = False
+        instance.extension_tokens_valid_after = timezone.now()
+        # Saved separately so saves with update_fields=['password'] record it too
+        sender.objects.filter(pk=instance.pk).update(
+            extension_tokens_valid_after=instance.extension_tokens_valid_after
+        )
+    if not created and (update_fields is None or TOKEN_FIELDS & set(update_fields)):
+        # Reactivation is picked up here as well
+        transaction.on_commit(lambda: invalidate_user_token_state(instance.pk))
+
+
+@receiver(post_delete, sender=CustomUser)
+def invalidate_tokens_on_delete(sender, instance, **kwargs):
+    user_id = instance.pk
+    transaction.on_commit(lambda: invalidate_user_token_state(user_id))
@@ -1,3 +1,232 @@
-from django.test import TestCase
+import os
+import tempfile
+from unittest.mock import patch
+from django.conf import settings
+from django.test import TestCase, RequestFactory, override_settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from io import StringIO
+from rest_framework.exceptions import AuthenticationFailed
+from subscriptions.models import Subscription, SubscriptionPlan
+from .authentication import VALID_AFTER_CACHE_KEY, ExtensionTokenAuthentication, mint_extension_token
+from .models import CustomUser, OutboxEmail, OutboxEmailStatus
 
-# Create your tests here.
+
+class FailingEmailBackend(BaseEmailBackend):
+    """Stand-in for an unreachable SMTP server"""
+
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError('SMTP server unavailable')
+
+
+class OutboxTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username='user@example.com', email='user@example.com', password='s3cret-pass!'
+        )
+
+    def test_signup_queues_email_without_sending(self):
+        response = self.client.post(reverse('accounts:signup'), {
+            'email': 'new@example.com',
+            'first_name': 'New',
+            'last_name': 'User',
+            'timezone': 'UTC',
+            'password1': 'a-Strong-pass-123',
+            'password2': 'a-Strong-pass-123',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboxEmail.objects.filter(to_email='new@example.com').count(), 1)
+
+    def test_resend_is_deduplicated_while_pending(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('accounts:resend_verification'))
+        self.client.get(reverse('accounts:resend_verification'))
+        self.assertEqual(OutboxEmail.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(self.user.emailverificationtoken_set.count(), 1)
+
+    def test_send_outbox_delivers_batch(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('accounts:resend_verification'))
+        call_command('send_outbox', stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+        token = self.user.emailverificationtoken_set.get()
+        self.assertIn(str(token.token), mail.outbox[0].body)
+        message = OutboxEmail.objects.get()
+        self.assertEqual(message.status, OutboxEmailStatus.SENT)
+
+        # Once sent, a new resend is queued again
+        self.client.get(reverse('accounts:resend_verification'))
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmailStatus.PENDING).count(), 1)
+
+    @override_settings(
+        EMAIL_BACKEND='accounts.tests.FailingEmailBackend',
+        OUTBOX_MAX_ATTEMPTS=2,
+        OUTBOX_BACKOFF_SECONDS=60,
+    )
+    def test_failed_delivery_backs_off_then_gives_up(self):
+        message, _ = OutboxEmail.enqueue(
+            self.user, 'Hello', 'accounts/email/verify_email.html',
+            {'token': '12345678-1234-1234-1234-123456789abc', 'domain': 'testserver', 'protocol': 'http'}
+        )
+        call_command('send_outbox', stdout=StringIO())
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxEmailStatus.PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertGreater(message.next_attempt_at, timezone.now())
+
+        OutboxEmail.objects.filter(pk=message.pk).update(next_attempt_at=timezone.now())
+        call_command('send_outbox', stdout=StringIO())
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxEmailStatus.FAILED)
+        self.assertIn('SMTP server unavailable', message.last_error)
+
+
+class ExtensionTokenTestCase(TestCase):
+    def setUp(self):
+        # Cached per-user token state outlives the rolled-back user rows
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username='ext@example.com', email='ext@example.com', password='s3cret-pass!',
+            email_verified=True,
+        )
+        Subscription.objects.create(user=self.user, plan=SubscriptionPlan.PREMIUM)
+        self.factory = RequestFactory()
+
+    def authenticate(self, signed_token):
+        request = self.factory.post('/rewrite/', HTTP_AUTHORIZATION=f'Bearer {signed_token}')
+        return ExtensionTokenAuthentication().authenticate(request)
+
+    def test_authenticates_without_database_reads(self):
+        _, signed_token = mint_extension_token(self.user)
+        self.authenticate(signed_token)  # warm the denylist cache
+        with self.assertNumQueries(0):
+            user, payload = self.authenticate(signed_token)
+            self.assertEqual(user.pk, self.user.pk)
+            self.assertTrue(user.subscription.is_premium())
+
+    def test_tampered_and_revoked_tokens_are_rejected(self):
+        token, signed_token = mint_extension_token(self.user)
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(signed_token[:-2] + 'xx')
+
+        self.authenticate(signed_token)
+        token.revoke()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(signed_token)
+
+    def test_password_change_invalidates_earlier_tokens(self):
+        _, signed_token = mint_extension_token(self.user)
+        self.authenticate(signed_token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.set_password('a-new-s3cret-pass!')
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(signed_token)
+
+        _, new_token = mint_extension_token(self.user)
+        user, _ = self.authenticate(new_token)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_deactivation_invalidates_tokens(self):
+        _, signed_token = mint_extension_token(self.user)
+        self.authenticate(signed_token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(signed_token)
+
+        # Reactivating does not bring back tokens issued before the deactivation
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = True
+            self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(signed_token)
+
+    def test_cutoff_is_cached_briefly_without_a_shared_cache(self):
+        _, signed_token = mint_extension_token(self.user)
+        with patch('accounts.authentication.cache.set') as cache_set:
+            self.authenticate(signed_token)
+        cache_set.assert_any_call(VALID_AFTER_CACHE_KEY.format(self.user.pk), 0, settings.UNSHARED_CACHE_TTL)
+
+    def test_deleted_users_tokens_are_rejected(self):
+        _, signed_token = mint_extension_token(self.user)
+        self.authenticate(signed_token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(signed_token)
+
+    def test_profile_mints_and_revokes_tokens(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('accounts:extension_token_create'), {'name': 'Laptop'})
+        self.assertContains(response, "It won't be shown again")
+        token = self.user.extension_tokens.get()
+
+        self.client.post(reverse('accounts:extension_token_revoke', args=[token.jti]))
+        token.refresh_from_db()
+        self.assertIsNotNone(token.revoked_at)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ImportUsersTestCase(TestCase):
+    def write(self, name, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_csv_import_creates_users_subscriptions_and_emails(self):
+        CustomUser.objects.create_user(username='taken@example.com', email='taken@example.com', password='x')
+        CustomUser.objects.create_user(username='Mixed@example.com', email='Mixed@example.com', password='x')
+        path = self.write('users.csv', (
+            'email,first_name,last_name,timezone,password\n'
+            'ada@example.com,Ada,Lovelace,Europe/London,an-initial-pass\n'
+            'grace@example.com,Grace,Hopper,,\n'
+            'taken@example.com,Taken,User,UTC,\n'
+            'Taken@example.com,Taken,Again,UTC,\n'
+            'MIXED@example.com,Mixed,Case,UTC,\n'
+            'ADA@example.com,Ada,Again,UTC,\n'
+            'not-an-email,Bad,Row,UTC,\n'
+            'alan@example.com,Alan,Turing,Mars/Base,\n'
+        ))
+        out = StringIO()
+        call_command('import_users', path, '--workers', '2', '--batch-size', '1', '--domain', 'example.com', stdout=out)
+
+        ada = CustomUser.objects.get(email='ada@example.com')
+        self.assertTrue(ada.check_password('an-initial-pass'))
+        self.assertEqual(ada.timezone, 'Europe/London')
+        self.assertFalse(CustomUser.objects.get(email='grace@example.com').has_usable_password())
+        self.assertEqual(CustomUser.objects.count(), 4)
+        self.assertEqual(ada.subscription.plan, SubscriptionPlan.FREE)
+
+        message = OutboxEmail.objects.get(user=ada)
+        self.assertEqual(message.context['domain'], 'example.com')
+        self.assertEqual(message.context['token'], str(ada.emailverificationtoken_set.get().token))
+        self.assertEqual(OutboxEmail.objects.count(), 2)
+        self.assertIn('Imported 2 user(s)', out.getvalue())
+        self.assertIn('6 row(s) skipped', out.getvalue())
+
+    def test_jsonl_import_of_verified_users_sends_nothing(self):
+        path = self.write('users.jsonl', (
+            '{"email": "one@example.com", "first_name": "One"}\n'
+            '\n'
+            'not json\n'
+            '{"email": "two@example.com"}\n'
+        ))
+        call_command('import_users', path, '--workers', '1', '--verified', stdout=StringIO())
+
+        self.assertEqual(CustomUser.objects.filter(email_verified=True).count(), 2)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+        call_command('import_users', path, '--dry-run', stdout=StringIO())
+        self.assertEqual(CustomUser.objects.count(), 2)
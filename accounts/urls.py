@@ -8,6 +8,8 @@ urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('profile/', views.profile_view, name='profile'),
+    path('profile/extension-tokens/', views.extension_token_create, name='extension_token_create'),
+    path('profile/extension-tokens/<uuid:jti>/revoke/', views.extension_token_revoke, name='extension_token_revoke'),
     path('verify-email/required/', views.verify_email_required, name='verify_email_required'),
     path('verify-email/<uuid:token>/', views.verify_email, name='verify_email'),
     path('resend-verification/', views.resend_verification, name='resend_verification'),
@@ -4,15 +4,16 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.urls import reverse
 from django.utils import timezone
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django.conf import settings
 from .forms import (
     SignUpForm, CustomAuthenticationForm, PasswordResetRequestForm,
     SetNewPasswordForm, UserProfileForm
 )
-from .models import CustomUser, EmailVerificationToken, PasswordResetToken
+from .models import CustomUser, EmailVerificationToken, PasswordResetToken, OutboxEmail, ExtensionToken
+from .authentication import mint_extension_token
+from .emails import (
+    queue_verification_email, queue_password_reset_email,
+    verification_dedupe_key, password_reset_dedupe_key
+)
 from subscriptions.models import Subscription, SubscriptionPlan
 
 
@@ -33,27 +34,9 @@ def signup_view(request):
                 plan=SubscriptionPlan.FREE
             )
             
-            # Create and send verification token
+            # Create verification token and queue the email for the outbox worker
             token = EmailVerificationToken.objects.create(user=user)
-            
-            # Send verification email
-            subject = 'Verify your LinkedRite account'
-            html_message = render_to_string('accounts/email/verify_email.html', {
-                'user': user,
-                'token': token.token,
-                'domain': request.get_host(),
-                'protocol': 'https' if request.is_secure() else 'http'
-            })
-            plain_message = strip_tags(html_message)
-            
-            send_mail(
-                subject,
-                plain_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
+            queue_verification_email(request, user, token)
             
             login(request, user, backend='django.contrib.auth.backends.ModelBackend')
             messages.success(request, 'Account created! Please check your email to verify your account.')
@@ -125,33 +108,20 @@ def resend_verification(request):
         messages.info(request, 'Your email is already verified.')
         return redirect('rewrite:dashboard')
     
+    # A verification email is already waiting in the outbox, don't queue another
+    if OutboxEmail.has_pending(verification_dedupe_key(request.user)):
+        messages.success(request, 'Verification email sent! Please check your inbox.')
+        return redirect('accounts:verify_email_required')
+    
     # Invalidate old tokens
     EmailVerificationToken.objects.filter(
         user=request.user,
         is_used=False
     ).update(is_used=True)
     
-    # Create new token
+    # Create new token and queue the email
     token = EmailVerificationToken.objects.create(user=request.user)
-    
-    # Send verification email
-    subject = 'Verify your LinkedRite account'
-    html_message = render_to_string('accounts/email/verify_email.html', {
-        'user': request.user,
-        'token': token.token,
-        'domain': request.get_host(),
-        'protocol': 'https' if request.is_secure() else 'http'
-    })
-    plain_message = strip_tags(html_message)
-    
-    send_mail(
-        subject,
-        plain_message,
-        settings.DEFAULT_FROM_EMAIL,
-        [request.user.email],
-        html_message=html_message,
-        fail_silently=False,
-    )
+    queue_verification_email(request, request.user, token)
     
     messages.success(request, 'Verification email sent! Please check your inbox.')
     return redirect('accounts:verify_email_required')
@@ -164,33 +134,17 @@ def password_reset_request(request):
             email = form.cleaned_data['email']
             user = CustomUser.objects.get(email=email)
             
-            # Invalidate old tokens
-            PasswordResetToken.objects.filter(
-                user=user,
-                is_used=False
-            ).update(is_used=True)
-            
-            # Create new token
-            token = PasswordResetToken.objects.create(user=user)
-            
-            # Send reset email
-            subject = 'Reset your LinkedRite password'
-            html_message = render_to_string('accounts/email/password_reset.html', {
-                'user': user,
-                'token': token.token,
-                'domain': request.get_host(),
-                'protocol': 'https' if request.is_secure() else 'http'
-            })
-            plain_message = strip_tags(html_message)
-            
-            send_mail(
-                subject,
-                plain_message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                html_message=html_message,
-                fail_silently=False,
-            )
+            # Only mint a new token if no reset email is still waiting in the outbox
+            if not OutboxEmail.has_pending(password_reset_dedupe_key(user)):
+                # Invalidate old tokens
+                PasswordResetToken.objects.filter(
+                    user=user,
+                    is_used=False
+                ).update(is_used=True)
+                
+                # Create new token and queue the email
+                token = PasswordResetToken.objects.create(user=user)
+                queue_password_reset_email(request, user, token)
             
             messages.success(request, 'Password reset link sent! Please check your email.')
             return redirect('accounts:login')
@@ -228,6 +182,18 @@ def password_reset_confirm(request, token):
     })
 
 
+def _profile_context(request, form, new_token=None):
+    return {
+        'form': form,
+        'user': request.user,
+        'extension_tokens': request.user.extension_tokens.filter(
+            revoked_at__isnull=True,
+            expires_at__gt=timezone.now()
+        ),
+        'new_token': new_token,
+    }
+
+
 @login_required
 def profile_view(request):
     if request.method == 'POST':
@@ -239,7 +205,30 @@ def profile_view(request):
     else:
         form = UserProfileForm(instance=request.user)
     
-    return render(request, 'accounts/profile.html', {
-        'form': form,
-        'user': request.user
-    })
\ No newline at end of file
+    return render(request, 'accounts/profile.html', _profile_context(request, form))
+
+
+@login_required
+def extension_token_create(request):
+    if request.method != 'POST':
+        return redirect('accounts:profile')
+    
+    if not request.user.email_verified:
+        messages.error(request, 'Please verify your email address before creating an extension token.')
+        return redirect('accounts:profile')
+    
+    name = request.POST.get('name', '').strip()[:100] or 'Chrome extension'
+    _, signed_token = mint_extension_token(request.user, name=name)
+    
+    # The signed token is only shown once, it is not stored
+    form = UserProfileForm(instance=request.user)
+    return render(request, 'accounts/profile.html', _profile_context(request, form, new_token=signed_token))
+
+
+@login_required
+def extension_token_revoke(request, jti):
+    if request.method == 'POST':
+        token = get_object_or_404(ExtensionToken, jti=jti, user=request.user)
+        token.revoke()
+        messages.success(request, f'Extension token "{token.name}" has been revoked.')
+    return redirect('accounts:profile')
@@ -92,11 +92,18 @@ else
     fi
 fi
 
+# Render the marketing pages into the shared page cache
+if [ -n "$REDIS_URL" ] || [ -n "$REDIS_HOST" ]; then
+    echo "Warming page cache..."
+    python manage.py warm_page_cache || echo "WARNING: Page cache warm-up failed, starting with a cold cache"
+fi
+
 # Start the application
 echo "Starting Gunicorn..."
 exec gunicorn Linkedrite.wsgi:application \
     --bind 0.0.0.0:8000 \
     --workers ${GUNICORN_WORKERS:-3} \
+    --threads ${GUNICORN_THREADS:-8} \
     --timeout ${GUNICORN_TIMEOUT:-120} \
     --access-logfile - \
     --error-logfile - \
@@ -1,7 +1,169 @@
+from datetime import timedelta
 from django.contrib import admin
-from .models import APICounter
+from django.db.models import Avg, Case, CharField, Count, Sum, Value, When
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.html import format_html, format_html_join
+from django.utils import timezone
+from .models import APICounter, ExtensionRelease, ProviderCall, RequestProfile, RewriteHistory
+from .releases import refresh_release_cache
 
 
 @admin.register(APICounter)
 class APICounterAdmin(admin.ModelAdmin):
     list_display = ("id", "count")
+
+
+@admin.register(RewriteHistory)
+class RewriteHistoryAdmin(admin.ModelAdmin):
+    list_display = ("user", "created_at", "emoji_needed", "htag_needed")
+    list_filter = ("emoji_needed", "htag_needed")
+    search_fields = ("user__email",)
+    readonly_fields = ("user", "created_at", "input_text", "output_text", "emoji_needed", "htag_needed")
+    exclude = ("input_data", "output_data")
+    list_select_related = ("user",)
+    show_full_result_count = False
+    ordering = ("-created_at", "-id")
+
+    def has_add_permission(self, request):
+        return False
+
+
+COST_TOTALS = {
+    "calls": Count("id"),
+    "prompt_tokens": Sum("prompt_tokens"),
+    "cached_tokens": Sum("cached_tokens"),
+    "completion_tokens": Sum("completion_tokens"),
+    "thinking_tokens": Sum("thinking_tokens"),
+    "cost": Sum("estimated_cost"),
+    "avg_latency_ms": Avg("latency_ms"),
+}
+
+INPUT_LENGTH_BUCKET = Case(
+    When(input_chars__lt=500, then=Value("< 500 chars")),
+    When(input_chars__lt=1500, then=Value("500-1499 chars")),
+    When(input_chars__lt=3000, then=Value("1500-2999 chars")),
+    default=Value("3000+ chars"),
+    output_field=CharField(),
+)
+
+
+@admin.register(ProviderCall)
+class ProviderCallAdmin(admin.ModelAdmin):
+    list_display = (
+        "created_at", "user", "model", "mode", "emoji_needed", "htag_needed",
+        "input_chars", "estimated_prompt_tokens", "prompt_tokens", "cached_tokens",
+        "completion_tokens", "thinking_tokens", "max_tokens", "latency_ms", "estimated_cost",
+    )
+    list_filter = ("provider", "model", "mode", "emoji_needed", "htag_needed", "created_at")
+    search_fields = ("user__email",)
+    list_select_related = ("user",)
+    show_full_result_count = False
+    date_hierarchy = "created_at"
+    ordering = ("-created_at", "-id")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        urls = [
+            path(
+                "cost-rollup/",
+                self.admin_site.admin_view(self.cost_rollup_view),
+                name="rewrite_providercall_cost_rollup",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        if hasattr(response, "context_data") and "cl" in response.context_data:
+            # Totals follow whatever filters are applied to the changelist
+            response.context_data["totals"] = response.context_data["cl"].queryset.aggregate(**COST_TOTALS)
+        return response
+
+    def cost_rollup_view(self, request):
+        try:
+            days = max(1, int(request.GET.get("days", 30)))
+        except ValueError:
+            days = 30
+        calls = ProviderCall.objects.filter(created_at__gte=timezone.now() - timedelta(days=days))
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": f"Provider cost rollup (last {days} days)",
+            "days": days,
+            "totals": calls.aggregate(**COST_TOTALS),
+            "by_user": calls.values("user__email").annotate(**COST_TOTALS).order_by("-cost")[:50],
+            "by_options": calls.values("mode", "emoji_needed", "htag_needed").annotate(**COST_TOTALS).order_by("-cost"),
+            "by_length": calls.annotate(length=INPUT_LENGTH_BUCKET).values("length").annotate(**COST_TOTALS).order_by("-cost"),
+        }
+        return TemplateResponse(request, "admin/rewrite/providercall/cost_rollup.html", context)
+
+
+@admin.register(ExtensionRelease)
+class ExtensionReleaseAdmin(admin.ModelAdmin):
+    list_display = ("version", "is_published", "published_at", "minimum_version", "download_url")
+    list_filter = ("is_published",)
+    search_fields = ("version",)
+    readonly_fields = ("github_release_id",)
+    show_full_result_count = False
+
+    # The extension is served a cached copy, so every change refreshes it
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_release_cache()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_release_cache()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        refresh_release_cache()
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "method", "path", "status_code", "duration_ms", "query_count", "query_ms", "trigger", "user")
+    list_filter = ("trigger", "created_at")
+    search_fields = ("path",)
+    list_select_related = ("user",)
+    show_full_result_count = False
+    ordering = ("-created_at", "-id")
+    fields = (
+        "created_at", "user", "trigger", "method", "path", "status_code",
+        "duration_ms", "query_count", "query_ms", "profile", "sql",
+    )
+    readonly_fields = fields
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # The profile text and query list are only needed on the detail page
+        if request.resolver_match and request.resolver_match.url_name.endswith("_changelist"):
+            queryset = queryset.defer("stats", "queries")
+        return queryset
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Profile")
+    def profile(self, obj):
+        return format_html("<pre style=\"white-space: pre; overflow-x: auto\">{}</pre>", obj.stats)
+
+    @admin.display(description="SQL")
+    def sql(self, obj):
+        if not obj.queries:
+            return "-"
+        rows = format_html_join(
+            "\n", "<tr><td>{}</td><td><code>{}</code></td></tr>",
+            ((f"{query['ms']:.2f} ms", query["sql"]) for query in obj.queries),
+        )
+        return format_html("<table><tr><th>Time</th><th>Statement</th></tr>{}</table>", rows)
@@ -0,0 +1,152 @@
+"""
+Plan-aware admission control in front of provider calls.
+
+Each worker process lets at most ADMISSION_MAX_CONCURRENT rewrites call the
+provider at once. Requests beyond that wait in a bounded queue per plan, and a
+freed slot goes to the next waiter by smooth weighted round robin, so Premium
+requests are served ahead of Free ones without starving them. A request is shed
+with AdmissionRejected when its plan's queue is full or it waited longer than
+its plan allows. Free plan defaults are tighter, so Free traffic is shed first.
+"""
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from django.conf import settings
+from .deadlines import DeadlineExceeded
+
+PREMIUM = "premium"
+FREE = "free"
+PLANS = (PREMIUM, FREE)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, plan, reason, retry_after):
+        super().__init__(f"{plan} request shed: {reason}")
+        self.plan = plan
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def plan_for(user):
+    subscription = getattr(user, "subscription", None)
+    return PREMIUM if subscription is not None and subscription.is_premium() else FREE
+
+
+class _Waiter:
+    __slots__ = ("event", "enqueued_at")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.enqueued_at = time.monotonic()
+
+
+class _PlanStats:
+    __slots__ = ("admitted", "shed_queue_full", "shed_timeout", "total_wait", "max_wait")
+
+    def __init__(self):
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+
+class AdmissionScheduler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+        self._queues = {plan: deque() for plan in PLANS}
+        self._current_weight = {plan: 0 for plan in PLANS}
+        self._stats = {plan: _PlanStats() for plan in PLANS}
+
+    @contextmanager
+    def admit(self, plan, deadline=None):
+        """Hold a provider slot for the duration of the block, or raise AdmissionRejected
+
+        With a Deadline, waiting stops when it is spent and DeadlineExceeded is raised.
+        """
+        if not settings.ADMISSION_ENABLED:
+            yield
+            return
+        self._acquire(plan, deadline)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _acquire(self, plan, deadline=None):
+        with self._lock:
+            if self._active < settings.ADMISSION_MAX_CONCURRENT and not any(self._queues.values()):
+                self._active += 1
+                self._record_admitted(plan, 0.0)
+                return
+            if len(self._queues[plan]) >= settings.ADMISSION_QUEUE_SIZE[plan]:
+                self._stats[plan].shed_queue_full += 1
+                raise AdmissionRejected(plan, "queue full", self._retry_after(plan))
+            waiter = _Waiter()
+            self._queues[plan].append(waiter)
+
+        max_wait = settings.ADMISSION_MAX_WAIT[plan]
+        if deadline is not None:
+            max_wait = min(max_wait, deadline.remaining())
+        granted = waiter.event.wait(max_wait)
+        with self._lock:
+            # The slot may have been handed over between the timeout and taking the lock
+            if granted or waiter.event.is_set():
+                self._record_admitted(plan, time.monotonic() - waiter.enqueued_at)
+                return
+            self._queues[plan].remove(waiter)
+            self._stats[plan].shed_timeout += 1
+        if deadline is not None and deadline.expired():
+            raise DeadlineExceeded(f"deadline of {deadline.seconds:g}s exceeded while queued")
+        raise AdmissionRejected(plan, "queue timeout", self._retry_after(plan))
+
+    def _release(self):
+        with self._lock:
+            waiter = self._next_waiter()
+            if waiter is None:
+                self._active -= 1
+            else:
+                # Hand the slot straight to the waiter; the active count is unchanged
+                waiter.event.set()
+
+    def _next_waiter(self):
+        waiting = [plan for plan in PLANS if self._queues[plan]]
+        if not waiting:
+            return None
+        weights = settings.ADMISSION_WEIGHTS
+        for plan in waiting:
+            self._current_weight[plan] += weights[plan]
+        chosen = max(waiting, key=lambda plan: self._current_weight[plan])
+        self._current_weight[chosen] -= sum(weights[plan] for plan in waiting)
+        return self._queues[chosen].popleft()
+
+    def _record_admitted(self, plan, waited):
+        stats = self._stats[plan]
+        stats.admitted += 1
+        stats.total_wait += waited
+        stats.max_wait = max(stats.max_wait, waited)
+
+    def _retry_after(self, plan):
+        return max(1, math.ceil(settings.ADMISSION_MAX_WAIT[plan]))
+
+    def snapshot(self):
+        """Queue depth and wait metrics per plan for this worker process"""
+        with self._lock:
+            plans = {}
+            for plan in PLANS:
+                stats = self._stats[plan]
+                plans[plan] = {
+                    "queued": len(self._queues[plan]),
+                    "admitted": stats.admitted,
+                    "shed_queue_full": stats.shed_queue_full,
+                    "shed_timeout": stats.shed_timeout,
+                    "avg_wait_ms": round(stats.total_wait / stats.admitted * 1000, 1) if stats.admitted else 0.0,
+                    "max_wait_ms": round(stats.max_wait * 1000, 1),
+                }
+            return {"active": self._active, "limit": settings.ADMISSION_MAX_CONCURRENT, "plans": plans}
+
+
+admission = AdmissionScheduler()
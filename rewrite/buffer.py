@@ -0,0 +1,94 @@
+"""
+Buffered bulk inserts for rows written on the request path.
+
+Views hand unsaved model instances to a BufferedWriter, which a background
+thread inserts with bulk_create in batches, so the request never waits on an
+INSERT. Queued rows are written at exit, but a worker that is killed (e.g. by
+gunicorn after a timeout) loses up to BUFFERED_WRITES_FLUSH_INTERVAL seconds
+of them. With BUFFERED_WRITES_ASYNC disabled rows are flushed inline whenever
+a batch fills up or flush() is called; the rewrite tests disable it with
+override_settings and flush in tearDown.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedWriter:
+    """Collects unsaved model instances and bulk inserts them in batches"""
+
+    def __init__(self, model, batch_size=None, flush_interval=None):
+        self.model = model
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    # Read on use, as the writers are created at import time before settings may be overridden
+
+    @property
+    def batch_size(self):
+        return self._batch_size or settings.BUFFERED_WRITES_BATCH_SIZE
+
+    @property
+    def flush_interval(self):
+        return self._flush_interval or settings.BUFFERED_WRITES_FLUSH_INTERVAL
+
+    def add(self, obj):
+        self._queue.put(obj)
+        if settings.BUFFERED_WRITES_ASYNC:
+            self._ensure_thread()
+        elif self._queue.qsize() >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write everything queued so far from the calling thread"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch):
+        try:
+            self.model.objects.bulk_create(batch, batch_size=self.batch_size)
+        except Exception:
+            logger.exception("Dropped %d buffered %s rows", len(batch), self.model.__name__)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f"buffered-writer-{self.model._meta.label_lower}",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            close_old_connections()
+            self._write(batch)
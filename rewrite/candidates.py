@@ -0,0 +1,42 @@
+"""
+Multi-candidate rewrites.
+
+A request may ask for up to REWRITE_MAX_CANDIDATES alternative rewrites, which
+come back from a single provider call. The set is cached per user and input, so
+asking again for the same post returns the same alternatives without another
+provider call or quota charge, even once the daily limit is reached.
+REWRITE_CANDIDATE_QUOTA decides whether a set is charged as one rewrite
+("request") or one per alternative ("candidate"). Each alternative costs extra
+output tokens, so the web page asks for one and fetches the rest only from its
+"More options" button.
+"""
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+
+
+def requested_candidates(value):
+    """Number of candidates asked for, or ValueError when out of range"""
+    count = int(value)
+    if not 1 <= count <= settings.REWRITE_MAX_CANDIDATES:
+        raise ValueError(f"candidates must be between 1 and {settings.REWRITE_MAX_CANDIDATES}")
+    return count
+
+
+def quota_units(count):
+    if settings.REWRITE_CANDIDATE_QUOTA == "candidate":
+        return count
+    return 1
+
+
+def candidate_cache_key(user_id, text, emoji_needed, htag_needed, count):
+    digest = hashlib.sha256(text.strip().encode()).hexdigest()
+    return f"rewrite:candidates:{user_id}:{int(bool(emoji_needed))}{int(bool(htag_needed))}:{count}:{digest}"
+
+
+def get_cached_candidates(key):
+    return cache.get(key)
+
+
+def cache_candidates(key, candidates):
+    cache.set(key, list(candidates), timeout=settings.CANDIDATE_CACHE_TTL)
@@ -0,0 +1,6 @@
+from django.conf import settings
+
+
+def assets(request):
+    """Whether templates should load the compiled stylesheet and vendored scripts"""
+    return {'compiled_assets': settings.COMPILED_ASSETS}
@@ -0,0 +1,46 @@
+"""
+Request deadlines for rewrites.
+
+A rewrite gets REWRITE_DEADLINE_SECONDS by default. Clients may ask for less
+with an X-Request-Deadline header (seconds), capped at
+REWRITE_MAX_DEADLINE_SECONDS. The time left is used as the admission wait limit
+and as the provider request timeout, so abandoned work stops well before
+gunicorn would kill the worker.
+"""
+import time
+from django.conf import settings
+
+DEADLINE_HEADER = "HTTP_X_REQUEST_DEADLINE"
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a rewrite runs out of time before or during a provider call"""
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def from_request(cls, request):
+        seconds = settings.REWRITE_DEADLINE_SECONDS
+        requested = request.META.get(DEADLINE_HEADER)
+        if requested:
+            try:
+                requested = float(requested)
+            except ValueError:
+                requested = None
+            if requested and requested > 0:
+                seconds = min(requested, settings.REWRITE_MAX_DEADLINE_SECONDS)
+        return cls(seconds)
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceeded(f"deadline of {self.seconds:g}s exceeded")
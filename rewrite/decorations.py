@@ -0,0 +1,124 @@
+"""
+Local hashtag and emoji decoration.
+
+With LOCAL_DECORATIONS on, the provider is asked for plain text and hashtags
+and emojis are added here instead, so the model no longer spends output tokens
+(the slowest part of a call) inventing them. Keywords are matched against a
+TF-IDF index over the bundled topic corpus in rewrite/data/hashtags.json: the
+best topics for the whole post become its hashtags, and each paragraph gets the
+emoji of its best topic. The same text always gets the same decorations.
+"""
+import json
+import math
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+from pathlib import Path
+from django.conf import settings
+from .incremental import join_paragraphs, split_paragraphs
+
+CORPUS_PATH = Path(__file__).resolve().parent / "data" / "hashtags.json"
+
+WORDS = re.compile(r"[a-z0-9]+")
+HASHTAGS = re.compile(r"#(\w+)")
+
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its my of on or our so that the this "
+    "to was we were will with you your".split()
+)
+
+
+def terms(text):
+    """Lowercased keywords with plurals folded, so "teams" matches "team" """
+    words = WORDS.findall(text.lower())
+    return [
+        word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+        for word in words
+        if word not in STOPWORDS
+    ]
+
+
+class HashtagIndex:
+    """TF-IDF vectors of the corpus topics, stored as an inverted index"""
+
+    def __init__(self, topics):
+        self.topics = topics
+        documents = [Counter(terms(topic["text"] + " " + topic["tag"])) for topic in topics]
+        frequency = Counter(term for document in documents for term in document)
+        count = len(documents)
+        self.idf = {term: math.log((1 + count) / (1 + df)) + 1 for term, df in frequency.items()}
+
+        self.postings = defaultdict(list)
+        for position, document in enumerate(documents):
+            weights = {term: tf * self.idf[term] for term, tf in document.items()}
+            norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+            for term, weight in weights.items():
+                self.postings[term].append((position, weight / norm))
+
+    @classmethod
+    def load(cls, path=CORPUS_PATH):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def match(self, text, limit):
+        """Up to `limit` topics most similar to text, best first"""
+        query = {term: tf * self.idf[term] for term, tf in Counter(terms(text)).items() if term in self.idf}
+        norm = math.sqrt(sum(weight * weight for weight in query.values()))
+        if not norm:
+            return []
+
+        scores = defaultdict(float)
+        for term, weight in query.items():
+            for position, document_weight in self.postings[term]:
+                scores[position] += weight / norm * document_weight
+
+        # Ties go to the earlier topic so the result never depends on dict order
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [
+            self.topics[position]
+            for position, score in ranked[:limit]
+            if score >= settings.LOCAL_DECORATION_MIN_SCORE
+        ]
+
+
+@lru_cache(maxsize=1)
+def hashtag_index():
+    """The index is built once per process, on first use"""
+    return HashtagIndex.load()
+
+
+def prompt_options(emoji_needed, htag_needed):
+    """Options to send to the provider; with local decoration it is only asked for plain text"""
+    if settings.LOCAL_DECORATIONS:
+        return False, False
+    return emoji_needed, htag_needed
+
+
+def decorate(text, emoji_needed, htag_needed):
+    """Add emojis to the paragraphs and hashtags to the end of a rewritten post"""
+    if not (emoji_needed or htag_needed) or not text.strip():
+        return text
+    index = hashtag_index()
+    paragraphs, separators = split_paragraphs(text)
+
+    if emoji_needed:
+        used = set()
+        for i, paragraph in enumerate(paragraphs):
+            if len(used) >= settings.LOCAL_DECORATION_MAX_EMOJIS:
+                break
+            topic = next((t for t in index.match(paragraph, 3) if t["emoji"] not in used), None)
+            if topic:
+                paragraphs[i] = f"{paragraph} {topic['emoji']}"
+                used.add(topic["emoji"])
+
+    text = join_paragraphs(paragraphs, separators)
+    if htag_needed:
+        present = {tag.lower() for tag in HASHTAGS.findall(text)}
+        tags = [
+            f"#{topic['tag']}"
+            for topic in index.match(text, settings.LOCAL_DECORATION_MAX_HASHTAGS + len(present))
+            if topic["tag"].lower() not in present
+        ][:settings.LOCAL_DECORATION_MAX_HASHTAGS]
+        if tags:
+            text = f"{text}\n\n{' '.join(tags)}"
+    return text
@@ -0,0 +1,57 @@
+"""
+Liveness and readiness checks for load balancers and container health checks.
+
+/healthz only proves the process can answer. /readyz checks the database, the
+cache and the provider circuit, and keeps the result for a few seconds so
+frequent polling costs one set of checks per worker per interval.
+"""
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from .providers import AI_PROVIDER, provider_circuit
+
+_readiness = {"checked_at": 0.0, "result": None}
+_readiness_lock = threading.Lock()
+
+
+def check_database():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+
+
+def check_cache():
+    cache.set("health:ping", 1, timeout=10)
+    if cache.get("health:ping") != 1:
+        raise RuntimeError("cache did not return the value just written")
+
+
+def _run(check):
+    started = time.monotonic()
+    try:
+        check()
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    return {"ok": True, "ms": round((time.monotonic() - started) * 1000, 1)}
+
+
+def readiness():
+    """Return (ready, checks), re-running the checks at most every HEALTH_CHECK_CACHE_SECONDS"""
+    now = time.monotonic()
+    with _readiness_lock:
+        if _readiness["result"] is not None and now - _readiness["checked_at"] < settings.HEALTH_CHECK_CACHE_SECONDS:
+            return _readiness["result"]
+
+        checks = {"database": _run(check_database), "cache": _run(check_cache)}
+        try:
+            checks["provider"] = {"name": AI_PROVIDER, "circuit": provider_circuit.state()}
+        except Exception as e:
+            checks["provider"] = {"name": AI_PROVIDER, "circuit": "unknown", "error": str(e)}
+
+        # An open provider circuit degrades rewrites but the instance can still serve pages
+        ready = checks["database"]["ok"] and checks["cache"]["ok"]
+        _readiness["result"] = (ready, checks)
+        _readiness["checked_at"] = now
+        return _readiness["result"]
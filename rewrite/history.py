@@ -0,0 +1,54 @@
+"""
+Rewrite history recording and keyset pagination.
+
+History rows are queued on a BufferedWriter so the rewrite response never waits
+on the INSERT. Listing pages by (created_at, id) cursor instead of OFFSET keeps
+each page an index range scan, however many entries a user has.
+"""
+import base64
+from datetime import datetime
+from django.conf import settings
+from django.db.models import Q
+from .buffer import BufferedWriter
+from .models import RewriteHistory
+
+history_writer = BufferedWriter(RewriteHistory)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def record_rewrite(user, input_text, output_text, emoji_needed, htag_needed):
+    history_writer.add(
+        RewriteHistory.build(user, input_text, output_text, emoji_needed, htag_needed)
+    )
+
+
+def encode_cursor(entry):
+    raw = f"{entry.created_at.isoformat()}|{entry.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, pk = raw.split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor("Invalid history cursor.")
+
+
+def get_history_page(user, cursor=None, limit=None):
+    """Return (entries, next_cursor) for the page starting after `cursor`"""
+    limit = min(limit or settings.HISTORY_PAGE_SIZE, settings.HISTORY_MAX_PAGE_SIZE)
+    queryset = RewriteHistory.objects.filter(user=user).order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+        )
+
+    entries = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(entries[limit - 1]) if len(entries) > limit else None
+    return entries[:limit], next_cursor
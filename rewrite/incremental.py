@@ -0,0 +1,106 @@
+"""
+Paragraph-level incremental rewriting.
+
+Long posts are split into paragraphs and each paragraph's rewrite is cached, so
+editing one sentence and rewriting again only sends the changed paragraphs to
+the provider. Changed paragraphs are rewritten concurrently and reassembled
+with the original paragraph breaks. Every paragraph call is admitted on its own,
+so the fan-out counts against the admission limit like any other provider call.
+"""
+import hashlib
+import re
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from .admission import FREE, admission
+from .ledger import CallContext
+from .prompts import PARAGRAPH_SYSTEM_PROMPT, build_paragraph_prompt
+from .providers import generate
+from .tokens import estimate_tokens, output_budget
+
+PARAGRAPH_BREAK = re.compile(r"(\n\s*\n)")
+
+
+def split_paragraphs(text):
+    """Split text into (paragraphs, separators) so it can be rejoined unchanged"""
+    parts = PARAGRAPH_BREAK.split(text.strip())
+    return parts[0::2], parts[1::2]
+
+
+def join_paragraphs(paragraphs, separators):
+    text = paragraphs[0]
+    for separator, paragraph in zip(separators, paragraphs[1:]):
+        text += separator + paragraph
+    return text
+
+
+def use_incremental_rewrite(text, requested):
+    """Incremental mode only pays off for posts with several paragraphs"""
+    if not requested or len(text) < settings.INCREMENTAL_MIN_CHARS:
+        return False
+    paragraphs, _ = split_paragraphs(text)
+    return len(paragraphs) >= settings.INCREMENTAL_MIN_PARAGRAPHS
+
+
+def paragraph_cache_key(paragraph, emoji_needed, htag_needed):
+    digest = hashlib.sha256(paragraph.strip().encode()).hexdigest()
+    return f"rewrite:paragraph:{int(bool(emoji_needed))}{int(bool(htag_needed))}:{digest}"
+
+
+def rewrite_paragraph(paragraph, emoji_needed, htag_needed, user=None, deadline=None, plan=FREE):
+    context = None
+    if user is not None:
+        context = CallContext(user, emoji_needed, htag_needed, mode="paragraph", input_chars=len(paragraph))
+    with admission.admit(plan, deadline=deadline):
+        completion = generate(
+            PARAGRAPH_SYSTEM_PROMPT,
+            build_paragraph_prompt(paragraph, emoji_needed, htag_needed),
+            max_tokens=output_budget(estimate_tokens(paragraph), ceiling=settings.INCREMENTAL_PARAGRAPH_MAX_TOKENS),
+            context=context,
+            deadline=deadline,
+        )
+    # Keep the paragraph count stable even if the model adds a blank line
+    return PARAGRAPH_BREAK.sub("\n", completion.text).strip()
+
+
+def rewrite_incrementally(text, emoji_needed, htag_needed, user=None, deadline=None, plan=FREE):
+    """Rewrite only paragraphs without a cached result and reassemble the post
+
+    Raises AdmissionRejected, DeadlineExceeded or EmptyCompletion when a
+    paragraph cannot be rewritten; paragraphs finished by then stay cached for
+    the next attempt.
+    """
+    paragraphs, separators = split_paragraphs(text)
+    last = len(paragraphs) - 1
+
+    # Hashtags belong at the end of the post, so only the last paragraph asks for them
+    options = [(emoji_needed, htag_needed and i == last) for i in range(len(paragraphs))]
+    keys = [
+        paragraph_cache_key(paragraph, *options[i])
+        for i, paragraph in enumerate(paragraphs)
+    ]
+    cached = cache.get_many(keys)
+    pending = [i for i, key in enumerate(keys) if key not in cached]
+
+    def rewrite_and_cache(i):
+        rewritten = rewrite_paragraph(paragraphs[i], *options[i], user=user, deadline=deadline, plan=plan)
+        cache.set(keys[i], rewritten, timeout=settings.PARAGRAPH_CACHE_TTL)
+        return rewritten
+
+    results = {}
+    if pending:
+        workers = min(len(pending), settings.INCREMENTAL_MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {i: pool.submit(rewrite_and_cache, i) for i in pending}
+            try:
+                results = {i: future.result() for i, future in futures.items()}
+            except Exception:
+                # Don't start the paragraphs still waiting for a thread
+                pool.shutdown(cancel_futures=True)
+                raise
+
+    rewritten_paragraphs = [
+        results[i] if i in results else cached[keys[i]]
+        for i in range(len(paragraphs))
+    ]
+    return join_paragraphs(rewritten_paragraphs, separators)
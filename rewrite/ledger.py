@@ -0,0 +1,69 @@
+"""
+Token and cost ledger for provider calls.
+
+Every provider call made on behalf of a user is queued as a ProviderCall row
+and bulk inserted by a BufferedWriter, so recording costs no INSERT on the
+request path.
+"""
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any
+from django.conf import settings
+from .buffer import BufferedWriter
+from .models import ProviderCall
+
+ledger_writer = BufferedWriter(ProviderCall)
+
+
+@dataclass
+class CallContext:
+    """Who a provider call is made for and with which rewrite options"""
+    user: Any
+    emoji_needed: bool = False
+    htag_needed: bool = False
+    mode: str = "post"
+    input_chars: int = 0
+
+
+def estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens, thinking_tokens=0):
+    """Estimated USD cost from PROVIDER_PRICING (per million input, cached input, output tokens)
+
+    Thinking tokens are billed at the output price.
+    """
+    input_price, cached_price, output_price = settings.PROVIDER_PRICING.get(
+        model, settings.PROVIDER_DEFAULT_PRICING
+    )
+    cost = (
+        (prompt_tokens - cached_tokens) * input_price
+        + cached_tokens * cached_price
+        + (completion_tokens + thinking_tokens) * output_price
+    ) / 1_000_000
+    return Decimal(str(round(cost, 6)))
+
+
+def record_provider_call(provider, context, completion, estimated_prompt_tokens=0, max_tokens=0):
+    ledger_writer.add(
+        ProviderCall(
+            user_id=context.user.pk,
+            provider=provider,
+            model=completion.model,
+            mode=context.mode,
+            emoji_needed=bool(context.emoji_needed),
+            htag_needed=bool(context.htag_needed),
+            input_chars=context.input_chars,
+            prompt_tokens=completion.prompt_tokens,
+            completion_tokens=completion.completion_tokens,
+            cached_tokens=completion.cached_tokens,
+            thinking_tokens=completion.thinking_tokens,
+            estimated_prompt_tokens=estimated_prompt_tokens,
+            max_tokens=max_tokens,
+            latency_ms=completion.latency_ms,
+            estimated_cost=estimate_cost(
+                completion.model,
+                completion.prompt_tokens,
+                completion.cached_tokens,
+                completion.completion_tokens,
+                completion.thinking_tokens,
+            ),
+        )
+    )
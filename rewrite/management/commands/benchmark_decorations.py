@@ -0,0 +1,118 @@
+"""
+Django management command that compares local hashtag/emoji decoration with
+asking the provider for them.
+
+Without --live it only measures the local stage: decoration latency and the
+estimated output tokens of the decorations it adds, which are the tokens the
+provider no longer has to generate. With --live each sample is also rewritten
+twice through the provider, once with the hashtag and emoji instructions and
+once with plain text plus local decoration, and the completion tokens and
+latency of both are reported. Live runs call the provider and are billed.
+"""
+
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from rewrite.decorations import decorate, hashtag_index
+from rewrite.models import RewriteHistory
+from rewrite.prompts import POST_SYSTEM_PROMPT, build_post_prompt
+from rewrite.providers import generate
+from rewrite.tokens import estimate_tokens, output_budget
+
+SAMPLE_POSTS = [
+    "I am happy to share that I have started a new position as a backend engineer. The team builds the "
+    "payments platform and I am looking forward to learning from all of them.",
+    "Last week our startup closed its seed round. Thank you to the investors, the customers who trusted an "
+    "early product, and the team that kept shipping.\n\nWe are hiring engineers and designers, message me "
+    "if you want to join.",
+    "Burnout crept up on me last year. Setting boundaries around meetings and taking real breaks did more "
+    "for my productivity than any tool.",
+    "We moved our data pipeline to the cloud and cut the nightly batch from six hours to forty minutes. "
+    "Most of the win came from better partitioning, not bigger machines.",
+    "Public speaking used to terrify me. Joining a local meetup and giving one short talk a month changed "
+    "that, and it made me a better communicator at work.",
+]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks local hashtag and emoji decoration against provider-generated decorations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from-history',
+            type=int,
+            metavar='N',
+            help='Use the outputs of the N most recent rewrites instead of the built-in samples',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=200,
+            help='Times each sample is decorated when timing the local stage',
+        )
+        parser.add_argument(
+            '--live',
+            action='store_true',
+            help='Also rewrite every sample through the provider with and without decoration instructions',
+        )
+
+    def handle(self, *args, **options):
+        samples = self.samples(options['from_history'])
+        if not samples:
+            self.stdout.write(self.style.WARNING('No samples to benchmark'))
+            return
+
+        started = time.perf_counter()
+        hashtag_index()
+        self.stdout.write(f'Index built in {(time.perf_counter() - started) * 1000:.1f} ms')
+
+        timings = []
+        added = []
+        for text in samples:
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                decorated = decorate(text, True, True)
+                timings.append((time.perf_counter() - started) * 1_000_000)
+            added.append(estimate_tokens(decorated) - estimate_tokens(text))
+        self.stdout.write(
+            f'Local decoration over {len(samples)} sample(s): '
+            f'mean {statistics.mean(timings):.0f} us, p95 {percentile(timings, 0.95):.0f} us, '
+            f'~{statistics.mean(added):.0f} decoration tokens per post'
+        )
+
+        if options['live']:
+            self.live(samples)
+
+    def samples(self, history):
+        if not history:
+            return SAMPLE_POSTS
+        entries = RewriteHistory.objects.order_by('-created_at', '-id')[:history]
+        return [entry.output_text for entry in entries]
+
+    def live(self, samples):
+        results = {'provider': [], 'local': []}
+        for text in samples:
+            budget = output_budget(estimate_tokens(text))
+            for label, options in (('provider', (True, True)), ('local', (False, False))):
+                completion = generate(POST_SYSTEM_PROMPT, build_post_prompt(text, *options), max_tokens=budget)
+                latency = completion.latency_ms
+                if label == 'local':
+                    started = time.perf_counter()
+                    decorate(completion.text, True, True)
+                    latency += (time.perf_counter() - started) * 1000
+                results[label].append((completion.completion_tokens, latency))
+
+        for label, rows in results.items():
+            self.stdout.write(
+                f'{label:>8}: mean {statistics.mean(tokens for tokens, _ in rows):.0f} completion tokens, '
+                f'mean {statistics.mean(ms for _, ms in rows):.0f} ms'
+            )
+        saved = statistics.mean(tokens for tokens, _ in results['provider']) - statistics.mean(
+            tokens for tokens, _ in results['local']
+        )
+        self.stdout.write(self.style.SUCCESS(f'Local decoration saves ~{saved:.0f} output tokens per rewrite'))
@@ -0,0 +1,123 @@
+"""
+Django management command that measures concurrent SQLite write throughput.
+
+Worker processes stand in for gunicorn workers and run the rewrite path's write
+pattern (read today's usage row, bump it and the API counter) in transactions
+against a scratch database, once with SQLite's defaults and once with the
+SQLITE_PRODUCTION profile (WAL, synchronous=NORMAL, busy_timeout, mmap, page
+cache and BEGIN IMMEDIATE). The configured database is never touched.
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+USERS = 50
+
+
+def setup_database(path, pragmas):
+    connection = sqlite3.connect(path)
+    for pragma in pragmas:
+        connection.execute(pragma)
+    connection.executescript(
+        """
+        CREATE TABLE api_counter (id INTEGER PRIMARY KEY, count INTEGER NOT NULL);
+        CREATE TABLE usage (user_id INTEGER PRIMARY KEY, count INTEGER NOT NULL);
+        INSERT INTO api_counter (id, count) VALUES (1, 0);
+        """
+    )
+    connection.executemany("INSERT INTO usage (user_id, count) VALUES (?, 0)", [(i,) for i in range(USERS)])
+    connection.commit()
+    connection.close()
+
+
+def run_worker(path, pragmas, begin, timeout, duration, seed, start, results):
+    # sqlite3 only, so it also runs under the spawn start method without Django
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    for pragma in pragmas:
+        connection.execute(pragma)
+    committed = locked = 0
+    latencies = []
+    user_id = seed
+    start.wait()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        user_id = (user_id * 31 + 7) % USERS
+        started = time.perf_counter()
+        try:
+            connection.execute(begin)
+            connection.execute("SELECT count FROM usage WHERE user_id = ?", (user_id,)).fetchone()
+            connection.execute("UPDATE usage SET count = count + 1 WHERE user_id = ?", (user_id,))
+            connection.execute("UPDATE api_counter SET count = count + 1 WHERE id = 1")
+            connection.execute("COMMIT")
+        except sqlite3.OperationalError:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            locked += 1
+            continue
+        committed += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+    connection.close()
+    results.put((committed, locked, latencies))
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks concurrent SQLite writes with default settings and with the production profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent writer processes')
+        parser.add_argument('--duration', type=float, default=5, help='Seconds each profile is measured')
+        parser.add_argument(
+            '--profile',
+            choices=['both', 'default', 'production'],
+            default='both',
+            help='Which settings to measure',
+        )
+
+    def handle(self, *args, **options):
+        profiles = {
+            # Python's sqlite3 defaults, as Django uses them without OPTIONS
+            'default': ([], 'BEGIN', 5.0),
+            'production': (settings.SQLITE_PRAGMAS, 'BEGIN IMMEDIATE', settings.SQLITE_BUSY_TIMEOUT),
+        }
+        if options['profile'] != 'both':
+            profiles = {options['profile']: profiles[options['profile']]}
+
+        for name, (pragmas, begin, timeout) in profiles.items():
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'benchmark.sqlite3')
+                setup_database(path, pragmas)
+                committed, locked, latencies = self.measure(
+                    path, pragmas, begin, timeout, options['workers'], options['duration']
+                )
+            rate = committed / options['duration']
+            p99 = sorted(latencies)[int(len(latencies) * 0.99)] if latencies else 0
+            self.stdout.write(
+                f'{name:>10}: {rate:8.0f} write transactions/s, {locked} locked errors, '
+                f'p50 {statistics.median(latencies) if latencies else 0:.2f} ms, p99 {p99:.2f} ms'
+            )
+
+    def measure(self, path, pragmas, begin, timeout, workers, duration):
+        start = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=run_worker, args=(path, pragmas, begin, timeout, duration, seed, start, results)
+            )
+            for seed in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        start.set()
+        # Drain the queue before joining, or large results can block the workers
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+        latencies = [latency for _, _, worker_latencies in collected for latency in worker_latencies]
+        return sum(committed for committed, _, _ in collected), sum(locked for _, locked, _ in collected), latencies
@@ -0,0 +1,81 @@
+"""
+Django management command that refreshes the cached extension release metadata.
+
+With --from-github the latest GitHub release of EXTENSION_RELEASE_REPOSITORY is
+stored as an ExtensionRelease first, so the server makes one GitHub API call
+per interval instead of every extension install making one per page load.
+Releases entered in the admin need no sync; the command then only rebuilds
+the cached copy, e.g. after a cache flush. The rebuilt copy only reaches the
+web workers through a shared (Redis) cache; with the per-process fallback each
+worker rebuilds its own copy within EXTENSION_RELEASE_MAX_AGE.
+"""
+
+import time
+from datetime import datetime
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rewrite.models import ExtensionRelease
+from rewrite.releases import refresh_release_cache
+
+GITHUB_LATEST_RELEASE = "https://api.github.com/repos/{repository}/releases/latest"
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the cached extension release, optionally syncing the latest GitHub release first'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from-github',
+            action='store_true',
+            help='Store the latest GitHub release of EXTENSION_RELEASE_REPOSITORY before refreshing',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep refreshing instead of exiting after one run',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.EXTENSION_RELEASE_REFRESH_INTERVAL,
+            help='Seconds to sleep between refreshes when running with --loop',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            if options['from_github']:
+                self.sync_from_github()
+            entry = refresh_release_cache()
+            self.stdout.write(self.style.SUCCESS(f'Cached extension release (ETag {entry["etag"]})'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def sync_from_github(self):
+        headers = {'Accept': 'application/vnd.github+json'}
+        if settings.GITHUB_TOKEN:
+            headers['Authorization'] = f'Bearer {settings.GITHUB_TOKEN}'
+        url = GITHUB_LATEST_RELEASE.format(repository=settings.EXTENSION_RELEASE_REPOSITORY)
+        try:
+            response = httpx.get(url, headers=headers, timeout=10)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            # Keep serving the stored release; the next run tries again
+            self.stdout.write(self.style.WARNING(f'Could not fetch {url}: {e}'))
+            return
+
+        release = response.json()
+        assets = release.get('assets') or []
+        version = release['tag_name'].removeprefix(settings.EXTENSION_RELEASE_TAG_PREFIX)
+        # Keyed on the version so a release already entered in the admin is linked, not duplicated
+        _, created = ExtensionRelease.objects.update_or_create(
+            version=version,
+            defaults={
+                'github_release_id': release['id'],
+                'download_url': assets[0]['browser_download_url'] if assets else release['html_url'],
+                'release_notes': release.get('body') or '',
+                'published_at': datetime.fromisoformat(release['published_at']),
+            },
+        )
+        self.stdout.write(f'{"Stored" if created else "Updated"} GitHub release {version}')
@@ -0,0 +1,61 @@
+"""
+Middleware for the rewrite app.
+"""
+from django.core.cache import cache
+from django.http import JsonResponse
+from .admission import admission
+from .health import readiness
+from .profiling import profile_request, profile_trigger
+
+HEALTH_PATHS = {"/healthz", "/healthz/"}
+READINESS_PATHS = {"/readyz", "/readyz/"}
+
+
+def cache_stats():
+    """Per-tier hit rates when the two-tier cache backend is in use"""
+    stats = getattr(cache, "stats", None)
+    return {"cache": stats()} if stats else {}
+
+
+class HealthCheckMiddleware:
+    """Answers /healthz and /readyz before sessions, auth and the verification middleware run.
+
+    Must be first in MIDDLEWARE so probes never touch the session or user tables
+    and are not redirected by SECURE_SSL_REDIRECT.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path in HEALTH_PATHS:
+            return JsonResponse({"status": "ok"})
+
+        if request.path in READINESS_PATHS:
+            ready, checks = readiness()
+            return JsonResponse(
+                {
+                    "status": "ready" if ready else "unavailable",
+                    # Live queue depth and wait metrics for this worker, not cached
+                    "checks": {**checks, "admission": admission.snapshot(), **cache_stats()},
+                },
+                status=200 if ready else 503,
+            )
+
+        return self.get_response(request)
+
+
+class RequestProfilerMiddleware:
+    """Profiles requests flagged by staff users, or sampled, and stores a RequestProfile.
+
+    Must come after AuthenticationMiddleware so request.user is available.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trigger = profile_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        return profile_request(request, self.get_response, trigger)
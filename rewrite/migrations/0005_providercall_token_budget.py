@@ -0,0 +1,23 @@
+# Generated by Django 6.1.2 on 2026-10-19 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewrite', '0004_providercall'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='providercall',
+            name='estimated_prompt_tokens',
+            field=models.PositiveIntegerField(default=0, help_text='Local estimate made before the call'),
+        ),
+        migrations.AddField(
+            model_name='providercall',
+            name='max_tokens',
+            field=models.PositiveIntegerField(default=0, help_text='Output token budget sent to the provider'),
+        ),
+    ]
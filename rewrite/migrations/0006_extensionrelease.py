@@ -0,0 +1,30 @@
+# Generated by Django 6.1.2 on 2026-10-19 13:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewrite', '0005_providercall_token_budget'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtensionRelease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(help_text='e.g. 2.0.1.1, as in manifest.json', max_length=50, unique=True)),
+                ('download_url', models.URLField(max_length=500)),
+                ('release_notes', models.TextField(blank=True)),
+                ('minimum_version', models.CharField(blank=True, help_text='Installed versions older than this are told the update is required', max_length=50)),
+                ('is_published', models.BooleanField(default=True)),
+                ('published_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('github_release_id', models.BigIntegerField(blank=True, editable=False, null=True, unique=True)),
+            ],
+            options={
+                'ordering': ['-published_at', '-id'],
+            },
+        ),
+    ]
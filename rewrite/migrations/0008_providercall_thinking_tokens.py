@@ -0,0 +1,18 @@
+# Generated by Django 6.1.2 on 2026-10-19 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rewrite', '0007_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='providercall',
+            name='thinking_tokens',
+            field=models.PositiveIntegerField(default=0, help_text='Reasoning tokens, billed as output on top of completion tokens'),
+        ),
+    ]
@@ -1,5 +1,151 @@
+import zlib
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 
 
 class APICounter(models.Model):
     count = models.IntegerField(default=0)
+
+
+class ThrottleWindow(models.Model):
+    """Per-key request counter for one fixed window of the sliding-window throttle"""
+    key = models.CharField(max_length=255)
+    window = models.BigIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['key', 'window']
+
+
+class RewriteHistory(models.Model):
+    """Input and output of one rewrite, stored zlib-compressed"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='rewrite_history'
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    input_data = models.BinaryField()
+    output_data = models.BinaryField()
+    emoji_needed = models.BooleanField(default=False)
+    htag_needed = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        verbose_name_plural = 'rewrite history'
+        indexes = [
+            # Keyset pagination walks (user, created_at, id) newest first
+            models.Index(fields=['user', '-created_at', '-id'], name='history_user_keyset_idx'),
+        ]
+
+    def __str__(self):
+        return f"Rewrite by user {self.user_id} at {self.created_at:%Y-%m-%d %H:%M}"
+
+    @classmethod
+    def build(cls, user, input_text, output_text, emoji_needed=False, htag_needed=False):
+        """Unsaved history entry with compressed texts, ready for a bulk insert"""
+        return cls(
+            user_id=user.pk,
+            created_at=timezone.now(),
+            input_data=zlib.compress(input_text.encode(), 6),
+            output_data=zlib.compress(output_text.encode(), 6),
+            emoji_needed=bool(emoji_needed),
+            htag_needed=bool(htag_needed),
+        )
+
+    @property
+    def input_text(self):
+        return zlib.decompress(bytes(self.input_data)).decode()
+
+    @property
+    def output_text(self):
+        return zlib.decompress(bytes(self.output_data)).decode()
+
+
+class ProviderCall(models.Model):
+    """Ledger entry for one provider call: tokens, latency and estimated cost"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='provider_calls'
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    provider = models.CharField(max_length=20)
+    model = models.CharField(max_length=100)
+    mode = models.CharField(max_length=20, default='post', help_text="post or paragraph")
+    emoji_needed = models.BooleanField(default=False)
+    htag_needed = models.BooleanField(default=False)
+    input_chars = models.PositiveIntegerField(default=0)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    cached_tokens = models.PositiveIntegerField(default=0)
+    thinking_tokens = models.PositiveIntegerField(default=0, help_text="Reasoning tokens, billed as output on top of completion tokens")
+    estimated_prompt_tokens = models.PositiveIntegerField(default=0, help_text="Local estimate made before the call")
+    max_tokens = models.PositiveIntegerField(default=0, help_text="Output token budget sent to the provider")
+    latency_ms = models.PositiveIntegerField(default=0)
+    estimated_cost = models.DecimalField(max_digits=12, decimal_places=6, default=0)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='providercall_created_idx'),
+            models.Index(fields=['user', 'created_at'], name='providercall_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} call by user {self.user_id} ({self.prompt_tokens}+{self.completion_tokens} tokens)"
+
+
+class ExtensionRelease(models.Model):
+    """A published Chrome extension version, served to the extension by /api/extension/release/"""
+    version = models.CharField(max_length=50, unique=True, help_text="e.g. 2.0.1.1, as in manifest.json")
+    download_url = models.URLField(max_length=500)
+    release_notes = models.TextField(blank=True)
+    minimum_version = models.CharField(
+        max_length=50,
+        blank=True,
+        help_text="Installed versions older than this are told the update is required"
+    )
+    is_published = models.BooleanField(default=True)
+    published_at = models.DateTimeField(default=timezone.now)
+    github_release_id = models.BigIntegerField(null=True, blank=True, unique=True, editable=False)
+
+    class Meta:
+        ordering = ['-published_at', '-id']
+
+    def __str__(self):
+        return self.version
+
+
+class ProfileTrigger(models.TextChoices):
+    HEADER = 'header', 'Header'
+    QUERY = 'query', 'Query flag'
+    SAMPLE = 'sample', 'Sampled'
+
+
+class RequestProfile(models.Model):
+    """cProfile output and SQL of one profiled request, kept to the newest PROFILE_MAX_ROWS"""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='request_profiles'
+    )
+    created_at = models.DateTimeField(default=timezone.now)
+    trigger = models.CharField(max_length=10, choices=ProfileTrigger.choices)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.PositiveIntegerField()
+    query_count = models.PositiveIntegerField(default=0)
+    query_ms = models.PositiveIntegerField(default=0)
+    stats = models.TextField(blank=True, help_text="Functions by cumulative time")
+    queries = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms} ms)"
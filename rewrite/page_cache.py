@@ -0,0 +1,91 @@
+"""
+Full-page cache for anonymous GETs of the marketing pages.
+
+Anonymous landing and pricing pages are identical for every visitor, so the
+rendered bytes are cached under the request path and a deploy version, and
+served with ETag/Last-Modified so browsers can revalidate with a 304. Requests
+from signed-in users, or carrying flash messages, always render normally.
+"""
+import hashlib
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+def _compute_version():
+    """Digest of the static manifest and template mtimes, so a deploy starts a fresh cache"""
+    if settings.PAGE_CACHE_VERSION:
+        return settings.PAGE_CACHE_VERSION
+
+    digest = hashlib.sha256()
+    manifest = settings.STATIC_ROOT / "staticfiles.json"
+    if manifest.is_file():
+        digest.update(manifest.read_bytes())
+    template_dirs = [settings.BASE_DIR / "templates", settings.BASE_DIR / "rewrite" / "templates"]
+    for template_dir in template_dirs:
+        for path in sorted(template_dir.rglob("*.html")):
+            digest.update(f"{path}:{path.stat().st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+PAGE_CACHE_VERSION = _compute_version()
+
+
+def page_cache_key(request):
+    query = hashlib.sha256(request.META.get("QUERY_STRING", "").encode()).hexdigest()[:16]
+    return f"page:{PAGE_CACHE_VERSION}:{request.path}:{query}"
+
+
+def is_cacheable(request):
+    return (
+        settings.PAGE_CACHE_ENABLED
+        and request.method in ("GET", "HEAD")
+        and "messages" not in request.COOKIES
+        and not request.user.is_authenticated
+    )
+
+
+def _build_entry(response):
+    content = response.content
+    return {
+        "content": content,
+        "content_type": response["Content-Type"],
+        "etag": f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+        "last_modified": int(time.time()),
+    }
+
+
+def anonymous_page_cache(view):
+    """Serve anonymous GETs of `view` from the page cache, rendering on miss"""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_cacheable(request):
+            return view(request, *args, **kwargs)
+
+        key = page_cache_key(request)
+        entry = cache.get(key)
+        if entry is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming or response.cookies:
+                return response
+            entry = _build_entry(response)
+            cache.set(key, entry, settings.PAGE_CACHE_TTL)
+
+        response = get_conditional_response(
+            request, etag=entry["etag"], last_modified=entry["last_modified"]
+        )
+        if response is None:
+            response = HttpResponse(entry["content"], content_type=entry["content_type"])
+        response["ETag"] = entry["etag"]
+        response["Last-Modified"] = http_date(entry["last_modified"])
+        # Signed-in users get a different page, so shared caches must revalidate
+        response["Cache-Control"] = "no-cache"
+        patch_vary_headers(response, ("Cookie",))
+        return response
+
+    return wrapper
@@ -0,0 +1,125 @@
+"""
+On-demand request profiling.
+
+Staff users profile a single request by sending the PROFILE_HEADER header or
+adding the PROFILE_QUERY_PARAM flag to the URL, and PROFILE_SAMPLE_RATE can
+profile a fraction of all traffic. A profiled request runs under cProfile with
+every SQL statement timed, and the result is stored as a RequestProfile row
+(the table keeps the newest PROFILE_MAX_ROWS) for browsing in the admin. The
+row id is returned in the X-Profile-Id response header.
+
+Requests that are not profiled only pay for a header and query-string lookup,
+plus one random number when sampling is on. SQL is stored without parameters
+and paths without their query string, which can carry tokens or user input.
+"""
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from .models import ProfileTrigger, RequestProfile
+
+# cProfile allows one active profiler per interpreter
+_profiler_lock = threading.Lock()
+
+
+def profile_trigger(request):
+    """Why this request should be profiled, or None"""
+    if request.headers.get(settings.PROFILE_HEADER):
+        trigger = ProfileTrigger.HEADER
+    elif settings.PROFILE_QUERY_PARAM in request.GET:
+        trigger = ProfileTrigger.QUERY
+    else:
+        trigger = None
+
+    # The user is only loaded for flagged requests
+    if trigger and request.user.is_staff:
+        return trigger
+    if settings.PROFILE_SAMPLE_RATE and random.random() < settings.PROFILE_SAMPLE_RATE:
+        return ProfileTrigger.SAMPLE
+    return None
+
+
+class QueryRecorder:
+    """Database execute wrapper that times every statement"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.queries = []
+        self.count = 0
+        self.total_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.count += 1
+            self.total_ms += elapsed
+            if len(self.queries) < self.limit:
+                self.queries.append({"sql": sql, "ms": round(elapsed, 2), "many": many})
+
+
+def profile_request(request, get_response, trigger):
+    recorder = QueryRecorder(settings.PROFILE_MAX_QUERIES)
+    profiler = cProfile.Profile() if _profiler_lock.acquire(blocking=False) else None
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            if profiler:
+                profiler.enable()
+            try:
+                response = get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+    finally:
+        if profiler:
+            _profiler_lock.release()
+    duration_ms = (time.perf_counter() - started) * 1000
+
+    profile = save_profile(request, response, trigger, duration_ms, profiler, recorder)
+    response["X-Profile-Id"] = str(profile.pk)
+    return response
+
+
+def _stats_text(profiler):
+    if profiler is None:
+        return "Another request was being profiled at the same time; only SQL was captured."
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats("cumulative").print_stats(settings.PROFILE_TOP_FUNCTIONS)
+    return stream.getvalue()
+
+
+def save_profile(request, response, trigger, duration_ms, profiler, recorder):
+    user = getattr(request, "user", None)
+    profile = RequestProfile.objects.create(
+        user=user if user is not None and user.is_authenticated else None,
+        trigger=trigger,
+        method=request.method,
+        path=request.path[:500],
+        status_code=response.status_code,
+        duration_ms=round(duration_ms),
+        query_count=recorder.count,
+        query_ms=round(recorder.total_ms),
+        stats=_stats_text(profiler),
+        queries=recorder.queries,
+    )
+
+    # Keep only the newest rows
+    cutoff = (
+        RequestProfile.objects.order_by("-id")
+        .values_list("id", flat=True)[settings.PROFILE_MAX_ROWS:settings.PROFILE_MAX_ROWS + 1]
+        .first()
+    )
+    if cutoff is not None:
+        RequestProfile.objects.filter(id__lte=cutoff).delete()
+    return profile
@@ -0,0 +1,67 @@
+"""
+Prompt templates for the rewrite endpoints.
+
+Everything that is shared between requests (the system instruction and the
+rewrite guidelines) is kept in a byte-identical static prefix, and only the
+per-request options and post text follow it. The four option variants are
+compiled once at import, so building a prompt is a dict lookup and a concat.
+
+The prefix is about 100 tokens, well under the 1024-token minimum Azure and
+Gemini need before they cache a prompt prefix, so no provider-side caching is
+requested. The cached token counts providers report are still recorded in the
+ledger, and would show any saving if the prefix grows past that minimum.
+"""
+
+SYSTEM_INSTRUCTION = "You are an expert LinkedIn content writer who creates engaging, professional content with correct grammar."
+
+POST_GUIDELINES = """Rewrite the LinkedIn post given by the user according to these guidelines:
+- Maintain the original number of paragraphs and overall format
+- Use professional tone and indirect speech
+- Make the content clear, precise, and engaging
+- Rewrite any questions in a more professional manner
+- Provide only the rewritten text without quotation marks or surrounding blank lines
+- Follow the post options given with the post"""
+
+PARAGRAPH_GUIDELINES = """Rewrite the paragraph of a LinkedIn post given by the user according to these guidelines:
+- Return exactly one paragraph with no blank lines
+- Use professional tone and indirect speech
+- Make the content clear, precise, and engaging
+- Rewrite any questions in a more professional manner
+- Provide only the rewritten text without quotation marks or surrounding blank lines
+- Follow the paragraph options given with the paragraph"""
+
+# Static prefixes sent as the system prompt; never format request data into these
+POST_SYSTEM_PROMPT = f"{SYSTEM_INSTRUCTION}\n\n{POST_GUIDELINES}"
+PARAGRAPH_SYSTEM_PROMPT = f"{SYSTEM_INSTRUCTION}\n\n{PARAGRAPH_GUIDELINES}"
+
+EMOJI_OPTIONS = {
+    True: "- Include appropriate emojis to enhance engagement",
+    False: "- Do not include emojis",
+}
+HASHTAG_OPTIONS = {
+    True: "- Add relevant hashtags to increase visibility",
+    False: "- Do not include hashtags",
+}
+
+
+def _compile_variants(heading, text_label):
+    return {
+        (emoji, htag): f"{heading}\n{EMOJI_OPTIONS[emoji]}\n{HASHTAG_OPTIONS[htag]}\n\n{text_label}:\n"
+        for emoji in (True, False)
+        for htag in (True, False)
+    }
+
+
+# The four option variants, compiled once at import
+POST_PROMPT_VARIANTS = _compile_variants("Post options:", "Original post")
+PARAGRAPH_PROMPT_VARIANTS = _compile_variants("Paragraph options:", "Original paragraph")
+
+
+def build_post_prompt(post, emoji_needed, htag_needed):
+    """User message for a whole-post rewrite, to be sent after POST_SYSTEM_PROMPT"""
+    return POST_PROMPT_VARIANTS[bool(emoji_needed), bool(htag_needed)] + post
+
+
+def build_paragraph_prompt(paragraph, emoji_needed, htag_needed):
+    """User message for a single paragraph, to be sent after PARAGRAPH_SYSTEM_PROMPT"""
+    return PARAGRAPH_PROMPT_VARIANTS[bool(emoji_needed), bool(htag_needed)] + paragraph
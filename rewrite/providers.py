@@ -0,0 +1,245 @@
+"""
+AI provider clients used by the rewrite views.
+
+The provider is picked once at import time from AI_PROVIDER ("azure" or "google").
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+import httpx
+from dotenv import load_dotenv
+from django.conf import settings
+from django.core.cache import cache
+from .deadlines import DeadlineExceeded
+from .ledger import record_provider_call
+from .tokens import estimate_prompt_tokens
+
+logger = logging.getLogger(__name__)
+
+
+load_dotenv(".env")
+
+AI_PROVIDER = os.getenv("AI_PROVIDER", "google").lower()
+
+if AI_PROVIDER == "azure":
+    from openai import APIConnectionError, AzureOpenAI
+
+    api_key = os.getenv("AZURE_OPENAI_API_KEY")
+    api_version = os.getenv("API_VERSION")
+    azure_endpoint = os.getenv("AZURE_API_ENDPOINT")
+    deployment_name = os.getenv("DEPLOYMENT_MODEL")
+
+    client = AzureOpenAI(
+        api_key=api_key, api_version=api_version, azure_endpoint=azure_endpoint
+    )
+    # Raised for connection failures and timeouts (APITimeoutError is a subclass)
+    TRANSPORT_ERRORS = (APIConnectionError, TimeoutError, ConnectionError)
+elif AI_PROVIDER == "google":
+    from google import genai
+    from google.genai.types import GenerateContentConfig, HttpOptions, ThinkingConfig
+
+    google_client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    google_model = os.getenv("GOOGLE_MODEL", "gemini-3-flash-preview")
+    # The SDK lets httpx connection errors and timeouts through unwrapped
+    TRANSPORT_ERRORS = (httpx.TransportError, TimeoutError, ConnectionError)
+else:
+    raise ValueError(f"Unsupported AI_PROVIDER: {AI_PROVIDER}. Use 'azure' or 'google'.")
+
+
+class ProviderUnavailable(Exception):
+    """Raised instead of calling the provider while its circuit is open"""
+
+
+class EmptyCompletion(Exception):
+    """Raised when the provider answers without any text, e.g. after spending the budget on thinking
+
+    The provider is healthy, so this is not counted as a circuit failure.
+    """
+
+
+class CircuitBreaker:
+    """Stops calling the provider after repeated failures, shared by all workers through the cache
+
+    The circuit opens once PROVIDER_CIRCUIT_FAILURES calls fail within
+    PROVIDER_CIRCUIT_WINDOW seconds, and closes again after
+    PROVIDER_CIRCUIT_RESET_TIMEOUT seconds, letting the next call probe the provider.
+    """
+
+    def __init__(self, name):
+        self.failures_key = f"circuit:{name}:failures"
+        self.open_key = f"circuit:{name}:open"
+
+    def is_open(self):
+        return cache.get(self.open_key) is not None
+
+    def state(self):
+        return "open" if self.is_open() else "closed"
+
+    def record_failure(self):
+        cache.add(self.failures_key, 0, timeout=settings.PROVIDER_CIRCUIT_WINDOW)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            # The window expired between add() and incr()
+            cache.set(self.failures_key, 1, timeout=settings.PROVIDER_CIRCUIT_WINDOW)
+            failures = 1
+        if failures >= settings.PROVIDER_CIRCUIT_FAILURES:
+            cache.set(self.open_key, time.time(), timeout=settings.PROVIDER_CIRCUIT_RESET_TIMEOUT)
+            cache.delete(self.failures_key)
+            logger.warning("%s circuit opened after %d failures", AI_PROVIDER, failures)
+
+
+provider_circuit = CircuitBreaker(AI_PROVIDER)
+
+
+def is_provider_failure(error):
+    """Whether an error says the provider is unhealthy rather than that the request was bad
+
+    Transport errors, timeouts, rate limiting and 5xx responses count towards the
+    circuit; other 4xx responses (invalid requests, content filtering, a bad
+    candidate count) only fail the request that caused them.
+    """
+    if isinstance(error, TRANSPORT_ERRORS):
+        return True
+    # openai's APIStatusError carries status_code, google.genai's APIError carries code
+    status = getattr(error, "status_code", getattr(error, "code", None))
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+@dataclass
+class Completion:
+    """Generated text plus the token usage reported by the provider"""
+    text: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    # Reasoning tokens, billed as output but not part of completion_tokens
+    thinking_tokens: int = 0
+    latency_ms: int = 0
+    # Every alternative returned by the call; text is the first one
+    candidates: list = field(default_factory=list)
+
+
+def generate(system_instruction, user_prompt, max_tokens=1000, context=None, deadline=None, candidates=1):
+    """Send one prompt to the configured provider and return a Completion
+
+    The system instruction is the static part of the prompt and goes first. When
+    a ledger CallContext is given, the call's token usage, latency and cost are
+    recorded for that user.
+    A Deadline bounds the provider request and raises DeadlineExceeded once spent.
+    Asking for several candidates returns them all from a single provider call.
+    Raises EmptyCompletion when the provider answers without any text.
+    """
+    if provider_circuit.is_open():
+        raise ProviderUnavailable(f"{AI_PROVIDER} provider is temporarily unavailable")
+
+    timeout = None
+    if deadline is not None:
+        deadline.check()
+        timeout = deadline.remaining()
+
+    started = time.monotonic()
+    try:
+        completion = _call_provider(
+            system_instruction, user_prompt, max_tokens, timeout=timeout, candidates=candidates
+        )
+    except Exception as e:
+        if deadline is not None and deadline.expired():
+            # The client's time ran out, which says nothing about provider health
+            raise DeadlineExceeded(str(e)) from e
+        if is_provider_failure(e):
+            provider_circuit.record_failure()
+        raise
+    completion.latency_ms = int((time.monotonic() - started) * 1000)
+
+    estimated_tokens = estimate_prompt_tokens(system_instruction, user_prompt)
+    if context is not None:
+        # Recorded even when empty: the tokens were spent and show whether the budget fits
+        record_provider_call(AI_PROVIDER, context, completion, estimated_tokens, max_tokens)
+
+    logger.info(
+        "%s completion: prompt_tokens=%d (estimated %d) cached_tokens=%d completion_tokens=%d/%d thinking_tokens=%d latency_ms=%d",
+        completion.model,
+        completion.prompt_tokens,
+        estimated_tokens,
+        completion.cached_tokens,
+        completion.completion_tokens,
+        max_tokens,
+        completion.thinking_tokens,
+        completion.latency_ms,
+    )
+    if not completion.text:
+        raise EmptyCompletion(f"{completion.model} returned no text")
+    return completion
+
+
+def _call_provider(system_instruction, user_prompt, max_tokens, timeout=None, candidates=1):
+    if AI_PROVIDER == "azure":
+        chat_messages = [
+            {"role": "system", "content": system_instruction},
+            {"role": "user", "content": user_prompt},
+        ]
+        azure_client = client.with_options(timeout=timeout, max_retries=0) if timeout else client
+        response = azure_client.chat.completions.create(
+            messages=chat_messages,
+            model=deployment_name,
+            max_tokens=max_tokens,
+            temperature=0.7,
+            response_format={"type": "text"},
+            n=candidates,
+        )
+        usage = response.usage
+        details = getattr(usage, "prompt_tokens_details", None) if usage else None
+        output_details = getattr(usage, "completion_tokens_details", None) if usage else None
+        reasoning_tokens = (getattr(output_details, "reasoning_tokens", None) or 0) if output_details else 0
+        # Content is None when a choice was filtered or cut off before any text
+        texts = [text for text in ((choice.message.content or "").strip() for choice in response.choices) if text]
+        completion = Completion(
+            text=texts[0] if texts else "",
+            model=response.model or deployment_name,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=(usage.completion_tokens - reasoning_tokens) if usage else 0,
+            cached_tokens=(getattr(details, "cached_tokens", None) or 0) if details else 0,
+            thinking_tokens=reasoning_tokens,
+            candidates=texts,
+        )
+    else:
+        thinking = None
+        if settings.GOOGLE_THINKING_LEVEL:
+            thinking = ThinkingConfig(thinking_level=settings.GOOGLE_THINKING_LEVEL.upper())
+            # Thoughts come out of max_output_tokens, leaving the rest for the rewrite
+            max_tokens += settings.GOOGLE_THINKING_TOKENS
+        config = GenerateContentConfig(
+            system_instruction=system_instruction,
+            max_output_tokens=max_tokens,
+            temperature=0.7,
+            candidate_count=candidates,
+            thinking_config=thinking,
+            http_options=HttpOptions(timeout=max(1, int(timeout * 1000))) if timeout else None,
+        )
+        response = google_client.models.generate_content(
+            model=google_model,
+            contents=user_prompt,
+            config=config,
+        )
+        usage = response.usage_metadata
+        # A candidate that hit MAX_TOKENS while thinking has no text parts
+        texts = [
+            text for text in (
+                "".join(part.text or "" for part in candidate.content.parts if not part.thought).strip()
+                for candidate in response.candidates or []
+                if candidate.content and candidate.content.parts
+            ) if text
+        ]
+        completion = Completion(
+            text=texts[0] if texts else "",
+            model=google_model,
+            prompt_tokens=(usage.prompt_token_count or 0) if usage else 0,
+            completion_tokens=(usage.candidates_token_count or 0) if usage else 0,
+            cached_tokens=(usage.cached_content_token_count or 0) if usage else 0,
+            thinking_tokens=(usage.thoughts_token_count or 0) if usage else 0,
+            candidates=texts,
+        )
+    return completion
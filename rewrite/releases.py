@@ -0,0 +1,56 @@
+"""
+Extension release metadata.
+
+The extension used to ask the GitHub API for the latest release on every
+LinkedIn page load, which runs into GitHub's per-IP rate limit for offices
+behind one NAT. It now asks /api/extension/release/, which is answered from a
+cached copy of the newest published ExtensionRelease with an ETag and a
+Cache-Control max-age, so browsers mostly revalidate with a 304 or skip the
+request. Rows are edited in the admin or synced from GitHub by
+`manage.py refresh_extension_release`; both refresh the cached copy. That
+reaches every worker only through a shared cache: with the per-process
+LocMemCache fallback the copy is instead kept for at most
+EXTENSION_RELEASE_MAX_AGE, so workers pick up a change within one browser
+cache lifetime.
+"""
+import hashlib
+import json
+from django.conf import settings
+from django.core.cache import cache
+from .models import ExtensionRelease
+
+RELEASE_CACHE_KEY = "extension:release"
+
+
+def build_release_entry():
+    release = ExtensionRelease.objects.filter(is_published=True).first()
+    payload = {"version": None}
+    if release is not None:
+        payload = {
+            "version": release.version,
+            "downloadUrl": release.download_url,
+            "notes": release.release_notes,
+            "minimumVersion": release.minimum_version or None,
+            "publishedAt": release.published_at.isoformat(),
+        }
+    content = json.dumps(payload).encode()
+    return {
+        "content": content,
+        "etag": f'"{hashlib.sha256(content).hexdigest()[:32]}"',
+        "last_modified": int(release.published_at.timestamp()) if release else None,
+    }
+
+
+def refresh_release_cache():
+    """Rebuild the cached copy from the database; called whenever a release changes"""
+    entry = build_release_entry()
+    timeout = settings.EXTENSION_RELEASE_CACHE_TTL
+    if not settings.CACHE_IS_SHARED:
+        timeout = min(timeout, settings.EXTENSION_RELEASE_MAX_AGE)
+    cache.set(RELEASE_CACHE_KEY, entry, timeout)
+    return entry
+
+
+def get_release_entry():
+    # Also caches "no release yet", so an empty table costs no queries either
+    return cache.get(RELEASE_CACHE_KEY) or refresh_release_cache()
@@ -0,0 +1,160 @@
+"""
+Query-count and latency budgets for the hot views.
+
+Every view is driven through the test client under a query budget and a
+wall-time ceiling, and the queries it ran are collected into a report printed
+at the end of the run (and written as JSON to $PERF_REPORT when set). Budgets
+are the current counts: when a change needs more queries, raise the budget in
+the same commit and say why.
+
+Wall-time ceilings are deliberately loose and can be scaled for slow machines
+with PERF_TIME_SCALE.
+"""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from unittest.mock import patch
+from django.contrib import admin
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from .providers import Completion
+from .tests import PASSWORD, BaseRewriteTestCase
+
+TIME_SCALE = float(os.getenv("PERF_TIME_SCALE", 1))
+
+# Changelists that need more than the default 5 queries (session, user, count, rows, ...)
+ADMIN_CHANGELIST_BUDGETS = {
+    "accounts.OutboxEmail": 6,
+    "subscriptions.Payment": 7,
+    # Filter choices, date hierarchy and the cost totals
+    "rewrite.ProviderCall": 10,
+}
+
+# Filled by every budget check, reported once after all classes have run
+REPORT = []
+
+
+def print_report():
+    if not REPORT:
+        return
+    width = max(len(entry["view"]) for entry in REPORT)
+    lines = ["", "Queries per view:"]
+    for entry in REPORT:
+        lines.append(
+            f"  {entry['view']:<{width}}  {entry['queries']:>3} / {entry['budget']:<3} queries  {entry['ms']:>7.1f} ms"
+        )
+    sys.stderr.write("\n".join(lines) + "\n")
+    path = os.getenv("PERF_REPORT")
+    if path:
+        with open(path, "w") as f:
+            json.dump(REPORT, f, indent=2)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class PerformanceBudgetTestCase(BaseRewriteTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        print_report()
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user("budget@example.com")
+
+    @contextmanager
+    def budget(self, view, queries, ms=500):
+        """Fail when the block runs more than `queries` queries or takes longer than `ms`"""
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            yield
+            elapsed = (time.perf_counter() - started) * 1000
+        REPORT.append({
+            "view": view,
+            "queries": len(captured),
+            "budget": queries,
+            "ms": round(elapsed, 1),
+            "sql": [query["sql"] for query in captured.captured_queries],
+        })
+        executed = "\n".join(f"  {query['sql']}" for query in captured.captured_queries)
+        self.assertLessEqual(
+            len(captured), queries, f"{view} ran {len(captured)} queries, budget is {queries}:\n{executed}"
+        )
+        self.assertLess(elapsed, ms * TIME_SCALE, f"{view} took {elapsed:.0f} ms, ceiling is {ms * TIME_SCALE:.0f} ms")
+
+    def login(self):
+        self.client.force_login(self.user)
+        # Create the subscription and today's usage row outside the measured request
+        self.client.get(reverse("rewrite:dashboard"))
+
+    def test_anonymous_pages(self):
+        for name in ("rewrite:index", "rewrite:pricing"):
+            with self.budget(f"{name} (anonymous, cold)", 0):
+                self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+            with self.budget(f"{name} (anonymous, cached)", 0, ms=50):
+                self.client.get(reverse(name))
+
+    def test_extension_release(self):
+        url = reverse("rewrite:extension_release")
+        with self.budget("rewrite:extension_release (cold)", 1):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        with self.budget("rewrite:extension_release (cached)", 0, ms=50):
+            self.client.get(url)
+
+    def test_signed_in_pages(self):
+        self.login()
+        with self.budget("rewrite:index", 4):
+            self.assertEqual(self.client.get(reverse("rewrite:index")).status_code, 200)
+        with self.budget("rewrite:dashboard", 5):
+            self.assertEqual(self.client.get(reverse("rewrite:dashboard")).status_code, 200)
+        with self.budget("rewrite:pricing", 3):
+            self.assertEqual(self.client.get(reverse("rewrite:pricing")).status_code, 200)
+        with self.budget("rewrite:history", 4):
+            self.assertEqual(self.client.get(reverse("rewrite:history")).status_code, 200)
+        # The first call caches the plan; after that only the session and user are read
+        with self.budget("rewrite:usage_api (cold)", 3):
+            self.assertEqual(self.client.get(reverse("rewrite:usage_api")).status_code, 200)
+        with self.budget("rewrite:usage_api", 2):
+            self.assertEqual(self.client.get(reverse("rewrite:usage_api")).status_code, 200)
+
+    def test_rewrite_api_with_stub_provider(self):
+        self.login()
+        payload = {"postInput": "A post that is long enough to rewrite.", "emojiNeeded": False, "htagNeeded": False}
+        with patch("rewrite.providers._call_provider", return_value=Completion("Rewritten post", "stub-model")):
+            # Session, user, throttle window, usage, subscription, API counter and usage update
+            with self.budget("rewrite:rewrite", 18):
+                response = self.client.post(reverse("rewrite:rewrite"), payload, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_login_and_signup(self):
+        with self.budget("accounts:login (GET)", 0):
+            self.client.get(reverse("accounts:login"))
+        with self.budget("accounts:login (POST)", 9):
+            response = self.client.post(
+                reverse("accounts:login"), {"username": "budget@example.com", "password": PASSWORD}
+            )
+        self.assertEqual(response.status_code, 302)
+        self.client.logout()
+
+        with self.budget("accounts:signup (GET)", 0):
+            self.client.get(reverse("accounts:signup"))
+        with self.budget("accounts:signup (POST)", 16):
+            response = self.client.post(reverse("accounts:signup"), {
+                "email": "new@example.com", "first_name": "New", "last_name": "User",
+                "timezone": "UTC", "password1": "An0ther-s3cret!", "password2": "An0ther-s3cret!",
+            })
+        self.assertEqual(response.status_code, 302)
+
+    def test_admin_changelists(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+        for model in admin.site._registry:
+            name = f"admin:{model._meta.app_label}_{model._meta.model_name}_changelist"
+            with self.subTest(model=model._meta.label):
+                budget = ADMIN_CHANGELIST_BUDGETS.get(model._meta.label, 5)
+                with self.budget(name, budget, ms=1000):
+                    self.assertEqual(self.client.get(reverse(name)).status_code, 200)
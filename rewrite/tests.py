@@ -1,7 +1,54 @@
-from django.test import TestCase, Client
+import json
+import os
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, Client, RequestFactory, override_settings
 from django.urls import reverse
+from unittest.mock import patch
+from google.genai import errors as genai_errors
+from google.genai import types as genai_types
 from rest_framework import status
-from .models import APICounter
+from accounts.authentication import mint_extension_token
+from accounts.models import CustomUser
+from . import health
+from .admission import AdmissionRejected, AdmissionScheduler
+from .deadlines import Deadline
+from .decorations import decorate
+from .history import history_writer, record_rewrite
+from .incremental import rewrite_incrementally, use_incremental_rewrite
+from .ledger import CallContext, estimate_cost, ledger_writer
+from .models import APICounter, ExtensionRelease, ProviderCall, RequestProfile, RewriteHistory, ThrottleWindow
+from .prompts import POST_PROMPT_VARIANTS, POST_SYSTEM_PROMPT, build_post_prompt
+from .providers import Completion, EmptyCompletion, ProviderUnavailable, generate, provider_circuit
+from .throttling import SlidingWindowRateThrottle
+from .tiered_cache import LocalLRU, TieredRedisCache, _MISSING
+from .tokens import estimate_tokens
+
+PASSWORD = "s3cret-pass!"
+
+
+@override_settings(BUFFERED_WRITES_ASYNC=False)
+class BaseRewriteTestCase(TestCase):
+    """Starts every test with an empty cache and writes buffered rows before the test's rollback"""
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        # Write queued rows inside this test's transaction so they don't leak into other tests
+        history_writer.flush()
+        ledger_writer.flush()
+
+    def create_user(self, email, **extra_fields):
+        return CustomUser.objects.create_user(
+            username=email, email=email, password=PASSWORD, email_verified=True, **extra_fields
+        )
 
 
 class RewriteAPITestCase(TestCase):
@@ -39,3 +86,772 @@ class RewriteAPITestCase(TestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["success"], False)
+
+
+class SlidingWindowThrottleTestCase(TestCase):
+    def make_throttle(self, now):
+        class Throttle(SlidingWindowRateThrottle):
+            rate = "3/min"
+
+            def get_cache_key(self, request, view):
+                return "throttle_test_client"
+
+        throttle = Throttle()
+        throttle.timer = lambda: now
+        return throttle
+
+    def test_limit_within_window(self):
+        results = [self.make_throttle(600 + i).allow_request(None, None) for i in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+        throttle = self.make_throttle(605)
+        self.assertFalse(throttle.allow_request(None, None))
+        self.assertEqual(throttle.wait(), 55)
+
+    def test_previous_window_is_weighted(self):
+        for i in range(3):
+            self.assertTrue(self.make_throttle(600 + i).allow_request(None, None))
+        # 1/3 into the next window, the previous 3 hits still weigh 2
+        self.assertTrue(self.make_throttle(680).allow_request(None, None))
+        self.assertFalse(self.make_throttle(681).allow_request(None, None))
+        # Near the end of the window the previous hits have mostly slid out
+        self.assertTrue(self.make_throttle(715).allow_request(None, None))
+
+    def test_keeps_two_windows_per_client(self):
+        for now in (600, 660, 720, 780):
+            self.make_throttle(now).allow_request(None, None)
+        self.assertEqual(
+            sorted(ThrottleWindow.objects.values_list("window", flat=True)), [12, 13]
+        )
+
+
+def fake_generate(system_instruction, user_prompt, **kwargs):
+    """Stub provider that upper-cases the last line of the prompt"""
+    return Completion(text=user_prompt.rsplit("\n", 1)[-1].upper(), model="stub")
+
+
+@override_settings(INCREMENTAL_MIN_PARAGRAPHS=3, INCREMENTAL_MIN_CHARS=20)
+class IncrementalRewriteTestCase(BaseRewriteTestCase):
+    def test_only_changed_paragraphs_are_rewritten(self):
+        post = "First paragraph.\n\nSecond paragraph.\n\n\nThird paragraph."
+        self.assertTrue(use_incremental_rewrite(post, True))
+        self.assertFalse(use_incremental_rewrite("Short post.\n\nTwo paragraphs.", True))
+
+        with patch("rewrite.incremental.generate", side_effect=fake_generate) as generate:
+            result = rewrite_incrementally(post, False, True)
+        self.assertEqual(result, "FIRST PARAGRAPH.\n\nSECOND PARAGRAPH.\n\n\nTHIRD PARAGRAPH.")
+        self.assertEqual(generate.call_count, 3)
+        # Only the last paragraph asks for hashtags
+        prompts = {call.args[1].rsplit("\n", 1)[-1]: call.args[1] for call in generate.call_args_list}
+        self.assertIn("Add relevant hashtags", prompts["Third paragraph."])
+        self.assertIn("Do not include hashtags", prompts["First paragraph."])
+
+        edited = post.replace("Second", "Edited second")
+        with patch("rewrite.incremental.generate", side_effect=fake_generate) as generate:
+            result = rewrite_incrementally(edited, False, True)
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual(result, "FIRST PARAGRAPH.\n\nEDITED SECOND PARAGRAPH.\n\n\nTHIRD PARAGRAPH.")
+
+    @override_settings(
+        ADMISSION_ENABLED=True,
+        ADMISSION_MAX_CONCURRENT=1,
+        ADMISSION_QUEUE_SIZE={"premium": 8, "free": 8},
+        INCREMENTAL_MAX_WORKERS=3,
+    )
+    def test_paragraph_calls_are_admitted_one_by_one(self):
+        lock = threading.Lock()
+        calls = {"active": 0, "peak": 0}
+
+        def slow_generate(system_instruction, user_prompt, **kwargs):
+            with lock:
+                calls["active"] += 1
+                calls["peak"] = max(calls["peak"], calls["active"])
+            time.sleep(0.02)
+            with lock:
+                calls["active"] -= 1
+            return fake_generate(system_instruction, user_prompt)
+
+        scheduler = AdmissionScheduler()
+        with patch("rewrite.incremental.admission", scheduler), \
+                patch("rewrite.incremental.generate", side_effect=slow_generate):
+            rewrite_incrementally("First paragraph.\n\nSecond paragraph.\n\nThird paragraph.", False, False)
+        self.assertEqual(calls["peak"], 1)
+        self.assertEqual(scheduler.snapshot()["plans"]["free"]["admitted"], 3)
+
+
+class PromptTemplateTestCase(TestCase):
+    def test_variants_share_static_prefix_and_end_with_post(self):
+        self.assertEqual(len(POST_PROMPT_VARIANTS), 4)
+        prompt = build_post_prompt("My post text.", True, False)
+        self.assertTrue(prompt.endswith("Original post:\nMy post text."))
+        self.assertIn("- Include appropriate emojis", prompt)
+        self.assertIn("- Do not include hashtags", prompt)
+        self.assertNotIn("  ", POST_SYSTEM_PROMPT + prompt)
+
+
+@override_settings(HISTORY_PAGE_SIZE=2)
+class RewriteHistoryTestCase(BaseRewriteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user("history@example.com")
+
+    def test_entries_are_buffered_and_compressed(self):
+        record_rewrite(self.user, "Original post " * 50, "Rewritten post", True, False)
+        self.assertEqual(RewriteHistory.objects.count(), 0)
+        history_writer.flush()
+
+        entry = RewriteHistory.objects.get()
+        self.assertLess(len(entry.input_data), len("Original post " * 50))
+        self.assertEqual(entry.input_text, "Original post " * 50)
+        self.assertEqual(entry.output_text, "Rewritten post")
+
+    @override_settings(BUFFERED_WRITES_BATCH_SIZE=2)
+    def test_full_batch_is_written_inline(self):
+        record_rewrite(self.user, "Post 1", "Rewrite 1", False, False)
+        self.assertEqual(RewriteHistory.objects.count(), 0)
+        record_rewrite(self.user, "Post 2", "Rewrite 2", False, False)
+        self.assertEqual(RewriteHistory.objects.count(), 2)
+
+    def test_keyset_pagination_walks_all_entries(self):
+        for i in range(5):
+            record_rewrite(self.user, f"Post {i}", f"Rewrite {i}", False, False)
+        history_writer.flush()
+
+        self.client.force_login(self.user)
+        outputs, cursor = [], None
+        for _ in range(3):
+            params = {"cursor": cursor} if cursor else {}
+            data = self.client.get(reverse("rewrite:history_api"), params).json()
+            outputs += [entry["output"] for entry in data["results"]]
+            cursor = data["next_cursor"]
+        self.assertEqual(outputs, [f"Rewrite {i}" for i in reversed(range(5))])
+        self.assertIsNone(cursor)
+
+        response = self.client.get(reverse("rewrite:history_api"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_history_page(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("rewrite:history"))
+        self.assertContains(response, "No rewrites yet.")
+
+
+class AnonymousPageCacheTestCase(BaseRewriteTestCase):
+    def test_anonymous_pages_are_served_from_cache(self):
+        for name, template in [("rewrite:index", "rewrite/landing.html"), ("rewrite:pricing", "rewrite/pricing_modern.html")]:
+            with self.assertTemplateUsed(template):
+                first = self.client.get(reverse(name))
+            with self.assertTemplateNotUsed(template):
+                second = self.client.get(reverse(name))
+            self.assertEqual(first.content, second.content)
+            self.assertEqual(first["ETag"], second["ETag"])
+
+            response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(response.status_code, 304)
+
+    @override_settings(SECURE_SSL_REDIRECT=True)
+    def test_warm_page_cache_follows_https_redirect_settings(self):
+        call_command("warm_page_cache", stdout=StringIO())
+        with self.assertTemplateNotUsed("rewrite/landing.html"):
+            self.client.get(reverse("rewrite:index"), secure=True)
+
+        with patch("rewrite.management.commands.warm_page_cache.WARM_URLS", ["rewrite:dashboard"]):
+            with self.assertRaises(CommandError):
+                call_command("warm_page_cache", stdout=StringIO())
+
+    def test_signed_in_users_bypass_cache(self):
+        self.client.get(reverse("rewrite:pricing"))
+        user = self.create_user("cache@example.com")
+        self.client.force_login(user)
+        with self.assertTemplateUsed("rewrite/pricing_modern.html"):
+            response = self.client.get(reverse("rewrite:pricing"))
+        self.assertNotIn("ETag", response)
+
+
+class HealthCheckTestCase(BaseRewriteTestCase):
+    def setUp(self):
+        super().setUp()
+        health._readiness["result"] = None
+
+    def test_healthz_skips_database(self):
+        with self.assertNumQueries(0):
+            response = self.client.get("/healthz")
+        self.assertEqual(response.json(), {"status": "ok"})
+
+    def test_readyz_reports_dependencies_and_caches_result(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/readyz")
+        self.assertEqual(response.status_code, 200)
+        checks = response.json()["checks"]
+        self.assertTrue(checks["database"]["ok"])
+        self.assertTrue(checks["cache"]["ok"])
+        self.assertEqual(checks["provider"]["circuit"], "closed")
+
+        with self.assertNumQueries(0):
+            self.client.get("/readyz/")
+
+    @override_settings(PROVIDER_CIRCUIT_FAILURES=2)
+    def test_provider_circuit_opens_after_failures(self):
+        with patch("rewrite.providers._call_provider", side_effect=TimeoutError("slow provider")) as call:
+            for _ in range(2):
+                with self.assertRaises(TimeoutError):
+                    generate("system", "prompt")
+            with self.assertRaises(ProviderUnavailable):
+                generate("system", "prompt")
+        self.assertEqual(call.call_count, 2)
+        self.assertEqual(provider_circuit.state(), "open")
+
+    @override_settings(PROVIDER_CIRCUIT_FAILURES=2)
+    def test_rejected_requests_do_not_open_the_circuit(self):
+        for code in (400, 403):
+            with patch("rewrite.providers._call_provider", side_effect=genai_errors.ClientError(code, {})):
+                for _ in range(2):
+                    with self.assertRaises(genai_errors.ClientError):
+                        generate("system", "prompt")
+        self.assertEqual(provider_circuit.state(), "closed")
+
+        with patch("rewrite.providers._call_provider", side_effect=genai_errors.ClientError(429, {})):
+            for _ in range(2):
+                with self.assertRaises(genai_errors.ClientError):
+                    generate("system", "prompt")
+        self.assertEqual(provider_circuit.state(), "open")
+
+    @override_settings(PROVIDER_CIRCUIT_FAILURES=1)
+    def test_server_errors_open_the_circuit(self):
+        with patch("rewrite.providers._call_provider", side_effect=genai_errors.ServerError(503, {})):
+            with self.assertRaises(genai_errors.ServerError):
+                generate("system", "prompt")
+        self.assertEqual(provider_circuit.state(), "open")
+
+
+@override_settings(PROVIDER_PRICING={"test-model": [1.0, 0.25, 4.0]})
+class ProviderCallLedgerTestCase(BaseRewriteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user("ledger@example.com", is_staff=True, is_superuser=True)
+
+    def test_estimate_cost_uses_model_pricing(self):
+        # 1000 uncached input, 1000 cached input and 500 output tokens
+        self.assertEqual(estimate_cost("test-model", 2000, 1000, 500), Decimal("0.00325"))
+
+    def test_generate_records_buffered_call(self):
+        completion = Completion("Rewritten", model="test-model", prompt_tokens=2000, completion_tokens=500, cached_tokens=1000)
+        with patch("rewrite.providers._call_provider", return_value=completion):
+            generate("system", "prompt", context=CallContext(self.user, True, False, input_chars=42))
+        self.assertFalse(ProviderCall.objects.exists())
+
+        ledger_writer.flush()
+        call = ProviderCall.objects.get()
+        self.assertEqual(call.user, self.user)
+        self.assertEqual((call.mode, call.emoji_needed, call.htag_needed, call.input_chars), ("post", True, False, 42))
+        self.assertEqual(call.cached_tokens, 1000)
+        self.assertEqual(float(call.estimated_cost), 0.00325)
+
+    @override_settings(GOOGLE_THINKING_LEVEL="low", GOOGLE_THINKING_TOKENS=1024)
+    def test_thinking_only_answer_raises_and_is_recorded(self):
+        response = genai_types.GenerateContentResponse(
+            candidates=[genai_types.Candidate(
+                content=genai_types.Content(parts=[genai_types.Part(text="Planning the rewrite", thought=True)]),
+                finish_reason="MAX_TOKENS",
+            )],
+            usage_metadata=genai_types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=100, candidates_token_count=0, thoughts_token_count=1324
+            ),
+        )
+        with patch("rewrite.providers.google_client") as client:
+            client.models.generate_content.return_value = response
+            with self.assertRaises(EmptyCompletion):
+                generate("system", "prompt", max_tokens=300, context=CallContext(self.user))
+
+        config = client.models.generate_content.call_args.kwargs["config"]
+        self.assertEqual(config.max_output_tokens, 300 + 1024)
+        self.assertEqual(config.thinking_config.thinking_level, genai_types.ThinkingLevel.LOW)
+        self.assertEqual(provider_circuit.state(), "closed")
+        ledger_writer.flush()
+        call = ProviderCall.objects.get()
+        self.assertEqual((call.completion_tokens, call.thinking_tokens, call.max_tokens), (0, 1324, 300))
+
+    def test_empty_rewrite_returns_502_without_charging_usage(self):
+        self.client.force_login(self.user)
+        with patch("rewrite.providers._call_provider", return_value=Completion("", "test-model")):
+            response = self.client.post(
+                reverse("rewrite:rewrite"),
+                {"postInput": "A post that is long enough to rewrite.", "emojiNeeded": False, "htagNeeded": False},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 502)
+        self.assertFalse(self.user.usage_records.filter(count__gt=0).exists())
+
+    def test_admin_rollup(self):
+        ProviderCall.objects.create(user=self.user, provider="google", model="test-model", prompt_tokens=10, estimated_cost="0.5")
+        ProviderCall.objects.create(user=self.user, provider="google", model="test-model", input_chars=2000, estimated_cost="0.25")
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("admin:rewrite_providercall_changelist"))
+        self.assertEqual(response.context["totals"]["calls"], 2)
+
+        response = self.client.get(reverse("admin:rewrite_providercall_cost_rollup"), {"days": 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["by_user"])[0]["cost"], 0.75)
+        self.assertContains(response, "1500-2999 chars")
+
+
+@override_settings(
+    ADMISSION_ENABLED=True,
+    ADMISSION_MAX_CONCURRENT=1,
+    ADMISSION_WEIGHTS={"premium": 3, "free": 1},
+    ADMISSION_QUEUE_SIZE={"premium": 8, "free": 8},
+    ADMISSION_MAX_WAIT={"premium": 5, "free": 5},
+)
+class AdmissionSchedulerTestCase(BaseRewriteTestCase):
+    def test_premium_waiters_are_dequeued_ahead_of_free(self):
+        scheduler = AdmissionScheduler()
+        order = []
+
+        def worker(plan):
+            with scheduler.admit(plan):
+                order.append(plan)
+
+        with scheduler.admit("premium"):
+            threads = []
+            for plan in ["free"] * 4 + ["premium"] * 3:
+                thread = threading.Thread(target=worker, args=(plan,))
+                thread.start()
+                threads.append(thread)
+                # Queue the waiters in a known order
+                while sum(p["queued"] for p in scheduler.snapshot()["plans"].values()) < len(threads):
+                    time.sleep(0.001)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order, ["premium", "premium", "free", "premium", "free", "free", "free"])
+        snapshot = scheduler.snapshot()
+        self.assertEqual(snapshot["active"], 0)
+        self.assertEqual(snapshot["plans"]["free"]["admitted"], 4)
+        self.assertGreater(snapshot["plans"]["free"]["max_wait_ms"], 0)
+
+    @override_settings(ADMISSION_QUEUE_SIZE={"premium": 8, "free": 0}, ADMISSION_MAX_WAIT={"premium": 0.01, "free": 5})
+    def test_requests_are_shed_when_queue_is_full_or_wait_too_long(self):
+        scheduler = AdmissionScheduler()
+        with scheduler.admit("premium"):
+            with self.assertRaises(AdmissionRejected) as free:
+                with scheduler.admit("free"):
+                    pass
+            with self.assertRaises(AdmissionRejected) as premium:
+                with scheduler.admit("premium"):
+                    pass
+        self.assertEqual((free.exception.reason, free.exception.retry_after), ("queue full", 5))
+        self.assertEqual(premium.exception.reason, "queue timeout")
+        plans = scheduler.snapshot()["plans"]
+        self.assertEqual((plans["free"]["shed_queue_full"], plans["premium"]["shed_timeout"]), (1, 1))
+        self.assertEqual(plans["premium"]["queued"], 0)
+
+    def test_shed_rewrite_returns_503_with_retry_after(self):
+        user = self.create_user("busy@example.com")
+        self.client.force_login(user)
+        with patch("rewrite.views.admission.admit", side_effect=AdmissionRejected("free", "queue full", 5)):
+            response = self.client.post(
+                reverse("rewrite:rewrite"),
+                {"postInput": "A post that is long enough to rewrite.", "emojiNeeded": False, "htagNeeded": False},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "5")
+        self.assertFalse(user.usage_records.filter(count__gt=0).exists())
+
+
+@override_settings(REWRITE_DEADLINE_SECONDS=30, REWRITE_MAX_DEADLINE_SECONDS=60)
+class RequestDeadlineTestCase(BaseRewriteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user("deadline@example.com")
+        self.client.force_login(self.user)
+
+    def test_deadline_header_is_allowed_cross_origin(self):
+        response = self.client.options(
+            reverse("rewrite:rewrite"),
+            HTTP_ORIGIN="https://www.linkedin.com",
+            HTTP_ACCESS_CONTROL_REQUEST_METHOD="POST",
+            HTTP_ACCESS_CONTROL_REQUEST_HEADERS="authorization, content-type, x-request-deadline",
+        )
+        self.assertEqual(response["Access-Control-Allow-Origin"], "https://www.linkedin.com")
+        self.assertIn("x-request-deadline", response["Access-Control-Allow-Headers"].split(", "))
+
+    def test_header_shortens_deadline_up_to_the_cap(self):
+        factory = RequestFactory()
+        self.assertEqual(Deadline.from_request(factory.get("/")).seconds, 30)
+        self.assertEqual(Deadline.from_request(factory.get("/", HTTP_X_REQUEST_DEADLINE="5")).seconds, 5)
+        self.assertEqual(Deadline.from_request(factory.get("/", HTTP_X_REQUEST_DEADLINE="600")).seconds, 60)
+        self.assertEqual(Deadline.from_request(factory.get("/", HTTP_X_REQUEST_DEADLINE="soon")).seconds, 30)
+
+    def test_provider_timeout_follows_deadline(self):
+        with patch("rewrite.providers._call_provider", return_value=Completion("ok", "test-model")) as call:
+            generate("system", "prompt", deadline=Deadline(10))
+        self.assertTrue(0 < call.call_args.kwargs["timeout"] <= 10)
+
+    def test_timed_out_rewrite_returns_504_without_charging_usage(self):
+        def slow_provider(system_instruction, user_prompt, max_tokens, timeout=None, **kwargs):
+            time.sleep(timeout)
+            raise TimeoutError("provider timed out")
+
+        with patch("rewrite.providers._call_provider", side_effect=slow_provider):
+            response = self.client.post(
+                reverse("rewrite:rewrite"),
+                {"postInput": "A post that is long enough to rewrite.", "emojiNeeded": False, "htagNeeded": False},
+                content_type="application/json",
+                HTTP_X_REQUEST_DEADLINE="0.05",
+            )
+        self.assertEqual(response.status_code, 504)
+        self.assertFalse(self.user.usage_records.filter(count__gt=0).exists())
+        self.assertFalse(self.user.rewrite_history.exists())
+        self.assertEqual(provider_circuit.state(), "closed")
+
+
+@override_settings(REWRITE_MAX_CANDIDATES=3, REWRITE_CANDIDATE_QUOTA="request")
+class MultiCandidateRewriteTestCase(BaseRewriteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user("variants@example.com")
+        self.client.force_login(self.user)
+        self.payload = {
+            "postInput": "A post that is long enough to rewrite.",
+            "emojiNeeded": False,
+            "htagNeeded": False,
+            "candidates": 3,
+        }
+
+    def rewrite(self, **changes):
+        return self.client.post(
+            reverse("rewrite:rewrite"), {**self.payload, **changes}, content_type="application/json"
+        )
+
+    def used(self):
+        return self.user.usage_records.get().count
+
+    def test_candidates_come_from_one_cached_provider_call(self):
+        completion = Completion("First", "test-model", candidates=["First", "Second", "Third"])
+        with patch("rewrite.providers._call_provider", return_value=completion) as call:
+            first = self.rewrite().json()
+            second = self.rewrite().json()
+
+        self.assertEqual(call.call_count, 1)
+        self.assertEqual(call.call_args.kwargs["candidates"], 3)
+        self.assertEqual(first["candidates"], ["First", "Second", "Third"])
+        self.assertEqual(first["rewriteAI"], "First")
+        self.assertEqual(second["candidates"], first["candidates"])
+        self.assertTrue(second["cached"])
+        self.assertEqual(self.used(), 1)
+
+    @override_settings(REWRITE_CANDIDATE_QUOTA="candidate")
+    def test_per_candidate_quota_accounting(self):
+        completion = Completion("First", "test-model", candidates=["First", "Second"])
+        with patch("rewrite.providers._call_provider", return_value=completion):
+            self.rewrite(candidates=2)
+        self.assertEqual(self.used(), 2)
+
+        self.user.usage_records.update(count=19)
+        response = self.rewrite(candidates=2, postInput="Another post that is long enough.")
+        self.assertEqual(response.status_code, 429)
+
+    def test_paid_set_is_returned_after_the_quota_runs_out(self):
+        completion = Completion("First", "test-model", candidates=["First", "Second", "Third"])
+        with patch("rewrite.providers._call_provider", return_value=completion):
+            self.rewrite()
+        self.user.usage_records.update(count=20)
+
+        response = self.rewrite()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["cached"])
+        self.assertEqual(self.used(), 20)
+        self.assertEqual(self.rewrite(postInput="Another post that is long enough.").status_code, 429)
+
+    def test_page_asks_for_alternatives_only_on_demand(self):
+        response = self.client.get(reverse("rewrite:index"))
+        self.assertContains(response, "requestRewrite(text, emojiNeeded, 1)")
+        self.assertContains(response, f"const maxCandidates = {settings.REWRITE_MAX_CANDIDATES};")
+
+    def test_rejects_too_many_candidates(self):
+        self.assertEqual(self.rewrite(candidates=4).status_code, 400)
+        self.assertEqual(self.rewrite(candidates="many").status_code, 400)
+
+
+class TokenBudgetTestCase(BaseRewriteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user("tokens@example.com")
+        self.client.force_login(self.user)
+
+    def rewrite(self, post):
+        return self.client.post(
+            reverse("rewrite:rewrite"),
+            {"postInput": post, "emojiNeeded": False, "htagNeeded": False},
+            content_type="application/json",
+        )
+
+    @override_settings(REWRITE_TOKEN_ESTIMATE_MARGIN=1.0)
+    def test_estimate_tracks_tokenizer_counts(self):
+        # 10 tokens with the GPT-4 tokenizer
+        self.assertEqual(estimate_tokens("The quick brown fox jumps over the lazy dog."), 10)
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertGreater(estimate_tokens("互联网" * 10), estimate_tokens("internet " * 10))
+
+    def test_output_budget_scales_with_the_input(self):
+        with patch("rewrite.providers._call_provider", return_value=Completion("Short", "test-model")) as call:
+            short = self.rewrite("A post that is long enough to rewrite.").json()
+            long = self.rewrite("A much longer post about shipping software. " * 60).json()
+
+        budgets = [args.args[2] for args in call.call_args_list]
+        self.assertEqual(budgets[0], settings.REWRITE_MIN_OUTPUT_TOKENS)
+        self.assertGreater(budgets[1], budgets[0])
+        self.assertLessEqual(budgets[1], settings.REWRITE_MAX_OUTPUT_TOKENS)
+        self.assertEqual(short["tokens"]["outputBudget"], budgets[0])
+        self.assertGreater(long["tokens"]["input"], short["tokens"]["input"])
+
+        ledger_writer.flush()
+        rows = ProviderCall.objects.order_by("id")
+        self.assertEqual([row.max_tokens for row in rows], budgets)
+        self.assertTrue(all(row.estimated_prompt_tokens > 0 for row in rows))
+
+    @override_settings(REWRITE_MAX_INPUT_TOKENS=50)
+    def test_oversized_post_is_rejected_before_the_provider(self):
+        with patch("rewrite.providers._call_provider") as call:
+            response = self.rewrite("A much longer post about shipping software. " * 20)
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json()["tokens"]["limit"], 50)
+        call.assert_not_called()
+        self.assertFalse(self.user.usage_records.filter(count__gt=0).exists())
+
+
+@override_settings(LOCAL_DECORATIONS=True)
+class LocalDecorationTestCase(BaseRewriteTestCase):
+    post = (
+        "I have joined Acme as a software engineer on the cloud team.\n\n"
+        "We run Kubernetes clusters for every product."
+    )
+
+    def test_decorations_follow_the_text(self):
+        decorated = decorate(self.post, True, True)
+        self.assertTrue(decorated.startswith("I have joined Acme"))
+        self.assertIn("#CloudComputing", decorated.splitlines()[-1])
+        self.assertIn("☁️", decorated)
+        self.assertEqual(decorate(self.post, True, True), decorated)
+        self.assertEqual(decorate(self.post, False, False), self.post)
+        self.assertNotIn("#", decorate(self.post, True, False))
+
+    def test_existing_hashtags_are_not_repeated(self):
+        decorated = decorate(self.post + " #cloudcomputing", False, True)
+        self.assertNotIn("#CloudComputing", decorated)
+
+    def test_provider_is_asked_for_plain_text(self):
+        user = self.create_user("decorate@example.com")
+        self.client.force_login(user)
+        with patch("rewrite.providers._call_provider", return_value=Completion(self.post, "test-model")) as call:
+            response = self.client.post(
+                reverse("rewrite:rewrite"),
+                {"postInput": self.post, "emojiNeeded": True, "htagNeeded": True},
+                content_type="application/json",
+            )
+
+        prompt = call.call_args.args[1]
+        self.assertIn("Do not include emojis", prompt)
+        self.assertIn("Do not include hashtags", prompt)
+        self.assertIn("#CloudComputing", response.json()["rewriteAI"])
+
+
+class ExtensionReleaseTestCase(BaseRewriteTestCase):
+    def test_release_is_served_from_cache_with_etag(self):
+        ExtensionRelease.objects.create(
+            version="2.1.0", download_url="https://example.com/linkedrite-2.1.0.zip", minimum_version="2.0.0"
+        )
+        ExtensionRelease.objects.create(
+            version="2.2.0", download_url="https://example.com/draft.zip", is_published=False
+        )
+        url = reverse("rewrite:extension_release")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["version"], "2.1.0")
+        self.assertEqual(response.json()["minimumVersion"], "2.0.0")
+        self.assertIn("max-age=", response["Cache-Control"])
+
+        with self.assertNumQueries(0):
+            revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    @override_settings(EXTENSION_RELEASE_MAX_AGE=0)
+    def test_releases_from_other_processes_show_up_without_a_shared_cache(self):
+        url = reverse("rewrite:extension_release")
+        self.assertIsNone(self.client.get(url).json()["version"])
+        # Published by the refresh command, whose per-process cache this worker never sees
+        ExtensionRelease.objects.create(version="2.1.0", download_url="https://example.com/linkedrite-2.1.0.zip")
+        self.assertEqual(self.client.get(url).json()["version"], "2.1.0")
+
+    def test_admin_changes_refresh_the_cached_copy(self):
+        url = reverse("rewrite:extension_release")
+        self.assertIsNone(self.client.get(url).json()["version"])
+
+        admin_user = CustomUser.objects.create_superuser(
+            username="admin@example.com", email="admin@example.com", password=PASSWORD
+        )
+        self.client.force_login(admin_user)
+        self.client.post(reverse("admin:rewrite_extensionrelease_add"), {
+            "version": "3.0.0",
+            "download_url": "https://example.com/linkedrite-3.0.0.zip",
+            "release_notes": "",
+            "minimum_version": "",
+            "is_published": "on",
+            "published_at_0": "2026-01-01",
+            "published_at_1": "00:00:00",
+        })
+        self.client.logout()
+        self.assertEqual(self.client.get(url).json()["version"], "3.0.0")
+
+
+class UsageAPITestCase(BaseRewriteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user("quota@example.com")
+        _, token = mint_extension_token(self.user)
+        self.auth = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+
+    def test_polling_is_answered_from_the_cache(self):
+        url = reverse("rewrite:usage_api")
+        first = self.client.get(url, **self.auth)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual((first.json()["used"], first.json()["limit"], first.json()["remaining"]), (0, 20, 20))
+
+        with self.assertNumQueries(0):
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"], **self.auth)
+        self.assertEqual(again.status_code, 304)
+
+    def test_etag_changes_when_a_rewrite_is_charged(self):
+        url = reverse("rewrite:usage_api")
+        etag = self.client.get(url, **self.auth)["ETag"]
+        with patch("rewrite.providers._call_provider", return_value=Completion("Rewritten post", "test-model")):
+            self.client.post(
+                reverse("rewrite:rewrite"),
+                {"postInput": "A post that is long enough to rewrite.", "emojiNeeded": False, "htagNeeded": False},
+                content_type="application/json",
+                **self.auth,
+            )
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["remaining"], 19)
+
+    @override_settings(UNSHARED_CACHE_TTL=0)
+    def test_increments_from_other_workers_show_up_without_a_shared_cache(self):
+        url = reverse("rewrite:usage_api")
+        self.client.get(url, **self.auth)
+        # Charged by another worker, whose per-process cache this one never sees
+        self.user.usage_records.update(count=5)
+        self.assertEqual(self.client.get(url, **self.auth).json()["used"], 5)
+
+    def test_requires_login(self):
+        self.assertEqual(self.client.get(reverse("rewrite:usage_api")).status_code, 401)
+
+
+class SQLiteBenchmarkTestCase(TestCase):
+    def test_production_profile_has_no_lock_errors(self):
+        out = StringIO()
+        call_command("benchmark_sqlite", "--workers", "2", "--duration", "0.3", "--profile", "production", stdout=out)
+        self.assertIn("production:", out.getvalue())
+        self.assertIn(" 0 locked errors", out.getvalue())
+
+
+class TieredCacheTestCase(TestCase):
+    def make_backend(self, channel):
+        backend = TieredRedisCache("redis://localhost:6390/0", {
+            "OPTIONS": {"LOCAL_TTL": 60, "LOCAL_MAX_ENTRIES": 2, "LOCAL_KEY_PREFIXES": ["plan:"], "INVALIDATION_CHANNEL": channel},
+        })
+        # Stand in for a subscribed listener; there is no Redis server in the test environment
+        backend.tier._listener_pid = os.getpid()
+        backend.tier.subscribed = True
+        return backend
+
+    def test_hot_keys_are_served_from_the_local_tier(self):
+        backend = self.make_backend("test:hot")
+        with patch.object(RedisCache, "get", return_value="PREMIUM") as remote:
+            self.assertEqual(backend.get("plan:1"), "PREMIUM")
+            self.assertEqual(backend.get("plan:1"), "PREMIUM")
+            backend.get("usage:1")
+            backend.get("usage:1")
+        self.assertEqual(remote.call_count, 3)
+
+        stats = backend.stats()
+        self.assertEqual((stats["local_hits"], stats["redis_hits"]), (1, 1))
+        self.assertEqual(stats["local_hit_rate"], 0.5)
+
+    def test_writes_and_broadcasts_invalidate_local_copies(self):
+        backend = self.make_backend("test:invalidate")
+        with patch.object(RedisCache, "get", return_value="FREE"), \
+                patch.object(RedisCache, "set"), \
+                patch.object(backend, "_publish") as publish:
+            backend.get("plan:1")
+            backend.set("plan:1", "PREMIUM")
+            publish.assert_called_once_with({"keys": [backend.make_key("plan:1")]})
+            self.assertEqual(len(backend.tier.lru), 0)
+
+            backend.get("plan:2")
+            backend.tier.handle_invalidation(json.dumps({"origin": backend.tier.origin, "keys": [backend.make_key("plan:2")]}))
+            self.assertEqual(len(backend.tier.lru), 1)
+            backend.tier.handle_invalidation(json.dumps({"origin": "another-worker", "keys": [backend.make_key("plan:2")]}))
+            self.assertEqual(len(backend.tier.lru), 0)
+
+    def test_local_tier_is_bounded(self):
+        lru = LocalLRU(2)
+        lru.set("a", 1, 60)
+        lru.set("b", 2, 60)
+        lru.get("a")
+        lru.set("c", 3, 60)
+        self.assertIs(lru.get("b"), _MISSING)
+        self.assertEqual((lru.get("a"), lru.get("c")), (1, 3))
+        lru.set("d", 4, -1)
+        self.assertIs(lru.get("d"), _MISSING)
+
+
+class RequestProfilerTestCase(BaseRewriteTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = self.create_user("staff@example.com", is_staff=True)
+
+    def test_staff_header_profiles_the_request(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("rewrite:dashboard"), HTTP_X_PROFILE="1")
+
+        profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual((profile.trigger, profile.path, profile.user), ("header", "/dashboard/", self.staff))
+        self.assertGreater(profile.query_count, 0)
+        self.assertEqual(len(profile.queries), profile.query_count)
+        self.assertIn("cumulative", profile.stats)
+
+    def test_query_string_is_not_stored(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("rewrite:dashboard") + "?_profile=1&token=secret")
+
+        profile = RequestProfile.objects.get(pk=response["X-Profile-Id"])
+        self.assertEqual((profile.trigger, profile.path), ("query", "/dashboard/"))
+
+    def test_flags_from_other_users_are_ignored(self):
+        user = self.create_user("plain@example.com")
+        self.client.force_login(user)
+        response = self.client.get(reverse("rewrite:dashboard") + "?_profile=1", HTTP_X_PROFILE="1")
+        self.assertNotIn("X-Profile-Id", response)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(PROFILE_SAMPLE_RATE=1.0, PROFILE_MAX_ROWS=2)
+    def test_sampled_profiles_are_capped(self):
+        for _ in range(3):
+            self.client.get(reverse("rewrite:pricing"))
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        self.assertEqual(set(RequestProfile.objects.values_list("trigger", flat=True)), {"sample"})
+
+    def test_admin_shows_profile_and_sql(self):
+        self.staff.is_superuser = True
+        self.staff.save()
+        self.client.force_login(self.staff)
+        profile_id = self.client.get(reverse("rewrite:dashboard"), HTTP_X_PROFILE="1")["X-Profile-Id"]
+
+        response = self.client.get(reverse("admin:rewrite_requestprofile_change", args=[profile_id]))
+        self.assertContains(response, "cumulative")
+        self.assertContains(response, "SELECT")
@@ -0,0 +1,149 @@
+"""
+Sliding-window counter throttles shared across every worker.
+
+DRF's SimpleRateThrottle keeps a list of every request timestamp per client and
+pickles it through the cache on each call, and with LocMemCache every worker
+has its own history. These throttles keep only two counters per client (the
+current and previous fixed window) and weight the previous one by how much of
+it still overlaps the sliding window. Counters live in Redis and are updated
+atomically by a Lua script; without Redis they fall back to the database.
+"""
+import logging
+import math
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from rest_framework.throttling import AnonRateThrottle, SimpleRateThrottle, UserRateThrottle
+from .models import ThrottleWindow
+
+logger = logging.getLogger(__name__)
+
+
+SLIDING_WINDOW_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+if previous * tonumber(ARGV[2]) + current + 1 > tonumber(ARGV[1]) then
+    return {0, current, previous}
+end
+current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return {1, current, previous}
+"""
+
+
+class RedisWindowStore:
+    """Window counters kept in Redis, checked and incremented in one round trip"""
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(SLIDING_WINDOW_SCRIPT)
+
+    def hit(self, key, window, limit, weight, duration):
+        allowed, current, previous = self.script(
+            keys=[f"{key}:{window}", f"{key}:{window - 1}"],
+            args=[limit, repr(weight), duration * 2],
+        )
+        return bool(allowed), int(current), int(previous)
+
+
+class DatabaseWindowStore:
+    """Window counters kept in ThrottleWindow rows, two per client at most"""
+
+    def hit(self, key, window, limit, weight, duration):
+        with transaction.atomic():
+            counts = dict(
+                ThrottleWindow.objects.select_for_update()
+                .filter(key=key, window__in=[window - 1, window])
+                .values_list('window', 'count')
+            )
+            current = counts.get(window, 0)
+            previous = counts.get(window - 1, 0)
+            if previous * weight + current + 1 > limit:
+                return False, current, previous
+
+            updated = ThrottleWindow.objects.filter(key=key, window=window).update(
+                count=F('count') + 1
+            )
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        ThrottleWindow.objects.create(key=key, window=window, count=1)
+                except IntegrityError:
+                    ThrottleWindow.objects.filter(key=key, window=window).update(
+                        count=F('count') + 1
+                    )
+                # First hit of a new window, drop the counters it replaced
+                ThrottleWindow.objects.filter(key=key, window__lt=window - 1).delete()
+        return True, current + 1, previous
+
+
+_redis_store = None
+_database_store = DatabaseWindowStore()
+
+
+def get_window_store():
+    """Redis store when THROTTLE_REDIS_URL is configured, database store otherwise"""
+    global _redis_store
+    if settings.THROTTLE_REDIS_URL:
+        if _redis_store is None:
+            _redis_store = RedisWindowStore(settings.THROTTLE_REDIS_URL)
+        return _redis_store
+    return _database_store
+
+
+class SlidingWindowRateThrottle(SimpleRateThrottle):
+    """SimpleRateThrottle replacement using a constant-memory sliding-window counter"""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        window = int(self.now // self.duration)
+        elapsed = (self.now - window * self.duration) / self.duration
+        weight = 1 - elapsed
+
+        store = get_window_store()
+        try:
+            allowed, current, previous = store.hit(
+                self.key, window, self.num_requests, weight, self.duration
+            )
+        except Exception as e:
+            if store is _database_store:
+                raise
+            logger.warning("Redis throttle unavailable, using database counters: %s", e)
+            allowed, current, previous = _database_store.hit(
+                self.key, window, self.num_requests, weight, self.duration
+            )
+
+        if not allowed:
+            self.wait_seconds = self._seconds_until_allowed(current, previous, elapsed)
+        return allowed
+
+    def _seconds_until_allowed(self, current, previous, elapsed):
+        remaining = (1 - elapsed) * self.duration
+        if current + 1 > self.num_requests:
+            # The current window alone is full, wait for it to roll over
+            return math.ceil(remaining)
+        # Wait until enough of the previous window has slid out
+        needed_weight = (self.num_requests - current - 1) / previous
+        return math.ceil(max(0.0, (1 - elapsed - needed_weight) * self.duration))
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
+
+
+class SlidingWindowAnonRateThrottle(SlidingWindowRateThrottle, AnonRateThrottle):
+    scope = 'anon'
+
+
+class SlidingWindowUserRateThrottle(SlidingWindowRateThrottle, UserRateThrottle):
+    scope = 'user'
@@ -0,0 +1,286 @@
+"""
+Two-tier cache backend: a bounded per-process LRU in front of Redis.
+
+Hot keys that rarely change (plans, cached pages, circuit state, extension
+release) would otherwise cost a Redis round trip on every lookup. Keys matching
+LOCAL_KEY_PREFIXES are also kept in a small LRU in each worker for LOCAL_TTL
+seconds. Every write through this backend drops the key locally and publishes
+it on a Redis pub/sub channel, and each worker's listener thread drops it from
+its own LRU, so other workers stop serving the old value straight away. The
+local tier is only used while the listener is subscribed; until then, and after
+a lost connection, every lookup goes to Redis.
+
+Per-tier hit counts are exposed by stats() and reported on /readyz.
+"""
+import json
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.redis import RedisCache
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """Thread-safe LRU of pickled values with a per-entry expiry"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, payload = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+        # Each hit gets its own copy, as with any other cache backend
+        return pickle.loads(payload)
+
+    def set(self, key, value, ttl):
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LocalTier:
+    """The LRU, hit counters and invalidation listener shared by one process
+
+    Django creates a cache backend instance per thread, so this state lives
+    outside the backend to give each worker process a single LRU and listener.
+    """
+
+    def __init__(self, max_entries):
+        self.lru = LocalLRU(max_entries)
+        self.origin = uuid.uuid4().hex
+        self.subscribed = False
+        self._counts = Counter()
+        self._counts_lock = threading.Lock()
+        self._listener_pid = None
+        self._listener_lock = threading.Lock()
+
+    def count(self, name, amount=1):
+        with self._counts_lock:
+            self._counts[name] += amount
+
+    def ensure_listener(self, get_client, channel):
+        if self._listener_pid == os.getpid():
+            return
+        with self._listener_lock:
+            if self._listener_pid == os.getpid():
+                return
+            # After a fork the listener thread and the parent's entries belong to the parent
+            self._listener_pid = os.getpid()
+            self.subscribed = False
+            self.lru.clear()
+            threading.Thread(
+                target=self._listen, args=(get_client, channel), name="cache-invalidation", daemon=True
+            ).start()
+
+    def _listen(self, get_client, channel):
+        while True:
+            try:
+                pubsub = get_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(channel)
+                # Anything published while we were not subscribed was missed
+                self.lru.clear()
+                self.subscribed = True
+                for message in pubsub.listen():
+                    self.handle_invalidation(message["data"])
+            except Exception:
+                logger.warning("Cache invalidation listener lost its connection", exc_info=True)
+            self.subscribed = False
+            time.sleep(1)
+
+    def handle_invalidation(self, data):
+        message = json.loads(data)
+        if message.get("origin") == self.origin:
+            return
+        self.count("invalidations")
+        if message.get("clear"):
+            self.lru.clear()
+        else:
+            self.lru.discard(message.get("keys", []))
+
+    def stats(self):
+        """Per-tier hit counts and rates for this process's lookups of local-tier keys"""
+        with self._counts_lock:
+            counts = dict(self._counts)
+        local_hits = counts.get("local_hits", 0)
+        redis_hits = counts.get("redis_hits", 0)
+        misses = counts.get("misses", 0)
+        lookups = local_hits + redis_hits + misses
+        return {
+            "subscribed": self.subscribed,
+            "local_entries": len(self.lru),
+            "local_hits": local_hits,
+            "redis_hits": redis_hits,
+            "misses": misses,
+            "invalidations": counts.get("invalidations", 0),
+            "local_hit_rate": round(local_hits / lookups, 3) if lookups else None,
+            "redis_hit_rate": round(redis_hits / (redis_hits + misses), 3) if redis_hits + misses else None,
+        }
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+def local_tier(location, channel, max_entries):
+    with _tiers_lock:
+        key = (location, channel)
+        if key not in _tiers:
+            _tiers[key] = LocalTier(max_entries)
+        return _tiers[key]
+
+
+class TieredRedisCache(RedisCache):
+    """Django's RedisCache with a per-process LRU for keys under LOCAL_KEY_PREFIXES"""
+
+    def __init__(self, server, params):
+        params = dict(params)
+        options = dict(params.get("OPTIONS", {}))
+        self.local_ttl = float(options.pop("LOCAL_TTL", 5))
+        self.local_prefixes = tuple(prefix for prefix in options.pop("LOCAL_KEY_PREFIXES", ()) if prefix)
+        self.channel = options.pop("INVALIDATION_CHANNEL", "cache:invalidate")
+        max_entries = int(options.pop("LOCAL_MAX_ENTRIES", 1000))
+        # A django-redis option that Django's own Redis client does not accept
+        options.pop("CLIENT_CLASS", None)
+        params["OPTIONS"] = options
+        super().__init__(server, params)
+        self.tier = local_tier(str(server), self.channel, max_entries)
+
+    def _is_local(self, key):
+        return not self.local_prefixes or key.startswith(self.local_prefixes)
+
+    def _local_enabled(self):
+        self.tier.ensure_listener(self._cache.get_client, self.channel)
+        return self.tier.subscribed
+
+    # Reads
+
+    def get(self, key, default=None, version=None):
+        if not (self._is_local(key) and self._local_enabled()):
+            return super().get(key, default, version)
+
+        full_key = self.make_and_validate_key(key, version=version)
+        value = self.tier.lru.get(full_key)
+        if value is not _MISSING:
+            self.tier.count("local_hits")
+            return value
+
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            self.tier.count("misses")
+            return default
+        self.tier.count("redis_hits")
+        self.tier.lru.set(full_key, value, self.local_ttl)
+        return value
+
+    def get_many(self, keys, version=None):
+        local_keys = {key: self.make_and_validate_key(key, version=version) for key in keys if self._is_local(key)}
+        if not (local_keys and self._local_enabled()):
+            return super().get_many(keys, version)
+
+        found = {}
+        for key, full_key in local_keys.items():
+            value = self.tier.lru.get(full_key)
+            if value is not _MISSING:
+                found[key] = value
+        self.tier.count("local_hits", len(found))
+
+        remote = [key for key in keys if key not in found]
+        if remote:
+            fetched = super().get_many(remote, version)
+            for key in remote:
+                if key not in local_keys:
+                    continue
+                if key in fetched:
+                    self.tier.count("redis_hits")
+                    self.tier.lru.set(local_keys[key], fetched[key], self.local_ttl)
+                else:
+                    self.tier.count("misses")
+            found.update(fetched)
+        return found
+
+    # Writes go to Redis, then drop the key from every worker's LRU
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        super().set(key, value, timeout, version)
+        self._invalidate([key], version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = super().add(key, value, timeout, version)
+        if added:
+            self._invalidate([key], version)
+        return added
+
+    def delete(self, key, version=None):
+        deleted = super().delete(key, version)
+        self._invalidate([key], version)
+        return deleted
+
+    def incr(self, key, delta=1, version=None):
+        value = super().incr(key, delta, version)
+        self._invalidate([key], version)
+        return value
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = super().set_many(data, timeout, version)
+        self._invalidate(list(data), version)
+        return failed
+
+    def delete_many(self, keys, version=None):
+        super().delete_many(keys, version)
+        self._invalidate(list(keys), version)
+
+    def clear(self):
+        cleared = super().clear()
+        self.tier.lru.clear()
+        self._publish({"clear": True})
+        return cleared
+
+    def _invalidate(self, keys, version):
+        full_keys = [self.make_and_validate_key(key, version=version) for key in keys if self._is_local(key)]
+        if full_keys:
+            self.tier.lru.discard(full_keys)
+            self._publish({"keys": full_keys})
+
+    def _publish(self, message):
+        try:
+            self._cache.get_client(write=True).publish(
+                self.channel, json.dumps({"origin": self.tier.origin, **message})
+            )
+        except Exception:
+            # Other workers fall back on LOCAL_TTL for this key
+            logger.warning("Could not publish cache invalidation", exc_info=True)
+
+    def stats(self):
+        return self.tier.stats()
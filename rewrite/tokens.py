@@ -0,0 +1,62 @@
+"""
+Local token estimation for rewrite requests.
+
+Counting tokens with the provider would cost a network round trip per request,
+so text is split locally the way BPE tokenizers pre-split it (words, digit
+groups, punctuation, whitespace) and each piece is priced by its length and
+script. This tracks the provider's count closely for English prose, and
+REWRITE_TOKEN_ESTIMATE_MARGIN adds headroom for other text.
+
+The estimate caps the input size and sizes the output token budget, so short
+posts stop reserving a large budget and long pastes are rejected up front.
+"""
+import math
+import re
+from functools import lru_cache
+from django.conf import settings
+
+# Leading space belongs to the following word, as in GPT-style tokenizers
+PIECES = re.compile(r" ?[^\W\d_]+| ?\d{1,3}|\s+|[^\w\s]", re.UNICODE)
+
+
+def _piece_tokens(piece):
+    word = piece.strip()
+    if not word:
+        return 1
+    if word.isascii():
+        if word.isalpha():
+            # Common words are a single token, longer ones split into ~4 character chunks
+            return 1 if len(word) <= 6 else math.ceil(len(word) / 4)
+        return 1
+    if len(word) == 1:
+        # Emoji and symbols outside ASCII usually take two or three byte-level tokens
+        return 1 if word.isalpha() else 2
+    # Accented Latin and Cyrillic split into short chunks, CJK is about one token per character
+    if all(ord(char) < 0x2E80 for char in word):
+        return math.ceil(len(word) / 3)
+    return len(word)
+
+
+def estimate_tokens(text):
+    """Estimated provider token count for text"""
+    estimate = sum(_piece_tokens(piece) for piece in PIECES.findall(text))
+    return math.ceil(estimate * settings.REWRITE_TOKEN_ESTIMATE_MARGIN)
+
+
+@lru_cache(maxsize=16)
+def _static_prompt_tokens(prompt):
+    return estimate_tokens(prompt)
+
+
+def estimate_prompt_tokens(system_instruction, user_prompt):
+    """Estimate for a full request; the static system prompts are only tokenized once"""
+    return _static_prompt_tokens(system_instruction) + estimate_tokens(user_prompt)
+
+
+def output_budget(input_tokens, ceiling=None):
+    """max_tokens for a rewrite of input_tokens tokens
+
+    A rewrite is about as long as its input, plus room for emojis and hashtags.
+    """
+    budget = math.ceil(input_tokens * settings.REWRITE_OUTPUT_TOKEN_RATIO) + settings.REWRITE_OUTPUT_TOKEN_OVERHEAD
+    return max(settings.REWRITE_MIN_OUTPUT_TOKENS, min(budget, ceiling or settings.REWRITE_MAX_OUTPUT_TOKENS))
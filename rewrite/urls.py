@@ -8,6 +8,10 @@ urlpatterns = [
     path("", views.index, name="index"),
     path("rewrite/", views.RewriteAPI.as_view(), name="rewrite"),
     path("dashboard/", views.dashboard, name="dashboard"),
+    path("history/", views.history, name="history"),
+    path("api/history/", views.RewriteHistoryAPI.as_view(), name="history_api"),
+    path("api/usage/", views.UsageAPI.as_view(), name="usage_api"),
+    path("api/extension/release/", views.extension_release, name="extension_release"),
     path("pricing/", views.pricing, name="pricing"),
     path("upgrade/", views.upgrade_plan, name="upgrade_plan"),
 ]
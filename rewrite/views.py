@@ -1,47 +1,43 @@
 from django.shortcuts import render, redirect
-import os
-from dotenv import load_dotenv
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.http import require_GET
 import json
 from .models import APICounter
-from rest_framework.throttling import UserRateThrottle
+from .throttling import SlidingWindowUserRateThrottle
+from .providers import EmptyCompletion, ProviderUnavailable, generate
+from .prompts import POST_SYSTEM_PROMPT, build_post_prompt
+from .history import InvalidCursor, get_history_page, record_rewrite
+from .page_cache import anonymous_page_cache
+from .ledger import CallContext
+from .admission import AdmissionRejected, admission, plan_for
+from .deadlines import Deadline, DeadlineExceeded
+from .tokens import estimate_tokens, output_budget
+from .decorations import decorate, prompt_options
+from .releases import get_release_entry
+from .candidates import (
+    cache_candidates,
+    candidate_cache_key,
+    get_cached_candidates,
+    quota_units,
+    requested_candidates,
+)
+from .incremental import use_incremental_rewrite, rewrite_incrementally
 from rest_framework.decorators import throttle_classes
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from subscriptions.models import UsageTracking, Subscription, SubscriptionPlan
+from subscriptions.models import UsageTracking, Subscription, SubscriptionPlan, get_usage_summary
 from django.utils import timezone
+from django.conf import settings
 import pytz
 from datetime import datetime, timedelta
 
 
-load_dotenv(".env")
-
-AI_PROVIDER = os.getenv("AI_PROVIDER", "google").lower()
-
-if AI_PROVIDER == "azure":
-    from openai import AzureOpenAI
-
-    api_key = os.getenv("AZURE_OPENAI_API_KEY")
-    api_version = os.getenv("API_VERSION")
-    azure_endpoint = os.getenv("AZURE_API_ENDPOINT")
-    deployment_name = os.getenv("DEPLOYMENT_MODEL")
-
-    client = AzureOpenAI(
-        api_key=api_key, api_version=api_version, azure_endpoint=azure_endpoint
-    )
-elif AI_PROVIDER == "google":
-    from google import genai
-    from google.genai.types import GenerateContentConfig
-
-    google_client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
-    google_model = os.getenv("GOOGLE_MODEL", "gemini-3-flash-preview")
-else:
-    raise ValueError(f"Unsupported AI_PROVIDER: {AI_PROVIDER}. Use 'azure' or 'google'.")
-
-
 # Create your views here.
+@anonymous_page_cache
 def index(request):
     # Show landing page for non-authenticated users
     if not request.user.is_authenticated:
@@ -65,6 +61,8 @@ def index(request):
         'current_usage': usage.count,
         'daily_limit': subscription.get_daily_limit(),
         'can_use': usage.can_use(),
+        # Rewrites ask for one candidate; the rest are fetched on "more options"
+        'max_rewrite_candidates': settings.REWRITE_MAX_CANDIDATES,
     })
     
     return render(
@@ -104,7 +102,7 @@ def index(request):
 #     return JsonResponse({"success": False})
 
 
-@throttle_classes([UserRateThrottle])
+@throttle_classes([SlidingWindowUserRateThrottle])
 class RewriteAPI(APIView):
     def post(self, request):
         if not request.user.is_authenticated:
@@ -119,20 +117,16 @@ class RewriteAPI(APIView):
                 status=403,
             )
 
-        # Check usage limits
-        usage = UsageTracking.get_or_create_today(request.user)
-        if not usage.can_use():
-            subscription = getattr(request.user, 'subscription', None)
-            limit = subscription.get_daily_limit() if subscription else 20
+        try:
+            candidate_count = requested_candidates(request.data.get("candidates", 1))
+        except (TypeError, ValueError):
             return Response(
-                {
-                    "success": False, 
-                    "message": f"You've reached your daily limit of {limit} rewrites. Upgrade to Premium for unlimited rewrites!",
-                    "upgrade_url": "/pricing/"
-                },
-                status=429,
+                {"success": False, "message": f"candidates must be a number from 1 to {settings.REWRITE_MAX_CANDIDATES}."},
+                status=400,
             )
-        
+
+        usage = UsageTracking.get_or_create_today(request.user)
+
         counter, created = APICounter.objects.get_or_create(pk=1)
         counter.count += 1
         counter.save()
@@ -145,6 +139,18 @@ class RewriteAPI(APIView):
                 status=400,
             )
 
+        input_tokens = estimate_tokens(data["postInput"])
+        if input_tokens > settings.REWRITE_MAX_INPUT_TOKENS:
+            return Response(
+                {
+                    "success": False,
+                    "message": "The post is too long to rewrite. Please shorten it and try again.",
+                    "tokens": {"input": input_tokens, "limit": settings.REWRITE_MAX_INPUT_TOKENS},
+                },
+                status=413,
+            )
+        max_tokens = output_budget(input_tokens)
+
         # prompt = (
         #     "You are an expert LinkedIn content writer. Rewrite the following post to be more engaging, "
         #     "professional, and grammatically correct. Instructions:\n"
@@ -178,50 +184,116 @@ class RewriteAPI(APIView):
 
         # print("Prompt:", prompt)
 
-        system_instruction = "You are an expert LinkedIn content writer who creates engaging, professional content with correct grammar."
-
-        user_prompt = f"""Rewrite the following LinkedIn post according to these guidelines:
-        - Maintain the original number of paragraphs and overall format
-        - Use professional tone and indirect speech
-        - Make the content clear, precise, and engaging
-        - Rewrite any questions in a more professional manner
-        {"- Include appropriate emojis to enhance engagement" if data["emojiNeeded"] else ""}
-        {"- Add relevant hashtags to increase visibility" if data["htagNeeded"] else "- Do not include hashtags"}
-
-        Original post:
-        {data["postInput"]}"""
-
-        if AI_PROVIDER == "azure":
-            chat_messages = [
-                {"role": "system", "content": system_instruction},
-                {"role": "user", "content": user_prompt},
-            ]
-            response = client.chat.completions.create(
-                messages=chat_messages,
-                model=deployment_name,
-                max_tokens=1000,
-                temperature=0.7,
-                response_format={"type": "text"},
+        candidates_key = None
+        if candidate_count > 1:
+            candidates_key = candidate_cache_key(
+                request.user.pk, data["postInput"], data["emojiNeeded"], data["htagNeeded"], candidate_count
+            )
+            cached = get_cached_candidates(candidates_key)
+            if cached:
+                # Looked up before the usage check: the set was charged when it was
+                # generated, so it is returned free, even once the quota is used up
+                return Response(
+                    {
+                        "success": True,
+                        "rewriteAI": cached[0],
+                        "candidates": cached,
+                        "cached": True,
+                        "tokens": {"input": input_tokens, "outputBudget": max_tokens},
+                        "usage": {
+                            "used": usage.count,
+                            "limit": usage.user.subscription.get_daily_limit() if hasattr(usage.user, 'subscription') else 20,
+                        }
+                    }
+                )
+
+        # Check usage limits
+        if not usage.can_use(quota_units(candidate_count)):
+            subscription = getattr(request.user, 'subscription', None)
+            limit = subscription.get_daily_limit() if subscription else 20
+            return Response(
+                {
+                    "success": False, 
+                    "message": f"You've reached your daily limit of {limit} rewrites. Upgrade to Premium for unlimited rewrites!",
+                    "upgrade_url": "/pricing/"
+                },
+                status=429,
+            )
+
+        deadline = Deadline.from_request(request)
+        candidates = None
+        prompt_emoji, prompt_htag = prompt_options(data["emojiNeeded"], data["htagNeeded"])
+        plan = plan_for(request.user)
+        try:
+            if candidate_count == 1 and use_incremental_rewrite(data["postInput"], data.get("incremental", settings.INCREMENTAL_REWRITE)):
+                # Admits each paragraph call separately
+                rewritten_text = rewrite_incrementally(
+                    data["postInput"], prompt_emoji, prompt_htag,
+                    user=request.user, deadline=deadline, plan=plan,
+                )
+            else:
+                with admission.admit(plan, deadline=deadline):
+                    completion = generate(
+                        POST_SYSTEM_PROMPT,
+                        build_post_prompt(data["postInput"], prompt_emoji, prompt_htag),
+                        max_tokens=max_tokens,
+                        context=CallContext(
+                            request.user,
+                            data["emojiNeeded"],
+                            data["htagNeeded"],
+                            input_chars=len(data["postInput"]),
+                        ),
+                        deadline=deadline,
+                        candidates=candidate_count,
+                    )
+                    rewritten_text = completion.text
+                    candidates = completion.candidates or [rewritten_text]
+        except AdmissionRejected as e:
+            message = "The rewrite service is busy right now. Please try again in a few seconds."
+            if e.plan == "free":
+                message += " Premium rewrites are prioritised during busy periods."
+            return Response(
+                {"success": False, "message": message},
+                status=503,
+                headers={"Retry-After": str(e.retry_after)},
+            )
+        except DeadlineExceeded:
+            # Nothing is charged for a rewrite that did not finish in time
+            return Response(
+                {"success": False, "message": "The rewrite took too long and was cancelled. Please try again."},
+                status=504,
+            )
+        except ProviderUnavailable:
+            return Response(
+                {"success": False, "message": "The rewrite service is temporarily unavailable. Please try again shortly."},
+                status=503,
+                headers={"Retry-After": str(settings.PROVIDER_CIRCUIT_RESET_TIMEOUT)},
             )
-            rewritten_text = response.choices[0].message.content.strip()
-        else:
-            response = google_client.models.generate_content(
-                model=google_model,
-                contents=user_prompt,
-                config=GenerateContentConfig(
-                    system_instruction=system_instruction,
-                    max_output_tokens=1000,
-                    temperature=0.7,
-                ),
+        except EmptyCompletion:
+            # Nothing is charged for a rewrite that came back empty
+            return Response(
+                {"success": False, "message": "The rewrite came back empty. Please try again."},
+                status=502,
             )
-            rewritten_text = response.text.strip()
 
-        usage.increment()
+        if settings.LOCAL_DECORATIONS:
+            rewritten_text = decorate(rewritten_text, data["emojiNeeded"], data["htagNeeded"])
+            if candidates:
+                candidates = [decorate(text, data["emojiNeeded"], data["htagNeeded"]) for text in candidates]
+
+        usage.increment(quota_units(candidate_count))
+        record_rewrite(
+            request.user, data["postInput"], rewritten_text, data["emojiNeeded"], data["htagNeeded"]
+        )
+        if candidates_key:
+            cache_candidates(candidates_key, candidates)
 
         return Response(
             {
                 "success": True,
                 "rewriteAI": rewritten_text,
+                "candidates": candidates or [rewritten_text],
+                "tokens": {"input": input_tokens, "outputBudget": max_tokens},
                 "usage": {
                     "used": usage.count,
                     "limit": usage.user.subscription.get_daily_limit() if hasattr(usage.user, 'subscription') else 20,
@@ -233,6 +305,95 @@ class RewriteAPI(APIView):
         return Response({"success": False})
 
 
+def _history_entry(entry):
+    return {
+        "id": entry.pk,
+        "created_at": entry.created_at.isoformat(),
+        "input": entry.input_text,
+        "output": entry.output_text,
+        "emojiNeeded": entry.emoji_needed,
+        "htagNeeded": entry.htag_needed,
+    }
+
+
+class RewriteHistoryAPI(APIView):
+    """Cursor-paginated rewrite history for the current user"""
+
+    def get(self, request):
+        if not request.user.is_authenticated:
+            return Response(
+                {"success": False, "message": "Please login to use this service."},
+                status=401,
+            )
+
+        try:
+            limit = int(request.query_params.get("limit", settings.HISTORY_PAGE_SIZE))
+            entries, next_cursor = get_history_page(
+                request.user, request.query_params.get("cursor"), max(limit, 1)
+            )
+        except (ValueError, InvalidCursor):
+            return Response(
+                {"success": False, "message": "Invalid history cursor or limit."},
+                status=400,
+            )
+
+        return Response(
+            {
+                "success": True,
+                "results": [_history_entry(entry) for entry in entries],
+                "next_cursor": next_cursor,
+            }
+        )
+
+
+class UsageAPI(APIView):
+    """Today's quota for the current user, for clients that poll it"""
+
+    # Polling must not use up the rewrite rate limit, and only reads the cache
+    throttle_classes = []
+
+    def get(self, request):
+        if not request.user.is_authenticated:
+            return Response(
+                {"success": False, "message": "Please login to use this service."},
+                status=401,
+            )
+
+        summary = get_usage_summary(request.user)
+        etag = f'"{request.user.pk}-{summary["used"]}-{summary["limit"]}-{summary["reset"]}"'
+        response = get_conditional_response(request._request, etag=etag)
+        if response is None:
+            limit = summary["limit"]
+            response = Response(
+                {
+                    "success": True,
+                    "used": summary["used"],
+                    "limit": limit,
+                    "remaining": None if limit is None else max(limit - summary["used"], 0),
+                    "resetAt": datetime.fromtimestamp(summary["reset"], tz=pytz.UTC).isoformat(),
+                }
+            )
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        patch_vary_headers(response, ("Authorization", "Cookie"))
+        return response
+
+
+@login_required
+def history(request):
+    """Rewrite history page, paginated by cursor"""
+    try:
+        entries, next_cursor = get_history_page(request.user, request.GET.get("cursor"))
+    except InvalidCursor:
+        return redirect("rewrite:history")
+
+    return render(request, "rewrite/history.html", {
+        "entries": entries,
+        "next_cursor": next_cursor,
+        "is_first_page": not request.GET.get("cursor"),
+    })
+
+
 @login_required
 def dashboard(request):
     """User dashboard showing usage stats and subscription info"""
@@ -274,6 +435,7 @@ def dashboard(request):
     return render(request, 'rewrite/dashboard_modern.html', context)
 
 
+@anonymous_page_cache
 def pricing(request):
     """Pricing page showing available plans"""
     user_subscription = None
@@ -287,6 +449,22 @@ def pricing(request):
     return render(request, 'rewrite/pricing_modern.html', context)
 
 
+@require_GET
+def extension_release(request):
+    """Latest extension version, answered from the cache with ETag revalidation"""
+    entry = get_release_entry()
+    response = get_conditional_response(
+        request, etag=entry["etag"], last_modified=entry["last_modified"]
+    )
+    if response is None:
+        response = HttpResponse(entry["content"], content_type="application/json")
+    response["ETag"] = entry["etag"]
+    if entry["last_modified"]:
+        response["Last-Modified"] = http_date(entry["last_modified"])
+    response["Cache-Control"] = f"public, max-age={settings.EXTENSION_RELEASE_MAX_AGE}"
+    return response
+
+
 @login_required
 def upgrade_plan(request):
     """Handle plan upgrade requests"""
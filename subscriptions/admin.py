@@ -1,6 +1,14 @@
 from django.contrib import admin
 from django.utils import timezone
-from .models import Subscription, UsageTracking, Payment, SubscriptionPlan
+from .models import (
+    Payment,
+    StripeEvent,
+    StripeEventStatus,
+    Subscription,
+    SubscriptionPlan,
+    UsageTracking,
+    refresh_cached_plans,
+)
 
 
 @admin.register(Subscription)
@@ -11,6 +19,10 @@ class SubscriptionAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at')
     ordering = ('-created_at',)
     
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_cached_plans([obj])
+    
     fieldsets = (
         ('User Information', {
             'fields': ('user',)
@@ -29,19 +41,24 @@ class SubscriptionAdmin(admin.ModelAdmin):
     actions = ['upgrade_to_premium', 'downgrade_to_free']
     
     def upgrade_to_premium(self, request, queryset):
+        # The changelist may filter on plan, so the queryset would no longer match after the update
+        pks = list(queryset.values_list('pk', flat=True))
         count = queryset.update(
             plan=SubscriptionPlan.PREMIUM,
             is_active=True,
             updated_at=timezone.now()
         )
+        refresh_cached_plans(Subscription.objects.filter(pk__in=pks))
         self.message_user(request, f'{count} subscription(s) upgraded to Premium.')
     upgrade_to_premium.short_description = 'Upgrade selected to Premium'
     
     def downgrade_to_free(self, request, queryset):
+        pks = list(queryset.values_list('pk', flat=True))
         count = queryset.update(
             plan=SubscriptionPlan.FREE,
             updated_at=timezone.now()
         )
+        refresh_cached_plans(Subscription.objects.filter(pk__in=pks))
         self.message_user(request, f'{count} subscription(s) downgraded to Free.')
     downgrade_to_free.short_description = 'Downgrade selected to Free'
 
@@ -79,4 +96,35 @@ class PaymentAdmin(admin.ModelAdmin):
     
     def has_change_permission(self, request, obj=None):
         # Payments should not be edited
-        return False
\ No newline at end of file
+        return False
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'type', 'customer_id', 'stripe_created', 'status', 'attempts', 'processed_at')
+    list_filter = ('status', 'type')
+    search_fields = ('event_id', 'customer_id')
+    readonly_fields = [field.name for field in StripeEvent._meta.fields]
+    ordering = ('-stripe_created',)
+    show_full_result_count = False
+    actions = ['retry_events']
+    
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # The raw payload is only needed on the change page
+        if request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.defer('payload')
+        return queryset
+    
+    def has_add_permission(self, request):
+        # Events only arrive through the webhook
+        return False
+    
+    def retry_events(self, request, queryset):
+        count = queryset.exclude(status=StripeEventStatus.PROCESSED).update(
+            status=StripeEventStatus.PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now(),
+        )
+        self.message_user(request, f'{count} event(s) queued for another attempt.')
+    retry_events.short_description = 'Retry selected events'
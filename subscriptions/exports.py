@@ -0,0 +1,94 @@
+"""
+Streaming CSV/NDJSON exports of usage, payment and subscription data.
+
+Rows are read with values_list() and QuerySet.iterator(chunk_size=...) and
+encoded one at a time, so memory stays flat regardless of the number of rows.
+"""
+import csv
+import json
+import zlib
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import Payment, Subscription, UsageTracking
+
+# dataset -> (model, date field used for range filters, plan lookup, exported columns)
+DATASETS = {
+    'usage': (
+        UsageTracking,
+        'date',
+        'user__subscription__plan',
+        ['date', 'user__email', 'user__subscription__plan', 'count', 'reset_time'],
+    ),
+    'payments': (
+        Payment,
+        'created_at__date',
+        'subscription__plan',
+        ['created_at', 'user__email', 'subscription__plan', 'amount', 'currency', 'status',
+         'stripe_payment_intent_id'],
+    ),
+    'subscriptions': (
+        Subscription,
+        'created_at__date',
+        'plan',
+        ['created_at', 'user__email', 'plan', 'is_active', 'start_date', 'end_date',
+         'stripe_customer_id', 'stripe_subscription_id'],
+    ),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """Pseudo-buffer that hands back what csv.writer writes instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(dataset, start=None, end=None, plan=None):
+    """Return (columns, row iterator) for a dataset filtered by date range and plan"""
+    model, date_field, plan_field, columns = DATASETS[dataset]
+    queryset = model.objects.all()
+    if start:
+        queryset = queryset.filter(**{f'{date_field}__gte': start})
+    if end:
+        queryset = queryset.filter(**{f'{date_field}__lte': end})
+    if plan:
+        queryset = queryset.filter(**{plan_field: plan})
+
+    rows = queryset.order_by('pk').values_list(*columns).iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE
+    )
+    return columns, rows
+
+
+def encode_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def encode_ndjson(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def stream_export(dataset, export_format='csv', start=None, end=None, plan=None, gzip=False):
+    """Yield the encoded export as bytes, optionally gzip-compressed on the fly"""
+    columns, rows = export_rows(dataset, start, end, plan)
+    encoder = encode_csv if export_format == 'csv' else encode_ndjson
+    chunks = (chunk.encode() for chunk in encoder(columns, rows))
+    return gzip_chunks(chunks) if gzip else chunks
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
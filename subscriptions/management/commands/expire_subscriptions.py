@@ -0,0 +1,88 @@
+"""
+Django management command that downgrades subscriptions past their end date.
+
+Expired subscriptions are found through the (is_active, end_date) index and
+downgraded in bounded batches, and each batch's new plan is published to the
+cache, so requests can trust Subscription.is_premium() without date math.
+"""
+
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from subscriptions.models import Subscription, SubscriptionPlan, cache_plans
+
+
+class Command(BaseCommand):
+    help = 'Downgrades subscriptions whose end date has passed, in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.SUBSCRIPTION_EXPIRY_BATCH_SIZE,
+            help='Maximum number of subscriptions updated per statement',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            help='Stop after this many batches, leaving the rest for the next run',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many subscriptions have expired',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep sweeping instead of exiting when nothing is left to expire',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.SUBSCRIPTION_EXPIRY_INTERVAL,
+            help='Seconds to sleep between sweeps when running with --loop',
+        )
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = self.expired(timezone.now()).count()
+            self.stdout.write(f'{count} subscription(s) have expired')
+            return
+
+        while True:
+            expired = self.sweep(options['batch_size'], options['max_batches'])
+            self.stdout.write(self.style.SUCCESS(f'Expired {expired} subscription(s)'))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def expired(self, now):
+        return Subscription.objects.filter(is_active=True, end_date__lte=now)
+
+    def sweep(self, batch_size, max_batches=None):
+        total = batches = 0
+        while max_batches is None or batches < max_batches:
+            now = timezone.now()
+            batch = list(
+                self.expired(now).order_by('end_date').values_list('pk', 'user_id')[:batch_size]
+            )
+            if not batch:
+                break
+
+            pks = [pk for pk, _ in batch]
+            # Re-check the filter so a renewal that landed meanwhile is not downgraded
+            updated = self.expired(now).filter(pk__in=pks).update(
+                plan=SubscriptionPlan.FREE,
+                is_active=False,
+                updated_at=now,
+            )
+            # Only publish the rows this update changed; a renewal stamps its own updated_at
+            downgraded = Subscription.objects.filter(
+                pk__in=pks, plan=SubscriptionPlan.FREE, is_active=False, updated_at=now
+            ).values_list('user_id', flat=True)
+            cache_plans({user_id: SubscriptionPlan.FREE for user_id in downgraded})
+            total += updated
+            batches += 1
+        return total
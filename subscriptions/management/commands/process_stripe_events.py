@@ -0,0 +1,109 @@
+"""
+Django management command that applies stored Stripe webhook events.
+
+Due events are taken in Stripe's creation order. A customer's events are applied
+one after another, and a failed event holds back that customer's later events
+until it succeeds or is given up on, so a stale update never overwrites a newer
+one. Each batch is written with bulk queries. Run a single worker.
+"""
+
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from subscriptions.models import StripeEvent, StripeEventStatus
+from subscriptions.stripe_events import EventBatch
+
+
+class Command(BaseCommand):
+    help = 'Applies stored Stripe webhook events to subscriptions and payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.STRIPE_EVENT_BATCH_SIZE,
+            help='Maximum number of events applied per batch of writes',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling for events instead of exiting when none are due',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.STRIPE_EVENT_POLL_INTERVAL,
+            help='Seconds to sleep between polls when running with --loop',
+        )
+
+    def handle(self, *args, **options):
+        totals = {'processed': 0, 'ignored': 0, 'failed': 0}
+
+        while True:
+            events = self.due_events(options['batch_size'])
+            if events:
+                for key, count in self.apply_batch(events).items():
+                    totals[key] += count
+                continue
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(
+            'Stripe events: {processed} applied, {ignored} ignored, {failed} failed'.format(**totals)
+        ))
+
+    def due_events(self, batch_size):
+        now = timezone.now()
+        pending = StripeEvent.objects.filter(status=StripeEventStatus.PENDING)
+        # A customer waiting on a retry must not have later events applied first
+        blocked = pending.filter(next_attempt_at__gt=now).exclude(customer_id='').values('customer_id')
+        return list(
+            pending.filter(next_attempt_at__lte=now)
+            .exclude(customer_id__in=blocked)
+            .order_by('stripe_created', 'id')[:batch_size]
+        )
+
+    def apply_batch(self, events):
+        now = timezone.now()
+        counts = {'processed': 0, 'ignored': 0, 'failed': 0}
+        batch = EventBatch(events, now)
+        held_customers = set()
+
+        for event in events:
+            if event.customer_id and event.customer_id in held_customers:
+                # Leave it pending; it is retried after the earlier event
+                continue
+            event.attempts += 1
+            try:
+                applied = batch.apply(event)
+            except Exception as e:
+                self.fail(event, e, now)
+                counts['failed'] += 1
+                if event.status == StripeEventStatus.PENDING and event.customer_id:
+                    held_customers.add(event.customer_id)
+                continue
+            event.status = StripeEventStatus.PROCESSED if applied else StripeEventStatus.IGNORED
+            event.processed_at = now
+            event.last_error = ''
+            counts['processed' if applied else 'ignored'] += 1
+
+        with transaction.atomic():
+            batch.save()
+            StripeEvent.objects.bulk_update(
+                events, ['status', 'attempts', 'next_attempt_at', 'last_error', 'processed_at']
+            )
+        return counts
+
+    def fail(self, event, error, now):
+        event.last_error = str(error)
+        if event.attempts >= settings.STRIPE_EVENT_MAX_ATTEMPTS:
+            event.status = StripeEventStatus.FAILED
+        else:
+            delay = settings.STRIPE_EVENT_BACKOFF_SECONDS * 2 ** (event.attempts - 1)
+            event.next_attempt_at = now + timedelta(seconds=delay)
+        self.stdout.write(self.style.WARNING(f'Failed to apply {event.type} {event.event_id}: {error}'))
@@ -1,8 +1,10 @@
 from django.db import models
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from datetime import datetime, timedelta
 import pytz
+import time
 
 
 class SubscriptionPlan(models.TextChoices):
@@ -35,18 +37,70 @@ class Subscription(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Used by the expire_subscriptions sweep
+            models.Index(fields=['is_active', 'end_date'], name='subscription_expiry_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.email} - {self.get_plan_display()}"
     
     def is_premium(self):
+        # end_date is enforced by the expire_subscriptions sweep, which clears is_active
         return self.plan == SubscriptionPlan.PREMIUM and self.is_active
     
+    def current_plan(self):
+        """The plan the user is entitled to right now"""
+        return SubscriptionPlan.PREMIUM if self.is_premium() else SubscriptionPlan.FREE
+    
     def get_daily_limit(self):
         """Get daily rewrite limit based on plan"""
-        if self.plan == SubscriptionPlan.PREMIUM:
-            return None  # Unlimited
-        return 20  # Free plan limit
+        return daily_limit_for(self.current_plan())
+
+
+FREE_DAILY_LIMIT = 20
+
+
+def daily_limit_for(plan):
+    if plan == SubscriptionPlan.PREMIUM:
+        return None  # Unlimited
+    return FREE_DAILY_LIMIT
+
+
+def shared_state_timeout(timeout):
+    """Cache timeout for a value other processes rely on, kept short when the cache is per process"""
+    return timeout if settings.CACHE_IS_SHARED else min(timeout, settings.UNSHARED_CACHE_TTL)
+
+
+PLAN_CACHE_KEY = 'subscriptions:plan:{}'
+
+
+def cache_plans(plans):
+    """Publish {user_id: plan} so plan claims cached elsewhere (extension tokens) are overridden"""
+    cache.set_many(
+        {PLAN_CACHE_KEY.format(user_id): plan for user_id, plan in plans.items()},
+        timeout=shared_state_timeout(settings.EXTENSION_TOKEN_TTL_DAYS * 24 * 60 * 60),
+    )
+
+
+def refresh_cached_plans(subscriptions):
+    cache_plans({subscription.user_id: subscription.current_plan() for subscription in subscriptions})
+
+
+def get_cached_plan(user_id, default=None):
+    """The published plan for a user, or default when none is cached
+
+    A per-process cache never receives plans published by other processes
+    (expiry sweeps, admin actions, Stripe events), so there a miss reads the
+    subscription instead of falling back to the default.
+    """
+    plan = cache.get(PLAN_CACHE_KEY.format(user_id))
+    if plan is None and not settings.CACHE_IS_SHARED:
+        subscription = Subscription.objects.filter(user_id=user_id).first()
+        if subscription is not None:
+            plan = subscription.current_plan()
+            cache_plans({user_id: plan})
+    return default if plan is None else plan
 
 
 class UsageTracking(models.Model):
@@ -95,10 +149,12 @@ class UsageTracking(models.Model):
                 }
             )
         
+        # Reuse the caller's user instance instead of lazily reloading it
+        usage.user = user
         return usage
     
-    def can_use(self):
-        """Check if user can make another rewrite"""
+    def can_use(self, units=1):
+        """Check if user can make another rewrite costing the given quota units"""
         subscription = getattr(self.user, 'subscription', None)
         if not subscription:
             # Create default free subscription
@@ -112,14 +168,47 @@ class UsageTracking(models.Model):
         if daily_limit is None:  # Premium user
             return True
         
-        return self.count < daily_limit
+        return self.count + units <= daily_limit
     
-    def increment(self):
+    def increment(self, units=1):
         """Increment usage count"""
-        self.count += 1
+        self.count += units
         self.save()
         return self.count
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        cache_usage(self)
+
+
+USAGE_CACHE_KEY = 'subscriptions:usage:{}:{}'
+
+
+def cache_usage(usage):
+    """Publish a usage row to the quota cache until shortly after its reset time
+
+    A per-process cache never sees increments made by other workers, so there
+    the entry is only kept briefly before the row is read again.
+    """
+    entry = {'used': usage.count, 'reset': int(usage.reset_time.timestamp())}
+    timeout = shared_state_timeout(max(60, entry['reset'] - int(time.time()) + 60 * 60))
+    cache.set(USAGE_CACHE_KEY.format(usage.user_id, usage.date), entry, timeout)
+    return entry
+
+
+def get_usage_summary(user):
+    """Today's used count, limit and reset time, read from the quota and plan caches when warm"""
+    entry = cache.get(USAGE_CACHE_KEY.format(user.pk, user.get_local_time().date()))
+    if entry is None or entry['reset'] <= time.time():
+        entry = cache_usage(UsageTracking.get_or_create_today(user))
+
+    plan = get_cached_plan(user.pk)
+    if plan is None:
+        subscription = getattr(user, 'subscription', None)
+        plan = subscription.current_plan() if subscription else SubscriptionPlan.FREE
+        cache_plans({user.pk: plan})
+    return {**entry, 'limit': daily_limit_for(plan)}
+
 
 class Payment(models.Model):
     """Payment records for future integration"""
@@ -143,4 +232,39 @@ class Payment(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return f"{self.user.email} - ${self.amount} - {self.status}"
\ No newline at end of file
+        return f"{self.user.email} - ${self.amount} - {self.status}"
+
+class StripeEventStatus(models.TextChoices):
+    PENDING = "PENDING", "Pending"
+    PROCESSED = "PROCESSED", "Processed"
+    IGNORED = "IGNORED", "Ignored"
+    FAILED = "FAILED", "Failed"
+
+
+class StripeEvent(models.Model):
+    """Raw Stripe webhook event, stored on receipt and applied by `manage.py process_stripe_events`"""
+    event_id = models.CharField(max_length=255, unique=True)
+    type = models.CharField(max_length=100)
+    customer_id = models.CharField(max_length=255, blank=True)
+    stripe_created = models.DateTimeField(help_text="When Stripe created the event; events are applied in this order")
+    payload = models.JSONField()
+    status = models.CharField(
+        max_length=10,
+        choices=StripeEventStatus.choices,
+        default=StripeEventStatus.PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['stripe_created', 'id']
+        indexes = [
+            models.Index(fields=['status', 'stripe_created'], name='stripe_event_pending_idx'),
+            models.Index(fields=['customer_id', 'stripe_created'], name='stripe_event_customer_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.type} {self.event_id} ({self.status})"
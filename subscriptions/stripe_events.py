@@ -0,0 +1,188 @@
+"""
+Stripe webhook ingestion.
+
+The webhook view only verifies the signature and stores the raw event, deduped
+by its Stripe id, so it can answer 200 straight away even during renewal-day
+bursts. `manage.py process_stripe_events` later applies stored events to
+Subscription and Payment rows in Stripe's order per customer, one batch of
+events per set of bulk writes.
+"""
+import json
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from .models import (
+    Payment,
+    StripeEvent,
+    Subscription,
+    SubscriptionPlan,
+    refresh_cached_plans,
+)
+
+# Subscription statuses that keep Premium features on
+ACTIVE_STATUSES = {'active', 'trialing', 'past_due'}
+
+SUBSCRIPTION_FIELDS = ['plan', 'is_active', 'end_date', 'stripe_customer_id', 'stripe_subscription_id', 'updated_at']
+
+
+def parse_event(payload, signature):
+    """Verify the Stripe-Signature header and return the decoded event
+
+    Raises stripe.SignatureVerificationError, or ValueError for a body that is not JSON.
+    """
+    import stripe
+
+    stripe.WebhookSignature.verify_header(
+        payload, signature, settings.STRIPE_WEBHOOK_SECRET, settings.STRIPE_WEBHOOK_TOLERANCE
+    )
+    return json.loads(payload)
+
+
+def event_customer(event):
+    obj = event.get('data', {}).get('object', {})
+    if obj.get('object') == 'customer':
+        return obj.get('id', '')
+    customer = obj.get('customer') or ''
+    # Expanded customers arrive as objects
+    return customer.get('id', '') if isinstance(customer, dict) else customer
+
+
+def store_event(event):
+    """Store a verified event; returns False when Stripe already delivered it"""
+    try:
+        with transaction.atomic():
+            StripeEvent.objects.create(
+                event_id=event['id'],
+                type=event['type'],
+                customer_id=event_customer(event),
+                stripe_created=_timestamp(event['created']),
+                payload=event,
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def _timestamp(value):
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc) if value else None
+
+
+def _period_end(subscription):
+    if subscription.get('current_period_end'):
+        return _timestamp(subscription['current_period_end'])
+    # Newer API versions report the period on each subscription item
+    items = subscription.get('items', {}).get('data', [])
+    ends = [item['current_period_end'] for item in items if item.get('current_period_end')]
+    return _timestamp(max(ends)) if ends else None
+
+
+class EventBatch:
+    """Applies a batch of events in memory, then writes all changes with bulk queries"""
+
+    def __init__(self, events, now):
+        self.now = now
+        customers = {event.customer_id for event in events if event.customer_id}
+        user_ids = set()
+        for event in events:
+            obj = event.payload['data']['object']
+            user_id = obj.get('client_reference_id') or (obj.get('metadata') or {}).get('user_id')
+            if user_id and str(user_id).isdigit():
+                user_ids.add(int(user_id))
+
+        subscriptions = Subscription.objects.filter(stripe_customer_id__in=customers) | Subscription.objects.filter(
+            user_id__in=user_ids
+        )
+        self.by_customer = {}
+        self.by_user = {}
+        for subscription in subscriptions:
+            self.by_user[subscription.user_id] = subscription
+            if subscription.stripe_customer_id:
+                self.by_customer[subscription.stripe_customer_id] = subscription
+
+        self.changed = {}
+        self.payments = []
+
+    def apply(self, event):
+        """Apply one event; returns False for event types we don't handle"""
+        handler = HANDLERS.get(event.type)
+        if handler is None:
+            return False
+        handler(self, event, event.payload['data']['object'])
+        return True
+
+    def subscription_for(self, event, obj):
+        subscription = self.by_customer.get(event.customer_id)
+        if subscription is None:
+            user_id = obj.get('client_reference_id') or (obj.get('metadata') or {}).get('user_id')
+            subscription = self.by_user.get(int(user_id)) if user_id and str(user_id).isdigit() else None
+        if subscription is None:
+            # Usually the checkout event linking the customer has not arrived yet
+            raise LookupError(f'No subscription for Stripe customer {event.customer_id!r}')
+        if event.customer_id and subscription.stripe_customer_id != event.customer_id:
+            subscription.stripe_customer_id = event.customer_id
+            self.by_customer[event.customer_id] = subscription
+        return subscription
+
+    def touch(self, subscription):
+        subscription.updated_at = self.now
+        self.changed[subscription.pk] = subscription
+
+    def save(self):
+        if self.changed:
+            Subscription.objects.bulk_update(self.changed.values(), SUBSCRIPTION_FIELDS)
+            refresh_cached_plans(self.changed.values())
+        if self.payments:
+            Payment.objects.bulk_create(self.payments)
+
+
+def checkout_completed(batch, event, session):
+    subscription = batch.subscription_for(event, session)
+    if session.get('subscription'):
+        subscription.stripe_subscription_id = session['subscription']
+    batch.touch(subscription)
+
+
+def subscription_changed(batch, event, stripe_subscription):
+    subscription = batch.subscription_for(event, stripe_subscription)
+    active = stripe_subscription.get('status') in ACTIVE_STATUSES
+    subscription.stripe_subscription_id = stripe_subscription['id']
+    subscription.plan = SubscriptionPlan.PREMIUM if active else SubscriptionPlan.FREE
+    subscription.is_active = active
+    subscription.end_date = _period_end(stripe_subscription) if active else batch.now
+    batch.touch(subscription)
+
+
+def subscription_deleted(batch, event, stripe_subscription):
+    subscription = batch.subscription_for(event, stripe_subscription)
+    subscription.plan = SubscriptionPlan.FREE
+    subscription.is_active = False
+    subscription.end_date = batch.now
+    batch.touch(subscription)
+
+
+def invoice_payment(status):
+    def handler(batch, event, invoice):
+        subscription = batch.subscription_for(event, invoice)
+        amount = invoice.get('amount_paid') if status == 'succeeded' else invoice.get('amount_due')
+        batch.payments.append(
+            Payment(
+                user_id=subscription.user_id,
+                subscription=subscription,
+                amount=Decimal(amount or 0) / 100,
+                currency=(invoice.get('currency') or 'usd').upper(),
+                stripe_payment_intent_id=invoice.get('payment_intent') or '',
+                status=status,
+            )
+        )
+    return handler
+
+
+HANDLERS = {
+    'checkout.session.completed': checkout_completed,
+    'customer.subscription.created': subscription_changed,
+    'customer.subscription.updated': subscription_changed,
+    'customer.subscription.deleted': subscription_deleted,
+    'invoice.paid': invoice_payment('succeeded'),
+    'invoice.payment_failed': invoice_payment('failed'),
+}
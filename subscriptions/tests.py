@@ -1,3 +1,289 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time
+from io import StringIO
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from unittest.mock import patch
+from rest_framework.test import APIRequestFactory
+from accounts.authentication import ExtensionTokenAuthentication, mint_extension_token
+from accounts.models import CustomUser
+from .management.commands.expire_subscriptions import Command as ExpireSubscriptionsCommand
+from .models import (
+    PLAN_CACHE_KEY, StripeEvent, StripeEventStatus, Subscription, SubscriptionPlan, UsageTracking, cache_plans,
+)
 
-# Create your tests here.
+
+class ExportTestCase(TestCase):
+    def setUp(self):
+        self.staff = CustomUser.objects.create_user(
+            username='staff@example.com', email='staff@example.com', password='s3cret-pass!',
+            is_staff=True, email_verified=True,
+        )
+        for i, plan in enumerate([SubscriptionPlan.FREE, SubscriptionPlan.PREMIUM]):
+            user = CustomUser.objects.create_user(
+                username=f'user{i}@example.com', email=f'user{i}@example.com', password='x'
+            )
+            Subscription.objects.create(user=user, plan=plan)
+            UsageTracking.objects.create(
+                user=user, date=date(2026, 1, 10 + i), count=i + 1, reset_time=timezone.now()
+            )
+
+    def export(self, dataset, **params):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('subscriptions:export_data', args=[dataset]), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_csv_export_with_filters(self):
+        content = self.export('usage', plan='PREMIUM').decode().splitlines()
+        self.assertEqual(content[0], 'date,user__email,user__subscription__plan,count,reset_time')
+        self.assertEqual(len(content), 2)
+        self.assertTrue(content[1].startswith('2026-01-11,user1@example.com,PREMIUM,2,'))
+
+        content = self.export('usage', start='2026-01-11', end='2026-01-31').decode().splitlines()
+        self.assertEqual(len(content), 2)
+
+    def test_gzip_ndjson_export(self):
+        content = gzip.decompress(self.export('subscriptions', format='ndjson', gzip='1'))
+        rows = [json.loads(line) for line in content.decode().splitlines()]
+        self.assertEqual(sorted(row['plan'] for row in rows), ['FREE', 'PREMIUM'])
+
+    def test_rejects_non_staff_and_bad_params(self):
+        response = self.client.get(reverse('subscriptions:export_data', args=['usage']))
+        self.assertEqual(response.status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('subscriptions:export_data', args=['usage']), {'start': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_usage_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'usage.csv')
+            call_command('export_usage', '--plan', 'FREE', '--output', path, stdout=StringIO())
+            with open(path) as f:
+                lines = f.read().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('user0@example.com', lines[1])
+
+
+class ExpireSubscriptionsTestCase(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        self.subscriptions = {}
+        for name, end_date in [('expired', now - timedelta(days=1)), ('current', now + timedelta(days=1)), ('open', None)]:
+            user = CustomUser.objects.create_user(
+                username=f'{name}@example.com', email=f'{name}@example.com', password='x', email_verified=True,
+            )
+            self.subscriptions[name] = Subscription.objects.create(
+                user=user, plan=SubscriptionPlan.PREMIUM, end_date=end_date
+            )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_daily_limit_follows_active_flag(self):
+        subscription = self.subscriptions['current']
+        self.assertIsNone(subscription.get_daily_limit())
+        subscription.is_active = False
+        self.assertEqual(subscription.get_daily_limit(), 20)
+
+    def test_sweep_downgrades_only_expired_subscriptions_in_batches(self):
+        extra = CustomUser.objects.create_user(username='late@example.com', email='late@example.com', password='x')
+        Subscription.objects.create(user=extra, plan=SubscriptionPlan.PREMIUM, end_date=timezone.now() - timedelta(days=3))
+
+        out = StringIO()
+        call_command('expire_subscriptions', '--batch-size', '1', '--max-batches', '1', stdout=out)
+        self.assertIn('Expired 1 subscription(s)', out.getvalue())
+        # The oldest expiry goes first, the other is left for the next run
+        self.assertFalse(Subscription.objects.get(user=extra).is_premium())
+        self.assertTrue(Subscription.objects.get(pk=self.subscriptions['expired'].pk).is_premium())
+
+        call_command('expire_subscriptions', '--batch-size', '1', stdout=StringIO())
+        plans = {name: Subscription.objects.get(pk=s.pk).current_plan() for name, s in self.subscriptions.items()}
+        self.assertEqual(plans, {'expired': 'FREE', 'current': 'PREMIUM', 'open': 'PREMIUM'})
+
+    def test_renewal_during_sweep_is_not_cached_as_free(self):
+        renewed = self.subscriptions['expired']
+        late = CustomUser.objects.create_user(username='late@example.com', email='late@example.com', password='x')
+        Subscription.objects.create(user=late, plan=SubscriptionPlan.PREMIUM, end_date=timezone.now() - timedelta(days=3))
+        command = ExpireSubscriptionsCommand()
+        expired = command.expired
+        calls = []
+
+        def renew_before_update(now):
+            calls.append(now)
+            # The first call selects the batch, the second guards the update
+            if len(calls) == 2:
+                Subscription.objects.filter(pk=renewed.pk).update(
+                    end_date=timezone.now() + timedelta(days=30), updated_at=timezone.now()
+                )
+            return expired(now)
+
+        with patch.object(command, 'expired', side_effect=renew_before_update):
+            self.assertEqual(command.sweep(batch_size=10, max_batches=1), 1)
+
+        self.assertTrue(Subscription.objects.get(pk=renewed.pk).is_premium())
+        self.assertIsNone(cache.get(PLAN_CACHE_KEY.format(renewed.user_id)))
+        self.assertEqual(cache.get(PLAN_CACHE_KEY.format(late.pk)), SubscriptionPlan.FREE)
+
+    def test_token_plan_is_read_from_database_without_shared_cache(self):
+        subscription = self.subscriptions['current']
+        _, signed_token = mint_extension_token(subscription.user)
+        request = APIRequestFactory().post('/rewrite/', HTTP_AUTHORIZATION=f'Bearer {signed_token}')
+        # Downgraded by another process, whose cache this process never sees
+        Subscription.objects.filter(pk=subscription.pk).update(plan=SubscriptionPlan.FREE)
+
+        with override_settings(CACHE_IS_SHARED=True):
+            token_user, _ = ExtensionTokenAuthentication().authenticate(request)
+            self.assertTrue(token_user.subscription.is_premium())
+        token_user, _ = ExtensionTokenAuthentication().authenticate(request)
+        self.assertFalse(token_user.subscription.is_premium())
+
+    def test_admin_actions_refresh_plans_outside_the_filtered_changelist(self):
+        admin_user = CustomUser.objects.create_superuser(username='admin@example.com', email='admin@example.com', password='x')
+        self.client.force_login(admin_user)
+        subscription = self.subscriptions['current']
+        Subscription.objects.filter(pk=subscription.pk).update(plan=SubscriptionPlan.FREE)
+        cache_plans({subscription.user_id: SubscriptionPlan.FREE})
+
+        self.client.post(
+            reverse('admin:subscriptions_subscription_changelist') + '?plan__exact=FREE',
+            {'action': 'upgrade_to_premium', '_selected_action': [subscription.pk]},
+        )
+        self.assertEqual(cache.get(PLAN_CACHE_KEY.format(subscription.user_id)), SubscriptionPlan.PREMIUM)
+
+    def test_downgrade_overrides_extension_token_plan(self):
+        user = self.subscriptions['expired'].user
+        _, signed_token = mint_extension_token(user)
+        request = APIRequestFactory().post('/rewrite/', HTTP_AUTHORIZATION=f'Bearer {signed_token}')
+        token_user, _ = ExtensionTokenAuthentication().authenticate(request)
+        self.assertTrue(token_user.subscription.is_premium())
+
+        call_command('expire_subscriptions', stdout=StringIO())
+        token_user, _ = ExtensionTokenAuthentication().authenticate(request)
+        self.assertFalse(token_user.subscription.is_premium())
+
+
+class StandInStripe:
+    """Generates Stripe-shaped events signed the way Stripe signs webhooks"""
+
+    secret = 'whsec_test_secret'
+
+    def __init__(self):
+        self.counter = 0
+        self.clock = int(time.time()) - 1000
+
+    def event(self, event_type, obj):
+        self.counter += 1
+        self.clock += 1
+        return {
+            'id': f'evt_{self.counter}',
+            'object': 'event',
+            'type': event_type,
+            'created': self.clock,
+            'data': {'object': obj},
+        }
+
+    def sign(self, event, secret=None):
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(
+            (secret or self.secret).encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256
+        ).hexdigest()
+        return payload, f't={timestamp},v1={signature}'
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=StandInStripe.secret, STRIPE_EVENT_BACKOFF_SECONDS=60)
+class StripeWebhookTestCase(TestCase):
+    def setUp(self):
+        self.stripe = StandInStripe()
+        self.user = CustomUser.objects.create_user(
+            username='payer@example.com', email='payer@example.com', password='x', email_verified=True,
+        )
+        self.subscription = Subscription.objects.create(user=self.user)
+
+    def tearDown(self):
+        cache.clear()
+
+    def deliver(self, event, secret=None):
+        payload, signature = self.stripe.sign(event, secret)
+        return self.client.post(
+            reverse('subscriptions:stripe_webhook'), payload,
+            content_type='application/json', HTTP_STRIPE_SIGNATURE=signature,
+        )
+
+    def process(self):
+        out = StringIO()
+        call_command('process_stripe_events', stdout=out)
+        return out.getvalue()
+
+    def subscription_event(self, event_type, status, period_end):
+        return self.stripe.event(event_type, {
+            'id': 'sub_1', 'object': 'subscription', 'customer': 'cus_1', 'status': status,
+            'items': {'data': [{'current_period_end': period_end}]},
+        })
+
+    def test_webhook_verifies_signature_and_dedupes(self):
+        event = self.stripe.event('invoice.paid', {'object': 'invoice', 'customer': 'cus_1'})
+        self.assertEqual(self.deliver(event, secret='whsec_wrong').status_code, 400)
+
+        with self.assertNumQueries(3):  # savepoint, insert, release
+            response = self.deliver(event)
+        self.assertEqual(response.json(), {'received': True, 'duplicate': False})
+        self.assertTrue(self.deliver(event).json()['duplicate'])
+        self.assertEqual(StripeEvent.objects.get().customer_id, 'cus_1')
+
+    def test_worker_applies_events_in_order_per_customer(self):
+        period_end = int(time.time()) + 30 * 86400
+        events = [
+            self.stripe.event('checkout.session.completed', {
+                'object': 'checkout.session', 'customer': 'cus_1', 'subscription': 'sub_1',
+                'client_reference_id': str(self.user.pk),
+            }),
+            self.subscription_event('customer.subscription.created', 'active', period_end),
+            self.stripe.event('invoice.paid', {
+                'object': 'invoice', 'customer': 'cus_1', 'amount_paid': 999, 'currency': 'usd',
+                'payment_intent': 'pi_1',
+            }),
+            self.stripe.event('customer.created', {'object': 'customer', 'id': 'cus_1'}),
+        ]
+        # Deliver out of order; the worker sorts by Stripe's creation time
+        for event in reversed(events):
+            self.deliver(event)
+
+        self.assertIn('3 applied, 1 ignored, 0 failed', self.process())
+        self.subscription.refresh_from_db()
+        self.assertEqual(
+            (self.subscription.stripe_customer_id, self.subscription.stripe_subscription_id), ('cus_1', 'sub_1')
+        )
+        self.assertTrue(self.subscription.is_premium())
+        self.assertEqual(int(self.subscription.end_date.timestamp()), period_end)
+        payment = self.subscription.payments.get()
+        self.assertEqual((payment.amount, payment.currency, payment.status), (Decimal('9.99'), 'USD', 'succeeded'))
+
+        self.deliver(self.stripe.event('customer.subscription.deleted', {'id': 'sub_1', 'customer': 'cus_1'}))
+        self.process()
+        self.subscription.refresh_from_db()
+        self.assertFalse(self.subscription.is_premium())
+
+    def test_failed_event_holds_back_later_events_for_that_customer(self):
+        # The customer is not linked to any subscription yet
+        self.deliver(self.subscription_event('customer.subscription.created', 'active', int(time.time()) + 86400))
+        self.deliver(self.subscription_event('customer.subscription.updated', 'canceled', int(time.time())))
+
+        self.assertIn('0 applied, 0 ignored, 1 failed', self.process())
+        first, second = StripeEvent.objects.order_by('stripe_created')
+        self.assertEqual((first.attempts, first.status), (1, StripeEventStatus.PENDING))
+        self.assertEqual((second.attempts, second.status), (0, StripeEventStatus.PENDING))
+        # Still backing off, so the later event must not be applied on its own
+        self.assertIn('0 applied, 0 ignored, 0 failed', self.process())
@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = 'subscriptions'
+
+urlpatterns = [
+    path('exports/<str:dataset>/', views.export_data, name='export_data'),
+    path('stripe/webhook/', views.stripe_webhook, name='stripe_webhook'),
+]
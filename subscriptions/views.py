@@ -1,3 +1,74 @@
-from django.shortcuts import render
+import logging
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .exports import DATASETS, FORMATS, stream_export
+from .models import SubscriptionPlan
+from .stripe_events import parse_event, store_event
 
-# Create your views here.
+logger = logging.getLogger(__name__)
+
+
+def _parse_date_param(value):
+    if not value:
+        return None
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+@staff_member_required
+def export_data(request, dataset):
+    """Stream usage, payment or subscription rows as CSV or NDJSON"""
+    if dataset not in DATASETS:
+        return HttpResponseBadRequest(f"Unknown dataset. Choose one of: {', '.join(DATASETS)}")
+
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in FORMATS:
+        return HttpResponseBadRequest(f"Unknown format. Choose one of: {', '.join(FORMATS)}")
+
+    plan = request.GET.get('plan') or None
+    if plan and plan not in SubscriptionPlan.values:
+        return HttpResponseBadRequest(f"Unknown plan. Choose one of: {', '.join(SubscriptionPlan.values)}")
+
+    try:
+        start = _parse_date_param(request.GET.get('start'))
+        end = _parse_date_param(request.GET.get('end'))
+    except ValueError:
+        return HttpResponseBadRequest("Dates must be in YYYY-MM-DD format.")
+
+    gzip = request.GET.get('gzip') in ('1', 'true', 'True')
+    filename = f"{dataset}.{export_format}" + ('.gz' if gzip else '')
+
+    response = StreamingHttpResponse(
+        stream_export(dataset, export_format, start, end, plan, gzip),
+        content_type='application/gzip' if gzip else FORMATS[export_format],
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@csrf_exempt
+@require_POST
+def stripe_webhook(request):
+    """Verify and store a Stripe event; it is applied later by `manage.py process_stripe_events`"""
+    import stripe
+
+    if not settings.STRIPE_WEBHOOK_SECRET:
+        logger.error('Rejected Stripe webhook: STRIPE_WEBHOOK_SECRET is not configured')
+        # Stripe retries non-2xx deliveries, so nothing is lost while this is fixed
+        return HttpResponse(status=503)
+
+    try:
+        event = parse_event(request.body, request.headers.get('Stripe-Signature'))
+    except stripe.SignatureVerificationError:
+        return HttpResponseBadRequest('Invalid signature')
+    except ValueError:
+        return HttpResponseBadRequest('Invalid payload')
+
+    created = store_event(event)
+    return JsonResponse({'received': True, 'duplicate': not created})
@@ -0,0 +1,39 @@
+/** Tailwind build config: purges against every Django template and Python-rendered markup. */
+module.exports = {
+  darkMode: 'class',
+  content: [
+    './templates/**/*.html',
+    './*/templates/**/*.html',
+    './*/forms.py',
+    './rewrite/static/rewrite/*.js',
+  ],
+  theme: {
+    extend: {
+      fontFamily: {
+        sans: ['Inter', 'ui-sans-serif', 'system-ui'],
+      },
+      animation: {
+        gradient: 'gradient 15s ease infinite',
+        float: 'float 6s ease-in-out infinite',
+        'pulse-slow': 'pulse 4s cubic-bezier(0.4, 0, 0.6, 1) infinite',
+      },
+      keyframes: {
+        gradient: {
+          '0%, 100%': {
+            'background-size': '200% 200%',
+            'background-position': 'left center',
+          },
+          '50%': {
+            'background-size': '200% 200%',
+            'background-position': 'right center',
+          },
+        },
+        float: {
+          '0%, 100%': { transform: 'translateY(0)' },
+          '50%': { transform: 'translateY(-20px)' },
+        },
+      },
+    },
+  },
+  plugins: [],
+};